@@ -4,27 +4,42 @@
 
 from __future__ import annotations
 
+import argparse
+import collections
 import csv
+import hashlib
 import importlib
 import importlib.metadata
 import json
+import math
 import multiprocessing
 import os
 import platform
+import queue
+import random
 import re
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import webbrowser
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from dataclasses import asdict, dataclass
-from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Iterable, Optional
 
 os.environ.setdefault("PYTHONNOUSERSITE", "1")
 
+# Subcommands of the headless command line (see run_cli). Any of them as the first argument
+# runs one CODOC step without the GUI: no QApplication, no display and no prompts.
+CLI_COMMANDS = ("ligands", "target", "dock", "rescore", "report", "merge")
+_HEADLESS = len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS
+
 
 def _bootstrap_codoc_venv() -> None:
     if os.environ.get("CODOC_VENV_ACTIVE") == "1":
@@ -34,7 +49,7 @@ def _bootstrap_codoc_venv() -> None:
     except Exception as exc:
         print(f"[CODOC] Failed to import bootstrap module: {exc}")
         sys.exit(1)
-    if not bootstrap_pyqt5(interactive=True, reexec=True, env_name="CODOC"):
+    if not bootstrap_pyqt5(interactive=not _HEADLESS, reexec=True, env_name="CODOC"):
         sys.exit(1)
 
 
@@ -45,14 +60,19 @@ try:
 except Exception:
     pd = None
 
-try:
-    import matplotlib.pyplot as plt
-    from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
-    from matplotlib.backends.backend_qt import NavigationToolbar2QT as NavigationToolbar
-except Exception:
-    plt = None
-    FigureCanvas = None
-    NavigationToolbar = None
+plt = None
+FigureCanvas = None
+NavigationToolbar = None
+if not _HEADLESS:
+    # Plots only exist in the GUI; the command line skips matplotlib, its slowest import.
+    try:
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.backends.backend_qt import NavigationToolbar2QT as NavigationToolbar
+    except Exception:
+        plt = None
+        FigureCanvas = None
+        NavigationToolbar = None
 
 try:
     import psutil
@@ -81,6 +101,11 @@ try:
 except Exception:
     dimorphite_dl = None
 
+try:
+    from vina import Vina
+except Exception:
+    Vina = None
+
 from PyQt5.QtCore import QThread, Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QGuiApplication, QIcon, QPixmap
 from PyQt5.QtWidgets import (
@@ -114,7 +139,14 @@ from PyQt5.QtWidgets import (
 
 from MODULES.module_requirements import RequirementsInstaller, detect_hardware, detect_opencl_devices, get_boost_version, get_vina_gpu_version, venv_paths
 from MODULES.module_target_prepare import TargetPrepareError, find_pdb2pqr, prepare_receptor_with_protonation, summarize_pka_table
+from MODULES.module_distributed import Coordinator
+from MODULES.module_ligand_dedup import duplicate_sets, file_signature, is_inchikey_index, read_inchikey_index, write_inchikey_index
+from MODULES.module_job_ledger import STATE_DONE, STATE_FAILED, STATE_SKIPPED, JobLedger, ledger_path, read_pairs_in_state
+from MODULES.module_rescore import first_pose, merge_scores, parse_scoring_functions, read_score_columns, write_rescored_csv
+from MODULES.module_result_cache import CACHE_SEED, RESULT_CACHE_DIRNAME, ResultCache, file_sha256, link_or_copy, result_key, run_seed
 from MODULES.module_report import generate_final_report as _generate_final_report_docx, load_job_settings
+from MODULES.module_run_control import RunCancelled, RunControl, signal_process_group
+from MODULES.module_sharding import merge_shards, parse_shard_spec, shard_of, shard_result_dir
 from MODULES.splash_screen import SplashScreen
 
 APP_NAME = "CODOC"
@@ -247,6 +279,11 @@ QPushButton:disabled { background: #1B2730; color: #4F6577; border-color: #34465
 """
 
 
+# Default adaptive search table: the first rule a ligand stays within sets its exhaustiveness /
+# Vina-GPU threads; ligands past every rule get the full settings.
+DEFAULT_ADAPTIVE_RULES = "torsdof<=2 heavy<=20: 4/2000; torsdof<=5 heavy<=35: 8/4000; torsdof<=8: 16/6000"
+
+
 @dataclass
 class DockingSettings:
     scoring_function: str = "vina"
@@ -257,11 +294,44 @@ class DockingSettings:
     selected_result: str = ""
     opencl_platform_id: int = -1
     opencl_device_id: int = -1
+    multi_gpu: bool = False
+    hybrid_cpu_torsions: int = 10
     split_results: bool = False
     cpu_threads: int = max(1, os.cpu_count() or 1)
     cpu_parallelism: int = min(10, max(1, os.cpu_count() or 1))
+    cpu_batch_size: int = 1
+    cpu_engine: str = "binary"
     exhaustiveness: int = max(1, os.cpu_count() or 1)
     gpu_threads: int = 8000
+    gpu_batch_size: int = 1000
+    gpu_device_batch_sizes: str = ""
+    funnel_mode: bool = False
+    funnel_prescreen_exhaustiveness: int = 2
+    funnel_prescreen_gpu_threads: int = 1000
+    funnel_top_percent: float = 10.0
+    pair_timeout: int = 600
+    pair_timeout_per_torsion: int = 120
+    max_retries: int = 1
+    result_cache: bool = True
+    seed: int = 0
+    collapse_duplicates: bool = True
+    adaptive_search: bool = False
+    adaptive_rules: str = DEFAULT_ADAPTIVE_RULES
+    convergence_mode: bool = False
+    convergence_exhaustiveness: int = 4
+    convergence_max_runs: int = 4
+    convergence_energy_tolerance: float = 0.3
+    convergence_rmsd: float = 2.0
+    cascade_mode: bool = False
+    cascade_energy_threshold: float = -7.0
+    cascade_top_n: int = 0
+    ensemble_mode: bool = False
+    ensemble_margin: float = 1.0
+    rescore_functions: str = "vina,vinardo"
+    distributed_port: int = 5765
+    distributed_token: str = ""
+    distributed_local_workers: int = 0
+    distributed_lease_timeout: int = 120
     poses: int = 9
     min_rmsd: float = 1.0
     energy_range: float = 3.0
@@ -336,12 +406,503 @@ def _parse_vina_pose_data(output_file: str) -> tuple[str, str, str]:
     return energy, rmsd_mean, smiles
 
 
+def _best_pose_coordinates(output_file: str) -> list[tuple[float, float, float]]:
+    """Heavy-atom coordinates of pose 1 (the best-scored MODEL) of a Vina PDBQT, in file order."""
+    coordinates: list[tuple[float, float, float]] = []
+    if not os.path.isfile(output_file):
+        return coordinates
+    with open(output_file, "r", encoding="utf-8", errors="ignore") as handle:
+        for line in handle:
+            if line.startswith("ENDMDL"):
+                break
+            if line.startswith(("ATOM", "HETATM")):
+                atom_type = line[77:79].strip() or (line.split()[-1] if line.split() else "")
+                if atom_type in {"H", "HD", "HS"}:
+                    continue
+                try:
+                    coordinates.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+                except ValueError:
+                    continue
+    return coordinates
+
+
+def _pose_rmsd(first: list[tuple[float, float, float]], second: list[tuple[float, float, float]]) -> Optional[float]:
+    """Plain RMSD between two poses of the same ligand, atom by atom; None when they do not match."""
+    if not first or len(first) != len(second):
+        return None
+    total = sum((a - b) ** 2 for atom_a, atom_b in zip(first, second) for a, b in zip(atom_a, atom_b))
+    return math.sqrt(total / len(first))
+
+
+_VINA_BINDING_ENERGY_RE = re.compile(r"Estimated Free Energy of Binding\s*:\s*(-?\d+(?:\.\d+)?)")
+
+
+def _write_best_pose(output_file: str, destination: str) -> bool:
+    """Write pose 1 of a Vina PDBQT, without its score remark, as a single-model ligand; False when there is none."""
+    if not os.path.isfile(output_file):
+        return False
+    with open(output_file, "r", encoding="utf-8", errors="ignore") as handle:
+        pose = first_pose(handle.read())
+    if not pose:
+        return False
+    with open(destination, "w", encoding="utf-8") as handle:
+        handle.write(pose)
+    return True
+
+
+def _complete_refined_pose(output_file: str, energy: str, smiles: str) -> None:
+    """Add the VINA RESULT and SMILES remarks to a local_only pose file that lacks them."""
+    with open(output_file, "r", encoding="utf-8", errors="ignore") as handle:
+        lines = handle.readlines()
+    missing = []
+    if not any("REMARK VINA RESULT:" in line for line in lines):
+        missing.append(f"REMARK VINA RESULT: {float(energy):9.3f}      0.000      0.000\n")
+    if smiles and not any(line.startswith("REMARK SMILES") for line in lines):
+        missing.append(f"REMARK SMILES {smiles}\n")
+    if not missing:
+        return
+    at = 1 if lines and lines[0].startswith("MODEL") else 0
+    with open(output_file, "w", encoding="utf-8") as handle:
+        handle.writelines(lines[:at] + missing + lines[at:])
+
+
+RECEPTOR_MAPS_DIRNAME = "MAPS"
+RECEPTOR_MAPS_PREFIX = "receptor"
+RECEPTOR_MAPS_MANIFEST = "maps.json"
+# Ligand atom types of an ad4 map set, enough for every ligand group docked against the target.
+AD4_LIGAND_ATOM_TYPES = ["A", "C", "NA", "OA", "N", "SA", "HD", "F", "Cl", "Br", "I", "P", "S"]
+
+
+def _receptor_atom_types(receptor_path: str) -> list[str]:
+    types: list[str] = []
+    with open(receptor_path, "r", encoding="utf-8", errors="ignore") as handle:
+        for line in handle:
+            if line.startswith(("ATOM", "HETATM")):
+                atom_type = line[77:79].strip() or (line.split()[-1] if line.split() else "")
+                if atom_type and atom_type not in types:
+                    types.append(atom_type)
+    return types
+
+
+def _ligand_profile(ligand_file: str) -> dict[str, int]:
+    """TORSDOF, heavy-atom count and macrocycle pseudo-atoms (G*/CG* types) of a ligand PDBQT."""
+    torsdof = 0
+    heavy_atoms = 0
+    macrocycle = 0
+    with open(ligand_file, "r", encoding="utf-8", errors="ignore") as handle:
+        for line in handle:
+            if line.startswith(("ATOM", "HETATM")):
+                atom_type = line[77:79].strip() or (line.split()[-1] if line.split() else "")
+                if re.fullmatch(r"C?G\d?", atom_type):
+                    macrocycle = 1
+                elif atom_type not in {"H", "HD", "HS"}:
+                    heavy_atoms += 1
+            elif line.startswith("TORSDOF"):
+                parts = line.split()
+                if len(parts) > 1 and parts[1].isdigit():
+                    torsdof = int(parts[1])
+    return {"torsdof": torsdof, "heavy_atoms": heavy_atoms, "macrocycle": macrocycle}
+
+
+def _ligand_cost(profile: dict[str, int]) -> int:
+    """Relative docking cost of a ligand: (TORSDOF + 1) x heavy atoms, doubled for macrocycles."""
+    cost = (profile["torsdof"] + 1) * max(1, profile["heavy_atoms"])
+    return cost * 2 if profile["macrocycle"] else cost
+
+
 RESULT_CSV_HEADER = ["LIGAND", "SMILES", "LIGAND DATABANK", "TARGET", "BINDING ENERGY (Kcal/mol)", "RMSD (mean)"]
+# Job subfolder (next to DOCKING) holding the stage-1 results of a screening funnel run.
+PRESCREEN_DIRNAME = "PRESCREEN"
+# Empty file marking TARGETS/<target> as the primary target of a selectivity cascade.
+PRIMARY_TARGET_MARKER = "PRIMARY"
+# Energy column of the result CSV rows of pairs a selectivity cascade did not dock.
+CASCADE_SKIPPED = "SKIPPED (cascade)"
+# Characters of a failed run's output kept in the job ledger's error column.
+FAILURE_LOG_LIMIT = 4000
+
+
+def _pump_lines(stream: Any, lines: list[str], on_line: Callable[[str], None]) -> None:
+    """Read a child's output line by line as it is written, keeping every line."""
+    for line in stream:
+        lines.append(line)
+        on_line(line.rstrip("\r\n"))
+
+
+# Return code of a _run_watched() process that a pause killed to free its device.
+RELEASED_ON_PAUSE = -1000
+
+
+def _run_watched(
+    command: list[str],
+    timeout: int,
+    cwd: Optional[str] = None,
+    control: Optional[RunControl] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+    release_on_pause: bool = False,
+) -> subprocess.CompletedProcess[str]:
+    """subprocess.run() that kills the child's process group after `timeout` seconds (0 = no limit).
+
+    With a `control` the process is paused, resumed and killed with the run (release_on_pause: a pause
+    kills it and the result carries RELEASED_ON_PAUSE); `on_line` gets each output line as it is written.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=cwd, start_new_session=True)
+    if control is not None:
+        control.attach(process, release_on_pause=release_on_pause)
+    lines: list[str] = []
+    reader: Optional[threading.Thread] = None
+    if on_line is not None:
+        reader = threading.Thread(target=_pump_lines, args=(process.stdout, lines, on_line), name="codoc-output-reader", daemon=True)
+        reader.start()
+
+    def collect(step: Optional[float] = None) -> str:
+        if reader is None:
+            # Retrying communicate() after TimeoutExpired keeps the output read so far.
+            return process.communicate(timeout=step)[0]
+        process.wait(timeout=step)
+        reader.join()
+        return "".join(lines)
+
+    elapsed = 0.0
+    try:
+        while True:
+            step = 1.0 if control is not None else None
+            if timeout:
+                step = min(step or timeout, max(0.1, timeout - elapsed))
+            started = time.monotonic()
+            try:
+                output = collect(step)
+                if control is not None and control.detach(process):
+                    return subprocess.CompletedProcess(command, RELEASED_ON_PAUSE, f"{output}\nStopped to free the device while the run is paused.")
+                return subprocess.CompletedProcess(command, process.returncode, output)
+            except subprocess.TimeoutExpired:
+                if control is None or not control.paused:
+                    elapsed += time.monotonic() - started
+                if timeout and elapsed >= timeout:
+                    break
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        output = collect()
+        return subprocess.CompletedProcess(command, -signal.SIGKILL, f"{output}\nKilled by the watchdog after {timeout} s.")
+    finally:
+        if control is not None:
+            control.detach(process)
+
+
+class _ResultWriter(threading.Thread):
+    """The only writer of a run's result CSV: appends the rows of submitted poses in batches and
+    marks their pairs done in the ledger (and, with a cache key, adds them to the result cache).
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        ledger: Optional[JobLedger],
+        batch_size: int = 256,
+        fsync_interval: float = 5.0,
+        cache: Optional[ResultCache] = None,
+    ) -> None:
+        super().__init__(name="codoc-result-writer", daemon=True)
+        self.csv_path = csv_path
+        self.ledger = ledger
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.fsync_interval = fsync_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._error: Optional[BaseException] = None
+
+    def submit(self, target_name: str, ligand_group: str, ligand_name: str, output_file: str, cache_key: str = "") -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Result writer stopped: {self._error}")
+        self._queue.put((target_name, ligand_group, ligand_name, output_file, cache_key))
+
+    def close(self) -> None:
+        """Flush everything still queued, stop the thread and re-raise any write error."""
+        self._queue.put(None)
+        self.join()
+        if self._error is not None:
+            raise RuntimeError(f"Failed to write docking results to {self.csv_path}: {self._error}")
+
+    def run(self) -> None:
+        rows: list[list[str]] = []
+        finished: list[tuple[tuple[str, str, str], str]] = []
+        last_sync = time.monotonic()
+        try:
+            with open(self.csv_path, "a", encoding="utf-8", newline="") as handle:
+                writer = csv.writer(handle)
+
+                def flush(sync: bool) -> None:
+                    nonlocal last_sync
+                    if rows:
+                        writer.writerows(rows)
+                        handle.flush()
+                        rows.clear()
+                    if sync:
+                        os.fsync(handle.fileno())
+                        last_sync = time.monotonic()
+                    if finished and self.ledger is not None:
+                        self.ledger.mark_done_many(finished)
+                    finished.clear()
+
+                while True:
+                    try:
+                        item = self._queue.get(timeout=self.fsync_interval)
+                    except queue.Empty:
+                        flush(sync=True)
+                        continue
+                    if item is None:
+                        break
+                    target_name, ligand_group, ligand_name, output_file, cache_key = item
+                    energy, rmsd_mean, smiles = _parse_vina_pose_data(output_file)
+                    rows.append([ligand_name, smiles, ligand_group, target_name, energy, rmsd_mean])
+                    finished.append(((target_name, ligand_group, ligand_name), energy))
+                    if cache_key and energy and self.cache is not None:
+                        try:
+                            self.cache.store(cache_key, output_file, energy, rmsd_mean)
+                        except OSError:
+                            pass  # the cache is an optimisation; the job's own result is written
+                    due = time.monotonic() - last_sync >= self.fsync_interval
+                    if len(rows) >= self.batch_size or due:
+                        flush(sync=due)
+                flush(sync=True)
+        except Exception as exc:
+            self._error = exc
+
+
+def _parse_device_batch_sizes(text: str) -> dict[tuple[int, int], int]:
+    """Parse "platform:device=size" pairs (e.g. "0:0=2000, 0:1=500") into {(platform_id, device_id): size}."""
+    sizes: dict[tuple[int, int], int] = {}
+    for entry in filter(None, (part.strip() for part in (text or "").split(","))):
+        try:
+            device_text, size_text = entry.split("=", 1)
+            platform_text, device_id_text = device_text.split(":", 1)
+            size = int(size_text)
+            sizes[(int(platform_text), int(device_id_text))] = size
+        except ValueError as exc:
+            raise ValueError(f"Invalid GPU batch size '{entry}': use platform:device=size, for example 0:1=500.") from exc
+        if size < 1:
+            raise ValueError(f"Invalid GPU batch size '{entry}': the size must be at least 1.")
+    return sizes
+
+
+# (label, max TORSDOF or None, max heavy atoms or None, exhaustiveness, GPU threads or None)
+AdaptiveRule = tuple[str, Optional[int], Optional[int], int, Optional[int]]
+
+
+def _parse_adaptive_rules(text: str) -> list[AdaptiveRule]:
+    """Parse "[torsdof<=N] [heavy<=N]: exhaustiveness[/gpu_threads]" rules separated by semicolons."""
+    rules: list[AdaptiveRule] = []
+    for entry in filter(None, (part.strip() for part in (text or "").split(";"))):
+        try:
+            condition_text, effort_text = entry.split(":", 1)
+            limits: dict[str, int] = {}
+            for condition in condition_text.split():
+                name, value = condition.split("<=", 1)
+                if name.strip().lower() not in {"torsdof", "heavy"}:
+                    raise ValueError(name)
+                limits[name.strip().lower()] = int(value)
+            exhaustiveness_text, _, threads_text = effort_text.strip().partition("/")
+            exhaustiveness = int(exhaustiveness_text)
+            gpu_threads = int(threads_text) if threads_text.strip() else None
+        except ValueError as exc:
+            raise ValueError(
+                f"Invalid adaptive search rule '{entry}': use [torsdof<=N] [heavy<=N]: exhaustiveness[/gpu_threads], "
+                "for example torsdof<=2 heavy<=20: 4/2000."
+            ) from exc
+        if exhaustiveness < 1 or (gpu_threads is not None and gpu_threads < 1):
+            raise ValueError(f"Invalid adaptive search rule '{entry}': exhaustiveness and GPU threads must be at least 1.")
+        label = " ".join(condition_text.split()) or "any"
+        rules.append((label, limits.get("torsdof"), limits.get("heavy"), exhaustiveness, gpu_threads))
+    return rules
+
+
+def _match_adaptive_rule(rules: list[AdaptiveRule], profile: dict[str, int]) -> Optional[AdaptiveRule]:
+    for rule in rules:
+        _label, max_torsdof, max_heavy, _exhaustiveness, _threads = rule
+        if (max_torsdof is None or profile["torsdof"] <= max_torsdof) and (max_heavy is None or profile["heavy_atoms"] <= max_heavy):
+            return rule
+    return None
+
+
+class _GpuWorkPool:
+    """Ligands waiting for Vina-GPU, kept per (target, ligand group) and sorted by size so each batch
+    holds similar ligands; HYBRID CPU workers steal from the light end of the group served last.
+    """
+
+    def __init__(self, gpu_jobs: list[dict[str, str]], cpu_jobs: Optional[list[dict[str, str]]] = None) -> None:
+        self._lock = threading.Lock()
+        grouped: dict[tuple[str, str, str], list[dict[str, str]]] = {}
+        for job in gpu_jobs:
+            grouped.setdefault((job["target_name"], job["ligand_group"], job["search_rule"]), []).append(job)
+        groups = [
+            sorted(group_jobs, key=lambda job: (job["torsdof"], job["heavy_atoms"]), reverse=True)
+            for group_jobs in grouped.values()
+        ]
+        groups.sort(key=lambda group_jobs: sum(job["cost"] for job in group_jobs), reverse=True)
+        self._groups = collections.deque(collections.deque(group_jobs) for group_jobs in groups)
+        self._cpu_jobs = collections.deque(cpu_jobs or [])
+
+    def take_gpu_batch(self, size: int) -> Optional[list[dict[str, str]]]:
+        size = max(1, size)
+        with self._lock:
+            while self._groups and not self._groups[0]:
+                self._groups.popleft()
+            if not self._groups:
+                return None
+            group = self._groups[0]
+            count = len(group) if len(group) < size + max(1, size // 4) else size
+            return [group.popleft() for _ in range(count)]
+
+    def take_cpu_job(self) -> Optional[dict[str, str]]:
+        with self._lock:
+            if self._cpu_jobs:
+                return self._cpu_jobs.popleft()
+            while self._groups:
+                if self._groups[-1]:
+                    return self._groups[-1].pop()
+                self._groups.pop()
+            return None
+
+
+
+# Vina-GPU 2.1 prints one "Refining ligand <name> results...done." line per finished ligand of a batch.
+_VINA_GPU_LIGAND_DONE_RE = re.compile(r"^\s*Refining ligand\s+(\S+?)\s+results\b.*\bdone\b")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+class _ThroughputMeter:
+    """Ligands docked, rate and ETA of a docking run, the rate measured over the last `window` seconds."""
+
+    def __init__(self, total: int, window: float = 120.0) -> None:
+        self.total = total
+        self.window = window
+        self.started = time.monotonic()
+        self._samples: collections.deque = collections.deque([(self.started, 0)])
+        self._last_report = 0.0
+
+    def update(self, done: int, interval: float = 1.0, force: bool = False) -> Optional[dict[str, Any]]:
+        """Progress after `done` ligands (ligands/min, seconds), or None within `interval` s of the last report."""
+        now = time.monotonic()
+        if not force and now - self._last_report < interval:
+            return None
+        self._last_report = now
+        self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        first_time, first_done = self._samples[0]
+        rate = (done - first_done) / (now - first_time) if now > first_time else 0.0
+        remaining = max(0, self.total - done)
+        return {
+            "done": done,
+            "total": self.total,
+            "percent": done * 100.0 / max(self.total, 1),
+            "rate": rate * 60.0,
+            "elapsed": now - self.started,
+            "eta": remaining / rate if rate > 0 else (0.0 if not remaining else None),
+        }
+
+# --------------------------------------------------------------------------------------
+# Standalone (module-level) helpers used by the in-process Vina engine worker pool.
+#
+# Each worker builds one `vina.Vina` in the pool initializer, with the receptor and maps
+# loaded once, and docks every ligand PDBQT string it is handed against it.
+# --------------------------------------------------------------------------------------
+
+_VINA_WORKER_ENGINE: Any = None
+_VINA_WORKER_OPTIONS: dict[str, Any] = {}
+
+
+def _vina_worker_init(options: dict[str, Any]) -> None:
+    global _VINA_WORKER_ENGINE, _VINA_WORKER_OPTIONS
+    engine = Vina(sf_name=options["scoring"], cpu=int(options["cpu"]), seed=int(options["seed"]), verbosity=0)
+    rigid = options["receptor"] if options["scoring"] != "ad4" and not options["maps"] else None
+    flex = options["flex_receptor"] or None
+    if rigid or flex:
+        engine.set_receptor(rigid_pdbqt_filename=rigid, flex_pdbqt_filename=flex)
+    if options["maps"]:
+        engine.load_maps(options["maps"])
+    else:
+        engine.compute_vina_maps(center=options["center"], box_size=options["size"], spacing=float(options["spacing"]))
+    _VINA_WORKER_ENGINE = engine
+    _VINA_WORKER_OPTIONS = options
+
+
+def _vina_dock_worker(payload: tuple[str, str, str, int]) -> tuple[str, str, Optional[str]]:
+    """Dock one ligand PDBQT string against the worker's receptor; returns (output_file, best energy, error)."""
+    output_file, ligand_name, ligand_pdbqt, exhaustiveness = payload
+    engine = _VINA_WORKER_ENGINE
+    options = _VINA_WORKER_OPTIONS
+    try:
+        engine.set_ligand_from_string(ligand_pdbqt)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        if options["docking_mode"] == "score_only":
+            energy = float(engine.score()[0])
+            with open(output_file, "w", encoding="utf-8") as handle:
+                handle.write(f"MODEL 1\nREMARK VINA RESULT: {energy:9.3f}      0.000      0.000\n{ligand_pdbqt.rstrip()}\nENDMDL\n")
+        elif options["docking_mode"] == "local_only":
+            energy = float(engine.optimize()[0])
+            engine.write_pose(output_file, remarks=f"REMARK VINA RESULT: {energy:9.3f}      0.000      0.000", overwrite=True)
+        else:
+            engine.dock(exhaustiveness=int(exhaustiveness), n_poses=max(20, int(options["poses"])), min_rmsd=float(options["min_rmsd"]))
+            energies = engine.energies(n_poses=int(options["poses"]), energy_range=float(options["energy_range"]))
+            energy = float(energies[0][0]) if len(energies) else 0.0
+            engine.write_poses(output_file, n_poses=int(options["poses"]), energy_range=float(options["energy_range"]), overwrite=True)
+    except Exception as exc:
+        return output_file, "", f"Vina engine failed for {ligand_name}: {exc}"
+    return output_file, f"{energy:.3f}", None
+
+
+# Rescoring workers keep one engine per scoring function, all loaded with the same target.
+_RESCORE_WORKER_ENGINES: dict[str, Any] = {}
+
+
+def _rescore_worker_init(options: dict[str, Any]) -> None:
+    global _RESCORE_WORKER_ENGINES
+    engines: dict[str, Any] = {}
+    for scoring in options["functions"]:
+        engine = Vina(sf_name=scoring, cpu=1, verbosity=0)
+        if scoring == "ad4":
+            engine.load_maps(options["maps"]["ad4"])
+        else:
+            engine.set_receptor(rigid_pdbqt_filename=options["receptor"])
+            engine.compute_vina_maps(center=options["center"], box_size=options["size"], spacing=float(options["spacing"]))
+        engines[scoring] = engine
+    _RESCORE_WORKER_ENGINES = engines
+
+
+def _rescore_worker(chunk: list[tuple[tuple[str, str, str], str]]) -> list[tuple[tuple[str, str, str], dict[str, str]]]:
+    """score_only of pose 1 of each (pair key, pose file) with every engine; unreadable poses get empty scores."""
+    results: list[tuple[tuple[str, str, str], dict[str, str]]] = []
+    for key, pose_file in chunk:
+        scores: dict[str, str] = {}
+        try:
+            with open(pose_file, "r", encoding="utf-8", errors="ignore") as handle:
+                pose = first_pose(handle.read())
+        except OSError:
+            pose = ""
+        for scoring, engine in _RESCORE_WORKER_ENGINES.items():
+            if not pose:
+                scores[scoring] = ""
+                continue
+            try:
+                engine.set_ligand_from_string(pose)
+                scores[scoring] = f"{float(engine.score()[0]):.3f}"
+            except Exception:
+                scores[scoring] = ""
+        results.append((key, scores))
+    return results
 
 
 class DockingWorker(QThread):
     progress_value = pyqtSignal(int)
     progress_text = pyqtSignal(str)
+    progress_stats = pyqtSignal(object)
     finished_ok = pyqtSignal(str)
     failed = pyqtSignal(str)
 
@@ -356,6 +917,8 @@ class DockingWorker(QThread):
         docking_type: str,
         processing_type: str,
         run_type: str,
+        shard_index: int = 0,
+        shard_count: int = 1,
     ) -> None:
         super().__init__()
         self.app_dir = app_dir
@@ -363,88 +926,722 @@ class DockingWorker(QThread):
         self.targets_dir = targets_dir
         self.results_dir = results_dir
         self.job_name = job_name
-        self.settings = settings
+        # Cached poses are only reusable when the seed is fixed, so seed 0 (random) docks with
+        # CACHE_SEED while the result cache is on.
+        self.seed_fixed_for_cache = bool(settings.result_cache) and int(settings.seed) == 0
+        self.settings = replace(settings, seed=run_seed(settings.seed, settings.result_cache))
         self.docking_type = docking_type
         self.processing_type = processing_type
         self.run_type = run_type
+        self.shard_index = shard_index
+        self.shard_count = max(1, shard_count)
         self.vina = os.path.join(app_dir, "bin", "vina_1.2.5_linux_x86_64")
         self.vina_split = os.path.join(app_dir, "bin", "vina_split_1.2.5_linux_x86_64")
         self.vina_gpu = os.path.join(str(Path.home()), "Vina-GPU-2.1", "AutoDock-Vina-GPU-2.1", "AutoDock-Vina-GPU-2-1")
+        self.ledger: Optional[JobLedger] = None
+        self.result_writer: Optional[_ResultWriter] = None
+        self.failed_pairs = 0
+        self.result_cache = ResultCache(os.path.join(app_dir, RESULT_CACHE_DIRNAME))
+        self.engine_versions: dict[str, str] = {}
+        # Cache key of every pending pair, handed to the result writer when the pair finishes.
+        self.cache_keys: dict[tuple[str, str, str], str] = {}
+        self.cached_pairs = 0
+        # Pairs of the same structure (InChIKey) and target as a docked pair, keyed by that pair.
+        self.duplicates: dict[tuple[str, str, str], list[dict[str, str]]] = {}
+        # Flexibility profile per ligand file, read on its first pending pair (see _pending_ligand_profile).
+        self.ligand_profiles: dict[str, dict[str, int]] = {}
+        self.control = RunControl()
+        # Minimum seconds between two progress_stats reports; the GUI changes it while running.
+        self.stats_interval = 1.0
+        self.convergence_log = ""
+        self.convergence_lock = threading.Lock()
+        self.convergence_counts: collections.Counter = collections.Counter()
+        # Ensemble mode, second stage: {conformation target: its reference target}.
+        self.ensemble_references: dict[str, str] = {}
 
     def run(self) -> None:
         try:
             self._validate_environment()
-            result_folder = self._prepare_result_folder()
-            pending_jobs = self._build_pending_jobs(result_folder)
-            if not pending_jobs:
-                self.finished_ok.emit(f"No pending docking jobs were found in {os.path.basename(result_folder)}.")
-                return
-
-            if self.processing_type == "GPU":
-                self._run_gpu_jobs(result_folder, pending_jobs)
+            self.failed_pairs = 0
+            if self.settings.funnel_mode:
+                result_folder = self._run_funnel()
+            elif self.settings.cascade_mode:
+                result_folder = self._run_cascade()
+            elif self.settings.ensemble_mode:
+                result_folder = self._run_ensemble()
             else:
-                self._run_cpu_jobs(result_folder, pending_jobs)
-            self.finished_ok.emit(f"Docking finished for job {self.job_name}. Results available in {result_folder}.")
+                result_folder = self._prepare_result_folder(self._shard_result_folder())
+                if not self._dock_stage(result_folder):
+                    self.finished_ok.emit(f"No pending docking jobs were found in {os.path.basename(result_folder)}.")
+                    return
+            if self.control.cancelled:
+                self.finished_ok.emit(
+                    f"Docking of job {self.job_name} was cancelled. Finished pairs are kept in {result_folder}; "
+                    "a RESTART run docks the rest."
+                )
+                return
+            message = f"Docking finished for job {self.job_name}. Results available in {result_folder}."
+            if self.failed_pairs:
+                message += (
+                    f" {self.failed_pairs} pair(s) failed after {int(self.settings.max_retries) + 1} attempt(s); their output is "
+                    f"kept in {os.path.basename(ledger_path(result_folder))} and a RESTART run docks them again."
+                )
+            self.finished_ok.emit(message)
         except Exception as exc:
             self.failed.emit(str(exc))
 
+    def _emit_progress_stats(self, meter: _ThroughputMeter, done: int) -> None:
+        stats = meter.update(done, self.stats_interval, force=done >= meter.total)
+        if stats is not None:
+            self.progress_stats.emit(stats)
+
+    def _shard_result_folder(self) -> str:
+        """The job's DOCKING folder, or for a shard run the shard's own folder under SHARDS."""
+        if self.shard_count > 1:
+            return shard_result_dir(os.path.dirname(self.results_dir), self.shard_index, self.shard_count)
+        return self.results_dir
+
+    def _dock_stage(
+        self, result_folder: str, selected: Optional[set[tuple[str, str, str]]] = None, only_targets: Optional[set[str]] = None
+    ) -> int:
+        """Dock the pending pairs (all, the `selected` ones or those of `only_targets`); returns how many."""
+        with JobLedger(ledger_path(result_folder)) as ledger:
+            self.ledger = ledger
+            try:
+                csv_path = self._run_csv_path(result_folder)
+                self._ensure_result_csv(csv_path)
+                # Started before the pending jobs are built: cache hits are written right away.
+                self.result_writer = _ResultWriter(csv_path, ledger, cache=self.result_cache if self.settings.result_cache else None)
+                self.result_writer.start()
+                try:
+                    pending_jobs = self._build_pending_jobs(result_folder, selected, only_targets)
+                    if pending_jobs:
+                        self._run_jobs(result_folder, pending_jobs)
+                finally:
+                    # Always drain the writer, so pairs finished before a failure or a cancel are recorded.
+                    self.result_writer.close()
+                    if self.control.cancelled:
+                        # Pairs that were stopped or never started go back to pending for RESTART.
+                        ledger.reset_running()
+                return len(pending_jobs) + self.cached_pairs
+            finally:
+                self.ledger = None
+                self.result_writer = None
+                self.cache_keys = {}
+                self.duplicates = {}
+
+    def _run_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        self.convergence_counts = collections.Counter()
+        self.convergence_log = os.path.join(result_folder, f"{self.job_name}_convergence.csv") if self._convergence_enabled() else ""
+        try:
+            if self.ensemble_references:
+                self._run_warm_start_jobs(result_folder, jobs)
+            else:
+                self._dispatch_jobs(result_folder, jobs)
+        finally:
+            if self.convergence_counts:
+                self.progress_text.emit(
+                    f"Convergence mode: {self.convergence_counts['converged']} ligand(s) stopped after agreeing short searches, "
+                    f"{self.convergence_counts['full']} needed the full search (see {os.path.basename(self.convergence_log)})."
+                )
+            self.convergence_log = ""
+
+    def _dispatch_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        if self.processing_type == "GPU":
+            self._run_gpu_jobs(result_folder, jobs)
+        elif self.processing_type == "HYBRID":
+            self._run_hybrid_jobs(result_folder, jobs)
+        elif self.processing_type == "DISTRIBUTED":
+            self._run_distributed_jobs(result_folder, jobs)
+        else:
+            self._run_cpu_jobs(result_folder, jobs)
+
+    def _run_funnel(self) -> str:
+        """Two-stage screen: a cheap search into PRESCREEN, then the best funnel_top_percent redocked into DOCKING."""
+        full_settings = self.settings
+        prescreen_folder = self._prepare_result_folder(os.path.join(os.path.dirname(self.results_dir), PRESCREEN_DIRNAME))
+        self.settings = replace(
+            full_settings,
+            exhaustiveness=full_settings.funnel_prescreen_exhaustiveness,
+            gpu_threads=full_settings.funnel_prescreen_gpu_threads,
+            adaptive_search=False,
+            convergence_mode=False,
+        )
+        self.progress_text.emit(
+            f"Funnel stage 1/2: prescreening the library (exhaustiveness {self.settings.exhaustiveness}, "
+            f"GPU threads {self.settings.gpu_threads})."
+        )
+        try:
+            self._dock_stage(prescreen_folder)
+        finally:
+            self.settings = full_settings
+        if self.control.cancelled:
+            return prescreen_folder
+
+        hits = self._select_funnel_hits(prescreen_folder)
+        result_folder = self._prepare_result_folder(self.results_dir)
+        self.progress_text.emit(
+            f"Funnel stage 2/2: redocking {len(hits)} pairs (top {self.settings.funnel_top_percent:g}% per target) "
+            f"with exhaustiveness {self.settings.exhaustiveness}."
+        )
+        if hits:
+            self._dock_stage(result_folder, hits)
+        return result_folder
+
+    def _select_funnel_hits(self, prescreen_folder: str) -> set[tuple[str, str, str]]:
+        """Best-scoring funnel_top_percent of the prescreened pairs of each target (at least one)."""
+        with JobLedger(ledger_path(prescreen_folder)) as ledger:
+            finished = ledger.done_energies()
+        by_target: dict[str, list[tuple[float, tuple[str, str, str]]]] = collections.defaultdict(list)
+        for key, energy in finished:
+            if energy is None:
+                # Pairs seeded from a folder scan on RESTART carry no energy in the ledger.
+                target_name, ligand_group, ligand_name = key
+                parsed = _parse_vina_pose_data(os.path.join(prescreen_folder, target_name, ligand_group, ligand_name, f"{ligand_name}.pdbqt"))[0]
+                try:
+                    energy = float(parsed)
+                except ValueError:
+                    continue
+            by_target[key[0]].append((energy, key))
+        fraction = self.settings.funnel_top_percent / 100.0
+        hits: set[tuple[str, str, str]] = set()
+        for scored in by_target.values():
+            scored.sort()
+            keep = max(1, math.ceil(len(scored) * fraction))
+            hits.update(key for _, key in scored[:keep])
+        return hits
+
+    def _run_ensemble(self) -> str:
+        """Full search against each ensemble's reference conformation, then local_only warm starts on the others."""
+        ensembles = target_ensembles(path.name for path in sorted(Path(self.targets_dir).glob("*/")) if path.is_dir())
+        members = {member: reference for reference, others in ensembles.items() for member in others}
+        result_folder = self._prepare_result_folder(self.results_dir)
+        all_targets = {path.name for path in Path(self.targets_dir).glob("*/") if path.is_dir()}
+        self.progress_text.emit(
+            f"Ensemble stage 1/2: full search against {len(all_targets) - len(members)} target(s) "
+            f"({', '.join(sorted(ensembles)) or 'no ensemble found'} as reference conformation(s))."
+        )
+        self._dock_stage(result_folder, only_targets=all_targets - set(members))
+        if self.control.cancelled or not members:
+            return result_folder
+        self.progress_text.emit(
+            f"Ensemble stage 2/2: refining the reference poses on {len(members)} other conformation(s) with local_only; "
+            f"pairs ending more than {self.settings.ensemble_margin:g} kcal/mol above their reference get a full search."
+        )
+        self.ensemble_references = members
+        try:
+            self._dock_stage(result_folder, only_targets=set(members))
+        finally:
+            self.ensemble_references = {}
+        return result_folder
+
+    def _run_warm_start_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        """Refine reference poses with local_only; pairs without one or ending above ensemble_margin get a full search."""
+        csv_path = self._run_csv_path(result_folder)
+        self._ensure_result_csv(csv_path)
+        warm_jobs = [job for job in jobs if os.path.isfile(job["reference_output"])]
+        full_jobs = [job for job in jobs if not os.path.isfile(job["reference_output"])]
+        self._attach_receptor_maps(warm_jobs)
+        parallelism = max(1, min(int(self.settings.cpu_parallelism), len(warm_jobs) or 1))
+        cpu_per_process = self._cpu_threads_per_process()
+        log_path = os.path.join(result_folder, f"{self.job_name}_ensemble.csv")
+        write_header = not os.path.isfile(log_path)
+        kept = 0
+        with open(log_path, "a", encoding="utf-8", newline="") as log_handle, ThreadPoolExecutor(max_workers=parallelism) as executor:
+            log = csv.writer(log_handle)
+            if write_header:
+                log.writerow(["LIGAND", "LIGAND DATABANK", "TARGET", "REFERENCE", "REFERENCE ENERGY", "REFINED ENERGY", "OUTCOME"])
+            pending = iter(warm_jobs)
+            in_flight: dict[Future, dict[str, str]] = {}
+            completed = 0
+            while True:
+                while len(in_flight) < parallelism and self.control.checkpoint():
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    self.ledger.mark_running([self._pair_key(job)])
+                    in_flight[executor.submit(self._refine_reference_pose, job, cpu_per_process)] = job
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    reference_energy, refined_energy = future.result()
+                    completed += 1
+                    self.progress_value.emit(int(completed * 100 / max(len(warm_jobs), 1)))
+                    accepted = (
+                        reference_energy is not None
+                        and refined_energy is not None
+                        and refined_energy - reference_energy <= float(self.settings.ensemble_margin)
+                    )
+                    log.writerow(
+                        [
+                            job["ligand_name"],
+                            job["ligand_group"],
+                            job["target_name"],
+                            self.ensemble_references[job["target_name"]],
+                            "" if reference_energy is None else f"{reference_energy:.3f}",
+                            "" if refined_energy is None else f"{refined_energy:.3f}",
+                            "refined" if accepted else "full search",
+                        ]
+                    )
+                    if not accepted:
+                        try:
+                            os.unlink(job["output_file"])
+                        except FileNotFoundError:
+                            pass
+                        full_jobs.append(job)
+                        continue
+                    kept += 1
+                    self._split_cpu_output(job)
+                    self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+        self.progress_text.emit(
+            f"Ensemble warm start: {kept} pair(s) kept their refined reference pose, {len(full_jobs)} need a full search "
+            f"(see {os.path.basename(log_path)})."
+        )
+        if full_jobs and not self.control.cancelled:
+            full_jobs.sort(key=lambda job: job["cost"], reverse=True)
+            self._dispatch_jobs(result_folder, full_jobs)
+
+    def _refine_reference_pose(self, job: dict[str, str], cpu: int) -> tuple[Optional[float], Optional[float]]:
+        """(reference energy, refined energy) of a pair, None where it could not be read."""
+        reference_energy_text, _rmsd, smiles = _parse_vina_pose_data(job["reference_output"])
+        try:
+            reference_energy: Optional[float] = float(reference_energy_text)
+        except ValueError:
+            reference_energy = None
+        os.makedirs(job["output_dir"], exist_ok=True)
+        start_pose = os.path.join(job["output_dir"], "reference_pose.pdbqt")
+        if not _write_best_pose(job["reference_output"], start_pose):
+            return reference_energy, None
+        try:
+            config_path = os.path.join(job["output_dir"], "config.txt")
+            self._write_cpu_config(config_path, job, cpu, ligand_file=start_pose, docking_mode="local_only")
+            result = _run_watched([self.vina, "--config", config_path], self._pair_timeout(job), control=self.control)
+        finally:
+            os.remove(start_pose)
+        if result.returncode != 0 or not os.path.isfile(job["output_file"]):
+            return reference_energy, None
+        energy_text = _parse_vina_pose_data(job["output_file"])[0]
+        if not energy_text:
+            match = _VINA_BINDING_ENERGY_RE.search(result.stdout or "")
+            if match is None:
+                return reference_energy, None
+            energy_text = match.group(1)
+        _complete_refined_pose(job["output_file"], energy_text, smiles)
+        return reference_energy, float(energy_text)
+
+    def _run_cascade(self) -> str:
+        """Selectivity cascade: dock the primary target, then only its hits against the other targets."""
+        primary = self._primary_target()
+        secondary = [path.name for path in sorted(Path(self.targets_dir).glob("*/")) if path.is_dir() and path.name != primary]
+        result_folder = self._prepare_result_folder(self.results_dir)
+        self.progress_text.emit(f"Cascade stage 1/2: docking the library against the primary target {primary}.")
+        self._dock_stage(result_folder, only_targets={primary})
+        if self.control.cancelled or not secondary:
+            return result_folder
+
+        passing, screened = self._select_cascade_hits(result_folder, primary)
+        selected = {(target_name, *ligand) for target_name in secondary for ligand in passing}
+        done = read_pairs_in_state(result_folder, STATE_DONE)
+        skipped = {(target_name, *ligand) for target_name in secondary for ligand in screened - passing} - done
+        self.progress_text.emit(
+            f"Cascade stage 2/2: docking {len(passing)} of {len(screened)} ligand(s) that passed on {primary} "
+            f"against {len(secondary)} other target(s); {len(skipped)} pair(s) skipped."
+        )
+        if selected:
+            self._dock_stage(result_folder, selected)
+        if not self.control.cancelled:
+            self._record_cascade_skips(result_folder, primary, skipped)
+        return result_folder
+
+    def _primary_target(self) -> str:
+        primaries = primary_targets(self.targets_dir)
+        if len(primaries) != 1:
+            raise RuntimeError(
+                "The selectivity cascade needs exactly one primary target (marked in Step 3 or with 'codoc target --primary'); "
+                f"found {len(primaries)} in {self.targets_dir}."
+            )
+        return primaries[0]
+
+    def _select_cascade_hits(self, result_folder: str, primary: str) -> tuple[set[tuple[str, str]], set[tuple[str, str]]]:
+        """(ligands passing on the primary target, every ligand screened there) as (databank, ligand)."""
+        with JobLedger(ledger_path(result_folder)) as ledger:
+            finished = ledger.done_energies()
+            failed = ledger.pairs_in_state(STATE_FAILED)
+        scored: list[tuple[float, tuple[str, str]]] = []
+        for key, energy in finished:
+            if key[0] != primary:
+                continue
+            if energy is None:
+                parsed = _parse_vina_pose_data(os.path.join(result_folder, *key, f"{key[2]}.pdbqt"))[0]
+                try:
+                    energy = float(parsed)
+                except ValueError:
+                    continue
+            scored.append((energy, (key[1], key[2])))
+        scored.sort()
+        threshold = float(self.settings.cascade_energy_threshold)
+        top_n = max(0, int(self.settings.cascade_top_n))
+        passing = {ligand for rank, (energy, ligand) in enumerate(scored) if energy <= threshold or rank < top_n}
+        screened = {ligand for _, ligand in scored} | {(key[1], key[2]) for key in failed if key[0] == primary}
+        return passing, screened
+
+    def _record_cascade_skips(self, result_folder: str, primary: str, skipped: set[tuple[str, str, str]]) -> None:
+        """Mark the pairs the cascade left out as skipped and list them in the run CSV."""
+        reason = (
+            f"Skipped by the selectivity cascade: energy on {primary} above {self.settings.cascade_energy_threshold:g} kcal/mol"
+            + (f" and outside its top {self.settings.cascade_top_n}." if int(self.settings.cascade_top_n) else ".")
+        )
+        with JobLedger(ledger_path(result_folder)) as ledger:
+            ledger.mark_skipped_many(sorted(skipped), reason)
+        csv_path = self._run_csv_path(result_folder)
+        with open(csv_path, "r", encoding="utf-8", newline="") as handle:
+            rows = [row for row in csv.reader(handle) if len(row) < 5 or row[4] != CASCADE_SKIPPED]
+        smiles: dict[tuple[str, str], str] = {}
+        for target_name, ligand_group, ligand_name in sorted(skipped):
+            if (ligand_group, ligand_name) not in smiles:
+                primary_pose = os.path.join(result_folder, primary, ligand_group, ligand_name, f"{ligand_name}.pdbqt")
+                smiles[(ligand_group, ligand_name)] = _parse_vina_pose_data(primary_pose)[2]
+            rows.append([ligand_name, smiles[(ligand_group, ligand_name)], ligand_group, target_name, CASCADE_SKIPPED, ""])
+        scratch = f"{csv_path}.tmp"
+        with open(scratch, "w", encoding="utf-8", newline="") as handle:
+            csv.writer(handle).writerows(rows)
+        os.replace(scratch, csv_path)
+
     def _validate_environment(self) -> None:
         if not os.path.isdir(self.ligands_dir):
             raise RuntimeError(f"Ligands directory not found: {self.ligands_dir}")
         if not os.path.isdir(self.targets_dir):
             raise RuntimeError(f"Targets directory not found: {self.targets_dir}")
-        if self.processing_type == "GPU" and self.settings.docking_mode != "normal":
+        if self.shard_count > 1 and (self.settings.funnel_mode or self.processing_type == "DISTRIBUTED"):
+            raise RuntimeError("Sharded runs cannot use the screening funnel or DISTRIBUTED processing, which need the whole job in one place.")
+        if self.settings.funnel_mode and self.settings.docking_mode != "normal":
+            raise RuntimeError("The screening funnel needs the normal Vina mode: score_only and local_only do not search.")
+        if self.settings.cascade_mode:
+            if self.settings.funnel_mode:
+                raise RuntimeError("The selectivity cascade and the screening funnel cannot be combined in one run.")
+            if self.shard_count > 1:
+                raise RuntimeError("Sharded runs cannot use the selectivity cascade, which ranks the whole primary-target screen.")
+            self._primary_target()
+        if self.settings.ensemble_mode:
+            if self.settings.funnel_mode or self.settings.cascade_mode:
+                raise RuntimeError("Ensemble mode cannot be combined with the screening funnel or the selectivity cascade.")
+            if self.shard_count > 1:
+                raise RuntimeError("Sharded runs cannot use ensemble mode, which needs each ligand's reference pose in the same folder.")
+            if self.settings.docking_mode != "normal":
+                raise RuntimeError("Ensemble mode needs the normal Vina mode: it runs its own local_only refinements.")
+            if not os.path.isfile(self.vina):
+                raise RuntimeError(f"Ensemble mode refines poses with AutoDock Vina, which was not found: {self.vina}")
+        if self.settings.adaptive_search:
+            try:
+                _parse_adaptive_rules(self.settings.adaptive_rules)
+            except ValueError as exc:
+                raise RuntimeError(str(exc)) from exc
+        if self.processing_type in {"GPU", "HYBRID"} and self.settings.docking_mode != "normal":
             raise RuntimeError("score_only and local_only are available only for CPU runs with AutoDock Vina.")
-        if self.processing_type == "GPU":
+        if self.settings.convergence_mode:
+            if self.settings.docking_mode != "normal":
+                raise RuntimeError("Convergence mode needs the normal Vina mode: score_only and local_only do not search.")
+            if self.processing_type not in {"CPU", "HYBRID"} or (self.processing_type == "CPU" and self.settings.cpu_engine == "python"):
+                raise RuntimeError("Convergence mode runs on the AutoDock Vina binary: use CPU processing with the binary engine, or HYBRID.")
+        if self.processing_type in {"GPU", "HYBRID"}:
             if not os.path.isfile(self.vina_gpu):
                 raise RuntimeError(
                     "Vina-GPU executable not found at "
                     f"{self.vina_gpu}. Install the GPU backend first."
                 )
+            if self.processing_type == "HYBRID" and not os.path.isfile(self.vina):
+                raise RuntimeError(f"AutoDock Vina not found: {self.vina}")
+            try:
+                _parse_device_batch_sizes(self.settings.gpu_device_batch_sizes)
+            except ValueError as exc:
+                raise RuntimeError(str(exc)) from exc
+        elif self.processing_type == "DISTRIBUTED":
+            # Remote workers bring their own Vina; the local binary is only needed for local workers.
+            if int(self.settings.distributed_local_workers) > 0 and not os.path.isfile(self.vina):
+                raise RuntimeError(f"AutoDock Vina not found: {self.vina}")
+            if not self.settings.distributed_token and int(self.settings.distributed_local_workers) <= 0:
+                raise RuntimeError(
+                    "DISTRIBUTED processing without a worker token only accepts workers on this machine. "
+                    "Set a worker token for remote workers, or start at least one local worker."
+                )
+        elif self.settings.cpu_engine == "python":
+            if Vina is None:
+                raise RuntimeError("The vina Python module is not available in the current environment. Install vina to use the Python engine.")
         elif not os.path.isfile(self.vina):
             raise RuntimeError(f"AutoDock Vina not found: {self.vina}")
 
-    def _prepare_result_folder(self) -> str:
+    def _prepare_result_folder(self, result_folder: str) -> str:
         # `self.results_dir` is already the resolved DOCKING folder for the active job (chosen by
         # MainWindow._save_settings when "Save settings" was clicked): a fresh, empty folder for
         # run_type == "NEW", or an existing job's folder to resume into for run_type == "RESTART".
-        # No further per-run subfolder is created here anymore.
-        os.makedirs(self.results_dir, exist_ok=True)
+        # No further per-run subfolder is created here anymore; funnel runs add a PRESCREEN
+        # sibling with the same layout.
+        os.makedirs(result_folder, exist_ok=True)
         for target_dir in sorted(Path(self.targets_dir).glob("*/")):
-            os.makedirs(os.path.join(self.results_dir, target_dir.name), exist_ok=True)
-        return self.results_dir
-
-    def _build_pending_jobs(self, result_folder: str) -> list[dict[str, str]]:
+            os.makedirs(os.path.join(result_folder, target_dir.name), exist_ok=True)
+        return result_folder
+
+    def _build_pending_jobs(
+        self, result_folder: str, selected: Optional[set[tuple[str, str, str]]] = None, only_targets: Optional[set[str]] = None
+    ) -> list[dict[str, str]]:
+        # Result folders are created by the runners, only for the pairs actually docked.
+        done: set[tuple[str, str, str]] = set()
+        if self.run_type == "RESTART":
+            self.ledger.reset_running()
+            if self.ledger.is_empty():
+                done = self._scan_finished_outputs(result_folder)
+                self.ledger.mark_done_many((key, None) for key in done)
+            else:
+                done = self.ledger.pairs_in_state(STATE_DONE)
+        if self.shard_count > 1:
+            done |= read_pairs_in_state(self.results_dir, STATE_DONE)
+        csv_path = self._run_csv_path(result_folder)
+        use_cache = bool(self.settings.result_cache)
+        if self.seed_fixed_for_cache:
+            self.progress_text.emit(f"Seed 0 (random) with the result cache on: docking with the fixed seed {CACHE_SEED} so results can be reused.")
+        ligand_hashes: dict[str, str] = {}
+        self.cached_pairs = 0
         jobs: list[dict[str, str]] = []
+        # Ligand files are only read for the pairs left to dock; see _pending_ligand_profile.
+        ligand_groups = [(lig_group.name, sorted(lig_group.glob("*.pdbqt"))) for lig_group in sorted(Path(self.ligands_dir).glob("*/"))]
+        rules = _parse_adaptive_rules(self.settings.adaptive_rules) if self.settings.adaptive_search else []
+        profiled: dict[str, tuple[str, Path, dict[str, Any]]] = {}
+        # score_only and local_only start from each copy's own coordinates: only a full search collapses duplicates.
+        structures: dict[str, str] = {}
+        if self.settings.collapse_duplicates and self.settings.docking_mode == "normal":
+            structures = self._ligand_structures(ligand_groups)
+        elif self.settings.collapse_duplicates:
+            self.progress_text.emit(
+                f"Collapse duplicates is ignored in {self.settings.docking_mode} mode: the pose of every copy depends on its own coordinates."
+            )
+        collapsed = 0
         for target_path in sorted(Path(self.targets_dir).glob("*/")):
             target_name = target_path.name
+            if only_targets is not None and target_name not in only_targets:
+                continue
             target_requirements = self._target_requirements(target_path)
+            receptor_hashes = self._receptor_hashes(target_requirements) if use_cache else {}
+            # First pending pair of each structure against this target; later copies ride on it.
+            docked_structures: dict[str, tuple[str, str, str]] = {}
             result_target_dir = os.path.join(result_folder, target_name)
-            os.makedirs(result_target_dir, exist_ok=True)
-            for lig_group in sorted(Path(self.ligands_dir).glob("*/")):
-                lig_group_name = lig_group.name
+            for lig_group_name, ligand_files in ligand_groups:
                 lig_result_group_dir = os.path.join(result_target_dir, lig_group_name)
-                os.makedirs(lig_result_group_dir, exist_ok=True)
-                for ligand_file in sorted(lig_group.glob("*.pdbqt")):
+                for ligand_file in ligand_files:
                     ligand_name = ligand_file.stem
+                    if (target_name, lig_group_name, ligand_name) in done:
+                        continue
+                    if selected is not None and (target_name, lig_group_name, ligand_name) not in selected:
+                        continue
+                    if self.shard_count > 1 and shard_of((target_name, lig_group_name, ligand_name), self.shard_count) != self.shard_index:
+                        continue
+                    profile = self._pending_ligand_profile(lig_group_name, ligand_file, rules, profiled)
                     ligand_out_dir = os.path.join(lig_result_group_dir, ligand_name)
-                    ligand_out_file = os.path.join(ligand_out_dir, f"{ligand_name}.pdbqt")
-                    if self.run_type == "RESTART" and os.path.isfile(ligand_out_file):
+                    job = {
+                        "target_name": target_name,
+                        "target_dir": str(target_path),
+                        "ligand_group": lig_group_name,
+                        "ligand_file": str(ligand_file),
+                        "ligand_name": ligand_name,
+                        "output_dir": ligand_out_dir,
+                        "output_file": os.path.join(ligand_out_dir, f"{ligand_name}.pdbqt"),
+                        **profile,
+                        "cost": _ligand_cost(profile),
+                        **target_requirements,
+                    }
+                    reference = self.ensemble_references.get(target_name)
+                    if reference:
+                        job["reference_output"] = os.path.join(result_folder, reference, lig_group_name, ligand_name, f"{ligand_name}.pdbqt")
+                    # Warm-started results depend on another target's pose, so they bypass the cache.
+                    if use_cache and not reference:
+                        if job["ligand_file"] not in ligand_hashes:
+                            ligand_hashes[job["ligand_file"]] = file_sha256(job["ligand_file"])
+                        cache_key = result_key(self._result_cache_fields(job, receptor_hashes, ligand_hashes[job["ligand_file"]]))
+                        if self.result_cache.fetch(cache_key, job["output_file"]) is not None:
+                            self._split_cpu_output(job)
+                            self._append_csv_result(csv_path, target_name, lig_group_name, ligand_name, job["output_file"])
+                            self.cached_pairs += 1
+                            continue
+                        self.cache_keys[self._pair_key(job)] = cache_key
+                    # A pose left by an interrupted run may be hardlinked into the result cache;
+                    # Vina would rewrite it in place, so it goes before the pair is docked again.
+                    try:
+                        os.unlink(job["output_file"])
+                    except FileNotFoundError:
+                        pass
+                    structure = structures.get(job["ligand_file"])
+                    if structure in docked_structures:
+                        self.duplicates.setdefault(docked_structures[structure], []).append(job)
+                        collapsed += 1
                         continue
-                    jobs.append(
-                        {
-                            "target_name": target_name,
-                            "target_dir": str(target_path),
-                            "ligand_group": lig_group_name,
-                            "ligand_file": str(ligand_file),
-                            "ligand_name": ligand_name,
-                            "output_dir": ligand_out_dir,
-                            "output_file": ligand_out_file,
-                            **target_requirements,
-                        }
-                    )
+                    if structure:
+                        docked_structures[structure] = self._pair_key(job)
+                    jobs.append(job)
+        if self.settings.adaptive_search and profiled:
+            self._log_search_effort(result_folder, profiled)
+        if collapsed:
+            self.progress_text.emit(
+                f"Collapsed {collapsed} duplicate pair(s) (same InChIKey and target): each structure is docked once "
+                "and its result copied to every databank and name it appears under."
+            )
+        if self.cached_pairs:
+            self.progress_text.emit(
+                f"Reused {self.cached_pairs} result(s) from the result cache in {self.result_cache.root}; "
+                f"{len(jobs)} pair(s) left to dock."
+            )
+        # Longest expected jobs first, so big flexible ligands do not trail at the end on one core.
+        jobs.sort(key=lambda job: job["cost"], reverse=True)
+        self.ledger.register(self._pair_key(job) for job in jobs)
+        self.ledger.register(self._pair_key(job) for copies in self.duplicates.values() for job in copies)
         return jobs
 
+    def _pending_ligand_profile(
+        self, group_name: str, ligand_file: Path, rules: list[AdaptiveRule], profiled: dict[str, tuple[str, Path, dict[str, Any]]]
+    ) -> dict[str, Any]:
+        """Profile and search effort of a ligand file; the file is read once per run, the effort chosen per call."""
+        entry = profiled.get(str(ligand_file))
+        if entry is not None:
+            return entry[2]
+        if str(ligand_file) not in self.ligand_profiles:
+            self.ligand_profiles[str(ligand_file)] = _ligand_profile(str(ligand_file))
+        profile: dict[str, Any] = dict(self.ligand_profiles[str(ligand_file)])
+        rule = _match_adaptive_rule(rules, profile)
+        if rule is None:
+            profile.update(search_rule="default", exhaustiveness=int(self.settings.exhaustiveness), gpu_threads=int(self.settings.gpu_threads))
+        else:
+            label, _max_torsdof, _max_heavy, exhaustiveness, gpu_threads = rule
+            profile.update(search_rule=label, exhaustiveness=exhaustiveness, gpu_threads=gpu_threads or int(self.settings.gpu_threads))
+        profiled[str(ligand_file)] = (group_name, ligand_file, profile)
+        return profile
+
+    def _log_search_effort(self, result_folder: str, profiled: dict[str, tuple[str, Path, dict[str, Any]]]) -> None:
+        """Write the adaptive rule of each pending ligand to <job>_search_rules.csv, keeping earlier rows."""
+        header = ["LIGAND DATABANK", "LIGAND", "TORSDOF", "HEAVY ATOMS", "RULE", "EXHAUSTIVENESS", "GPU THREADS"]
+        path = os.path.join(result_folder, f"{self.job_name}_search_rules.csv")
+        rows: dict[tuple[str, str], list[Any]] = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8", newline="") as handle:
+                rows = {(row[0], row[1]): row for row in list(csv.reader(handle))[1:] if len(row) >= len(header)}
+        for group_name, ligand_file, profile in profiled.values():
+            rows[(group_name, ligand_file.stem)] = [
+                group_name, ligand_file.stem, profile["torsdof"], profile["heavy_atoms"], profile["search_rule"], profile["exhaustiveness"], profile["gpu_threads"]
+            ]
+        with open(path, "w", encoding="utf-8", newline="") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(header)
+            writer.writerows(rows[key] for key in sorted(rows))
+        by_rule = collections.Counter(profile["search_rule"] for _group, _file, profile in profiled.values())
+        self.progress_text.emit(
+            "Adaptive search: " + ", ".join(f"{count} ligand(s) with {rule}" for rule, count in by_rule.most_common()) + "."
+        )
+
+    def _ligand_structures(self, ligand_groups: list[tuple[str, list[Path]]]) -> dict[str, str]:
+        """InChIKey of each ligand file from the Step 2 duplicate index, for files unchanged since."""
+        index = read_inchikey_index(self.ligands_dir)
+        if not index:
+            return {}
+        structures: dict[str, str] = {}
+        for group_name, ligand_files in ligand_groups:
+            for ligand_file in ligand_files:
+                entry = index.get((group_name, ligand_file.stem))
+                if entry is not None and entry[1] == file_signature(str(ligand_file)):
+                    structures[str(ligand_file)] = entry[0]
+        return structures
+
+    @staticmethod
+    def _receptor_hashes(target_requirements: dict[str, str]) -> dict[str, str]:
+        flex_receptor = target_requirements["flex_receptor"]
+        return {
+            "receptor_sha256": file_sha256(target_requirements["receptor"]),
+            "flex_sha256": file_sha256(flex_receptor) if flex_receptor else "",
+        }
+
+    def _engine_version(self, engine: str) -> str:
+        """Version of a docking engine ("binary", "python" or "vina-gpu"), "" when it cannot be read."""
+        if engine not in self.engine_versions:
+            version = ""
+            try:
+                if engine == "binary":
+                    result = subprocess.run([self.vina, "--version"], capture_output=True, text=True, timeout=30)
+                    version = next((line.strip() for line in result.stdout.splitlines() if line.strip()), "")
+                elif engine == "python":
+                    version = importlib.metadata.version("vina")
+                else:
+                    version = get_vina_gpu_version(self.vina_gpu) or ""
+            except (OSError, subprocess.SubprocessError, importlib.metadata.PackageNotFoundError):
+                pass
+            self.engine_versions[engine] = version
+        return self.engine_versions[engine]
+
+    def _result_cache_fields(self, job: dict[str, str], receptor_hashes: dict[str, str], ligand_sha256: str) -> dict[str, Any]:
+        """Everything that decides a pair's docking result, hashed into its result cache key."""
+        engine = {"GPU": "vina-gpu", "HYBRID": "hybrid"}.get(self.processing_type, "vina")
+        fields: dict[str, Any] = {
+            **receptor_hashes,
+            "ligand_sha256": ligand_sha256,
+            "center": [job["center_x"], job["center_y"], job["center_z"]],
+            "size": [job["size_x"], job["size_y"], job["size_z"]],
+            "engine": engine,
+            "scoring": self.settings.scoring_function,
+            "docking_mode": self.settings.docking_mode,
+            "poses": int(self.settings.poses),
+            "min_rmsd": float(self.settings.min_rmsd),
+            "energy_range": float(self.settings.energy_range),
+            "spacing": float(self.settings.spacing),
+            "seed": int(self.settings.seed),
+        }
+        if engine != "vina-gpu":
+            fields["exhaustiveness"] = int(job["exhaustiveness"])
+            fields["cpu_engine"] = self.settings.cpu_engine
+            fields["cpu_engine_version"] = self._engine_version(self.settings.cpu_engine)
+        if engine != "vina":
+            fields["vina_gpu_version"] = self._engine_version("vina-gpu")
+        if engine != "vina":
+            fields["gpu_threads"] = int(job["gpu_threads"])
+        if engine == "hybrid":
+            fields["hybrid_cpu_torsions"] = int(self.settings.hybrid_cpu_torsions)
+        if engine != "vina-gpu" and self._convergence_enabled():
+            fields["convergence"] = [
+                int(self.settings.convergence_exhaustiveness),
+                int(self.settings.convergence_max_runs),
+                float(self.settings.convergence_energy_tolerance),
+                float(self.settings.convergence_rmsd),
+            ]
+        return fields
+
+    def _scan_finished_outputs(self, result_folder: str) -> set[tuple[str, str, str]]:
+        """One-time walk of a job folder that predates the ledger, to seed it on RESTART."""
+        done: set[tuple[str, str, str]] = set()
+        for target_dir in Path(result_folder).glob("*/"):
+            for group_dir in target_dir.glob("*/"):
+                for ligand_dir in group_dir.glob("*/"):
+                    if (ligand_dir / f"{ligand_dir.name}.pdbqt").is_file():
+                        done.add((target_dir.name, group_dir.name, ligand_dir.name))
+        return done
+
+    @staticmethod
+    def _pair_key(job: dict[str, str]) -> tuple[str, str, str]:
+        return (job["target_name"], job["ligand_group"], job["ligand_name"])
+
+    def _pair_timeout(self, job: dict[str, str]) -> int:
+        """Wall-clock limit in seconds for docking one pair, 0 for none; grows with TORSDOF."""
+        if int(self.settings.pair_timeout) <= 0:
+            return 0
+        return int(self.settings.pair_timeout) + int(self.settings.pair_timeout_per_torsion) * int(job["torsdof"])
+
+    def _record_failure(self, job: dict[str, str], log: str) -> None:
+        """Record a pair that failed all its attempts in the ledger and let the run go on."""
+        if self.control.cancelled:
+            # Killed by the cancel, or its retries were skipped: the pair stays pending.
+            return
+        log = (log or "").strip()
+        for failed_job in [job, *self.duplicates.pop(self._pair_key(job), [])]:
+            self.failed_pairs += 1
+            self.ledger.mark_failed(self._pair_key(failed_job), log[-FAILURE_LOG_LIMIT:] or "No output.")
+        last_line = log.splitlines()[-1] if log else "no output"
+        self.progress_text.emit(f"FAILED {self.docking_type} docking of {job['ligand_name']} against {job['target_name']}: {last_line}")
+
     def _target_requirements(self, target_path: Path) -> dict[str, str]:
         grid_path = target_path / "grid.txt"
         if not grid_path.is_file():
@@ -498,72 +1695,955 @@ class DockingWorker(QThread):
                     grid["size_z"] = int(float(parts[3]))
         return grid
 
+    def _receptor_maps_key(self, job: dict[str, str]) -> str:
+        """Cache key of a target's affinity maps: receptor and flexible residue content, box, spacing and scoring."""
+        with open(job["receptor"], "rb") as handle:
+            receptor_hash = hashlib.sha256(handle.read()).hexdigest()
+        payload = {
+            "receptor_sha256": receptor_hash,
+            "center": [job["center_x"], job["center_y"], job["center_z"]],
+            "size": [job["size_x"], job["size_y"], job["size_z"]],
+            "spacing": float(self.settings.spacing),
+            "scoring": self.settings.scoring_function,
+        }
+        if job["flex_receptor"]:
+            # Targets may share a rigid receptor and differ only in their flexible residues.
+            payload["flex_receptor_sha256"] = file_sha256(job["flex_receptor"])
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _ensure_receptor_maps(self, job: dict[str, str]) -> str:
+        """Map prefix for `--maps`, built into TARGETS/<target>/MAPS/<key> on first use; "" lets Vina compute them."""
+        key = self._receptor_maps_key(job)
+        maps_dir = os.path.join(job["target_dir"], RECEPTOR_MAPS_DIRNAME, key)
+        prefix = os.path.join(maps_dir, RECEPTOR_MAPS_PREFIX)
+        if os.path.isfile(os.path.join(maps_dir, RECEPTOR_MAPS_MANIFEST)):
+            return prefix
+
+        os.makedirs(os.path.dirname(maps_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f".{key}_", dir=os.path.dirname(maps_dir))
+        build_prefix = os.path.join(build_dir, RECEPTOR_MAPS_PREFIX)
+        try:
+            self.progress_text.emit(f"Computing {self.settings.scoring_function} affinity maps for {job['target_name']}...")
+            if self.settings.scoring_function == "ad4":
+                error = self._write_autogrid_maps(job, build_dir)
+            else:
+                error = self._write_vina_maps(job, build_prefix)
+            if error:
+                if self.settings.scoring_function == "ad4":
+                    raise RuntimeError(f"Could not build AutoGrid4 maps for {job['target_name']}:\n{error}")
+                self.progress_text.emit(f"Map cache unavailable for {job['target_name']}, Vina will compute maps per ligand:\n{error}")
+                return ""
+            with open(os.path.join(build_dir, RECEPTOR_MAPS_MANIFEST), "w", encoding="utf-8") as handle:
+                json.dump(
+                    {
+                        "receptor": job["receptor"],
+                        "flex_receptor": job["flex_receptor"],
+                        "scoring": self.settings.scoring_function,
+                        "center": [job["center_x"], job["center_y"], job["center_z"]],
+                        "size": [job["size_x"], job["size_y"], job["size_z"]],
+                        "spacing": self.settings.spacing,
+                        "created": datetime.now().isoformat(timespec="seconds"),
+                    },
+                    handle,
+                    indent=2,
+                )
+            try:
+                os.rename(build_dir, maps_dir)
+            except OSError:
+                # Another run finished the same map set first; keep theirs.
+                if not os.path.isfile(os.path.join(maps_dir, RECEPTOR_MAPS_MANIFEST)):
+                    raise
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        return prefix
+
+    def _write_vina_maps(self, job: dict[str, str], prefix: str) -> str:
+        result = subprocess.run(
+            [
+                self.vina,
+                "--receptor", job["receptor"],
+                "--scoring", self.settings.scoring_function,
+                "--center_x", job["center_x"],
+                "--center_y", job["center_y"],
+                "--center_z", job["center_z"],
+                "--size_x", job["size_x"],
+                "--size_y", job["size_y"],
+                "--size_z", job["size_z"],
+                "--spacing", str(self.settings.spacing),
+                "--cpu", str(self.settings.cpu_threads),
+                "--write_maps", prefix,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        if result.returncode != 0 or not list(Path(prefix).parent.glob(f"{RECEPTOR_MAPS_PREFIX}.*.map")):
+            return result.stdout.strip() or "vina did not write any map files."
+        return ""
+
+    def _write_autogrid_maps(self, job: dict[str, str], maps_dir: str) -> str:
+        autogrid = shutil.which("autogrid4") or os.path.join(self.app_dir, "bin", "autogrid4")
+        if not os.path.isfile(autogrid):
+            return "autogrid4 was not found in PATH or in the CODOC bin folder."
+        spacing = float(self.settings.spacing)
+        npts = []
+        for axis in ("x", "y", "z"):
+            points = max(2, int(round(float(job[f"size_{axis}"]) / spacing)))
+            npts.append(str(points + points % 2))
+        receptor_copy = os.path.join(maps_dir, f"{RECEPTOR_MAPS_PREFIX}.pdbqt")
+        shutil.copy2(job["receptor"], receptor_copy)
+        lines = [
+            f"npts {' '.join(npts)}",
+            f"gridfld {RECEPTOR_MAPS_PREFIX}.maps.fld",
+            f"spacing {spacing}",
+            f"receptor_types {' '.join(_receptor_atom_types(receptor_copy))}",
+            f"ligand_types {' '.join(AD4_LIGAND_ATOM_TYPES)}",
+            f"receptor {RECEPTOR_MAPS_PREFIX}.pdbqt",
+            f"gridcenter {job['center_x']} {job['center_y']} {job['center_z']}",
+            "smooth 0.5",
+            *[f"map {RECEPTOR_MAPS_PREFIX}.{atom_type}.map" for atom_type in AD4_LIGAND_ATOM_TYPES],
+            f"elecmap {RECEPTOR_MAPS_PREFIX}.e.map",
+            f"dsolvmap {RECEPTOR_MAPS_PREFIX}.d.map",
+            "dielectric -0.1465",
+        ]
+        gpf_path = os.path.join(maps_dir, f"{RECEPTOR_MAPS_PREFIX}.gpf")
+        with open(gpf_path, "w", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+        result = subprocess.run(
+            [autogrid, "-p", gpf_path, "-l", os.path.join(maps_dir, f"{RECEPTOR_MAPS_PREFIX}.glg")],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=maps_dir,
+        )
+        if result.returncode != 0 or not os.path.isfile(os.path.join(maps_dir, f"{RECEPTOR_MAPS_PREFIX}.e.map")):
+            return result.stdout.strip() or "autogrid4 did not write the electrostatic map."
+        return ""
+
+    def _attach_receptor_maps(self, jobs: list[dict[str, str]]) -> None:
+        """Record the cached map prefix of its target on every job."""
+        prefixes: dict[str, str] = {}
+        for job in jobs:
+            if job["target_dir"] not in prefixes:
+                prefixes[job["target_dir"]] = self._ensure_receptor_maps(job)
+            job["maps"] = prefixes[job["target_dir"]]
+
+    def _cpu_threads_per_process(self) -> int:
+        """CPU threads per Vina process: `cpu_threads` split across `cpu_parallelism` processes."""
+        parallelism = max(1, int(self.settings.cpu_parallelism))
+        return max(1, int(self.settings.cpu_threads) // parallelism)
+
     def _run_cpu_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        if self.settings.cpu_engine == "python":
+            self._run_python_engine_jobs(result_folder, jobs)
+            return
+        total = len(jobs)
+        csv_path = self._run_csv_path(result_folder)
+        self._ensure_result_csv(csv_path)
+        parallelism = max(1, min(int(self.settings.cpu_parallelism), total))
+        cpu_per_process = self._cpu_threads_per_process()
+        self._attach_receptor_maps(jobs)
+        self.progress_text.emit(
+            f"Running {total} docking job(s) with {parallelism} concurrent Vina process(es), "
+            f"{cpu_per_process} CPU thread(s) each..."
+        )
+
+        # Vina runs as external processes, so threads are enough; units are submitted lazily so a
+        # huge job never holds one future per ligand.
+        pending = iter(self._cpu_work_units(jobs))
+        in_flight: dict[Future, list[dict[str, str]]] = {}
+        completed = 0
+        total_cost = sum(job["cost"] for job in jobs)
+        done_cost = 0
+        meter = _ThroughputMeter(total)
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            while True:
+                while len(in_flight) < parallelism and self.control.checkpoint():
+                    unit = next(pending, None)
+                    if unit is None:
+                        break
+                    runner = self._run_cpu_batch if len(unit) > 1 else self._run_cpu_job
+                    self.ledger.mark_running(self._pair_key(job) for job in unit)
+                    in_flight[executor.submit(runner, unit, cpu_per_process)] = unit
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future)
+                    for job, returncode, log in future.result():
+                        completed += 1
+                        done_cost += job["cost"]
+                        self.progress_value.emit(int(done_cost * 100 / max(total_cost, 1)))
+                        self._emit_progress_stats(meter, completed)
+                        if returncode != 0:
+                            self._record_failure(job, log)
+                            continue
+                        self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+                        self.progress_text.emit(
+                            f"Finished {self.docking_type} docking of {job['ligand_name']} against {job['target_name']} "
+                            f"({completed}/{total})"
+                        )
+
+    def _run_python_engine_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        """CPU docking through the `vina` Python bindings, in a pool of worker processes per target."""
         total = len(jobs)
         csv_path = self._run_csv_path(result_folder)
         self._ensure_result_csv(csv_path)
-        for index, job in enumerate(jobs, start=1):
+        parallelism = max(1, min(int(self.settings.cpu_parallelism), total))
+        cpu_per_process = self._cpu_threads_per_process()
+        mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        by_target: dict[str, list[dict[str, str]]] = {}
+        for job in jobs:
+            by_target.setdefault(job["target_dir"], []).append(job)
+
+        completed = 0
+        total_cost = sum(job["cost"] for job in jobs)
+        done_cost = 0
+        meter = _ThroughputMeter(total)
+        # No per-pair watchdog: the engine runs inside the pool's worker processes.
+        retries_left: dict[tuple[str, str, str], int] = {}
+        for target_jobs in by_target.values():
+            if self.control.cancelled:
+                break
+            first = target_jobs[0]
+            maps = self._ensure_receptor_maps(first) if self.settings.scoring_function == "ad4" else ""
+            options = {
+                "scoring": self.settings.scoring_function,
+                "cpu": cpu_per_process,
+                "receptor": first["receptor"],
+                "flex_receptor": first["flex_receptor"],
+                "maps": maps,
+                "center": [float(first["center_x"]), float(first["center_y"]), float(first["center_z"])],
+                "size": [float(first["size_x"]), float(first["size_y"]), float(first["size_z"])],
+                "spacing": self.settings.spacing,
+                "docking_mode": self.settings.docking_mode,
+                "exhaustiveness": self.settings.exhaustiveness,
+                "poses": self.settings.poses,
+                "min_rmsd": self.settings.min_rmsd,
+                "energy_range": self.settings.energy_range,
+                "seed": self.settings.seed,
+            }
+            self.progress_text.emit(
+                f"Loading {first['target_name']} into {parallelism} Vina engine worker(s), {cpu_per_process} CPU thread(s) each..."
+            )
+            pending: collections.deque[dict[str, str]] = collections.deque(target_jobs)
+            # Pairs in flight when a worker died, docked again one at a time so only the culprit uses a retry.
+            suspects: collections.deque[dict[str, str]] = collections.deque()
+            in_flight: dict[Future, dict[str, str]] = {}
+            executor: Optional[ProcessPoolExecutor] = None
+            try:
+                while True:
+                    if executor is None:
+                        executor = self.control.process_pool(parallelism, mp_context, _vina_worker_init, (options,))
+                    broken = False
+                    try:
+                        # A short queue per worker, so ligand files are read just ahead of use.
+                        while self.control.checkpoint():
+                            if suspects:
+                                if in_flight:
+                                    break
+                                source = suspects
+                            elif pending and len(in_flight) < parallelism * 2:
+                                source = pending
+                            else:
+                                break
+                            in_flight[self._submit_engine_job(executor, source[0])] = source[0]
+                            source.popleft()
+                        self.control.attach_pool(executor)
+                    except BrokenProcessPool:
+                        broken = True
+                    if self.control.killed:
+                        for future in [future for future in in_flight if future.cancel()]:
+                            in_flight.pop(future)
+                    if not in_flight and not broken:
+                        break
+                    done = wait(in_flight, return_when=FIRST_COMPLETED)[0] if in_flight and not broken else set()
+                    for future in done:
+                        try:
+                            _, _energy, error = future.result()
+                        except BrokenProcessPool:
+                            broken = True
+                            continue
+                        job = in_flight.pop(future)
+                        if error is not None:
+                            key = self._pair_key(job)
+                            retries_left.setdefault(key, max(0, int(self.settings.max_retries)))
+                            if retries_left[key] > 0 and not self.control.cancelled:
+                                retries_left[key] -= 1
+                                pending.appendleft(job)
+                                continue
+                        completed += 1
+                        done_cost += job["cost"]
+                        self.progress_value.emit(int(done_cost * 100 / max(total_cost, 1)))
+                        self._emit_progress_stats(meter, completed)
+                        if error is not None:
+                            self._record_failure(job, error)
+                            continue
+                        self._split_cpu_output(job)
+                        self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+                        self.progress_text.emit(
+                            f"Finished {self.docking_type} docking of {job['ligand_name']} against {job['target_name']} "
+                            f"({completed}/{total})"
+                        )
+                    if not broken:
+                        continue
+                    # A worker died and took every future of the pool with it: start a fresh pool.
+                    self.control.detach_pool(executor)
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    executor = None
+                    crashed = list(in_flight.values())
+                    in_flight.clear()
+                    if self.control.cancelled:
+                        break  # the crashed pairs stay pending for a RESTART
+                    if len(crashed) == 1:
+                        job = crashed[0]
+                        key = self._pair_key(job)
+                        retries_left.setdefault(key, max(0, int(self.settings.max_retries)))
+                        if retries_left[key] > 0:
+                            retries_left[key] -= 1
+                            suspects.appendleft(job)
+                        else:
+                            completed += 1
+                            done_cost += job["cost"]
+                            self.progress_value.emit(int(done_cost * 100 / max(total_cost, 1)))
+                            self._emit_progress_stats(meter, completed)
+                            self._record_failure(job, f"The Vina engine worker process died while docking {job['ligand_name']} (engine crash or out of memory).")
+                    else:
+                        suspects.extend(crashed)
+                    self.progress_text.emit(
+                        f"A Vina engine worker died while docking against {first['target_name']}; restarting the pool "
+                        f"and docking the {len(crashed)} pair(s) it held again."
+                    )
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=True)
+                    self.control.detach_pool(executor)
+
+    def _submit_engine_job(self, executor: ProcessPoolExecutor, job: dict[str, str]) -> Future:
+        ligand_pdbqt = Path(job["ligand_file"]).read_text(encoding="utf-8", errors="ignore")
+        self.ledger.mark_running([self._pair_key(job)])
+        return executor.submit(_vina_dock_worker, (job["output_file"], job["ligand_name"], ligand_pdbqt, job["exhaustiveness"]))
+
+    def _cpu_work_units(self, jobs: list[dict[str, str]]) -> list[list[dict[str, str]]]:
+        """Split the pending jobs into the units handed to one Vina process each (`--batch` chunks in normal mode)."""
+        batch_size = max(1, int(self.settings.cpu_batch_size))
+        if batch_size == 1 or self.settings.docking_mode != "normal" or self._convergence_enabled():
+            return [[job] for job in jobs]
+        grouped: dict[tuple[str, str, str], list[dict[str, str]]] = {}
+        for job in jobs:
+            grouped.setdefault((job["target_name"], job["ligand_group"], job["search_rule"]), []).append(job)
+        units = [group_jobs[start:start + batch_size] for group_jobs in grouped.values() for start in range(0, len(group_jobs), batch_size)]
+        units.sort(key=lambda unit: sum(job["cost"] for job in unit), reverse=True)
+        return units
+
+    def _run_cpu_job(self, unit: list[dict[str, str]], cpu_threads: int) -> list[tuple[dict[str, str], int, str]]:
+        """Dock one (target, ligand) pair with the Vina binary. Runs on a scheduler thread."""
+        job = unit[0]
+        os.makedirs(job["output_dir"], exist_ok=True)
+        if self._convergence_enabled():
+            outcome = self._run_convergent_search(job, cpu_threads)
+            if outcome is not None:
+                return [outcome]
+        config_path = os.path.join(job["output_dir"], "config.txt")
+        self._write_cpu_config(config_path, job, cpu_threads)
+        for attempt in range(max(0, int(self.settings.max_retries)) + 1):
+            if attempt:
+                if self.control.cancelled:
+                    break
+                self.ledger.mark_running([self._pair_key(job)])
+            result = _run_watched([self.vina, "--config", config_path], self._pair_timeout(job), control=self.control)
+            if result.returncode == 0:
+                self._split_cpu_output(job)
+                break
+        return [(job, result.returncode, result.stdout)]
+
+    def _convergence_enabled(self) -> bool:
+        return bool(self.settings.convergence_mode) and self.settings.docking_mode == "normal"
+
+    def _run_convergent_search(self, job: dict[str, str], cpu_threads: int) -> Optional[tuple[dict[str, str], int, str]]:
+        """Dock one pair as repeated short searches until two agree; None when it did not converge."""
+        short_exhaustiveness = int(self.settings.convergence_exhaustiveness)
+        max_runs = max(2, int(self.settings.convergence_max_runs))
+        if short_exhaustiveness >= int(job["exhaustiveness"]):
+            # Nothing to save on ligands whose (adaptive) effort is already this small.
+            return None
+        base_seed = int(self.settings.seed) or random.randrange(1, 2**31 - max_runs)
+        config_path = os.path.join(job["output_dir"], "config.txt")
+        runs: list[tuple[float, str, list[tuple[float, float, float]]]] = []
+        spread: Optional[float] = None
+        rmsd: Optional[float] = None
+        converged = False
+        try:
+            for run_index in range(max_runs):
+                if not self.control.checkpoint():
+                    return job, 1, "Cancelled during the short convergence searches."
+                run_output = os.path.join(job["output_dir"], f".converge_{run_index + 1}.pdbqt")
+                self._write_cpu_config(
+                    config_path, job, cpu_threads, exhaustiveness=short_exhaustiveness, seed=base_seed + run_index, output_file=run_output
+                )
+                result = _run_watched([self.vina, "--config", config_path], self._pair_timeout(job), control=self.control)
+                energy_text, _rmsd_mean, _smiles = _parse_vina_pose_data(run_output)
+                if result.returncode != 0 or not energy_text:
+                    if self.control.killed:
+                        return job, result.returncode or 1, result.stdout
+                    break
+                runs.append((float(energy_text), run_output, _best_pose_coordinates(run_output)))
+                if len(runs) < 2:
+                    continue
+                runs.sort(key=lambda run: run[0])
+                (best_energy, best_output, best_pose), (second_energy, _second_output, second_pose) = runs[0], runs[1]
+                spread = second_energy - best_energy
+                rmsd = _pose_rmsd(best_pose, second_pose)
+                if spread <= float(self.settings.convergence_energy_tolerance) and rmsd is not None and rmsd <= float(self.settings.convergence_rmsd):
+                    os.replace(best_output, job["output_file"])
+                    self._split_cpu_output(job)
+                    converged = True
+                    break
+        finally:
+            for _energy, run_output, _pose in runs:
+                if os.path.isfile(run_output):
+                    os.remove(run_output)
+        self._log_convergence(job, len(runs), converged, spread, rmsd, base_seed)
+        if not converged:
+            return None
+        return job, 0, f"Converged after {len(runs)} short search(es) (energy spread {spread:.2f} kcal/mol, RMSD {rmsd:.2f} A)."
+
+    def _log_convergence(
+        self, job: dict[str, str], runs: int, converged: bool, spread: Optional[float], rmsd: Optional[float], base_seed: int
+    ) -> None:
+        with self.convergence_lock:
+            self.convergence_counts["converged" if converged else "full"] += 1
+            if not self.convergence_log:
+                return
+            write_header = not os.path.isfile(self.convergence_log)
+            with open(self.convergence_log, "a", encoding="utf-8", newline="") as handle:
+                writer = csv.writer(handle)
+                if write_header:
+                    writer.writerow(["LIGAND", "LIGAND DATABANK", "TARGET", "SHORT SEARCHES", "CONVERGED", "ENERGY SPREAD", "BEST POSE RMSD", "FIRST SEED"])
+                writer.writerow(
+                    [
+                        job["ligand_name"],
+                        job["ligand_group"],
+                        job["target_name"],
+                        runs,
+                        "yes" if converged else "no (full search)",
+                        "" if spread is None else f"{spread:.3f}",
+                        "" if rmsd is None else f"{rmsd:.3f}",
+                        base_seed,
+                    ]
+                )
+
+    def _run_cpu_batch(self, unit: list[dict[str, str]], cpu_threads: int) -> list[tuple[dict[str, str], int, str]]:
+        """Dock a chunk of ligands of one target and ligand group in a single `vina --batch` run."""
+        group_dir = os.path.dirname(unit[0]["output_dir"])
+        os.makedirs(group_dir, exist_ok=True)
+        batch_dir = tempfile.mkdtemp(prefix=".batch_", dir=group_dir)
+        try:
+            config_path = os.path.join(batch_dir, "config.txt")
+            self._write_cpu_config(config_path, unit[0], cpu_threads, batch_dir=batch_dir)
+            result = _run_watched(
+                [self.vina, "--config", config_path, "--batch", *[job["ligand_file"] for job in unit]],
+                sum(self._pair_timeout(job) for job in unit),
+                control=self.control,
+            )
+            outcomes: list[tuple[dict[str, str], int, str]] = []
+            for job in unit:
+                batch_output = os.path.join(batch_dir, f"{Path(job['ligand_file']).stem}_out.pdbqt")
+                if not os.path.isfile(batch_output):
+                    if self.control.cancelled:
+                        outcomes.append((job, result.returncode or 1, "Cancelled before this ligand was docked."))
+                    else:
+                        outcomes += self._run_cpu_job([job], cpu_threads)
+                    continue
+                os.makedirs(job["output_dir"], exist_ok=True)
+                shutil.move(batch_output, job["output_file"])
+                self._split_cpu_output(job)
+                outcomes.append((job, 0, ""))
+            return outcomes
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def _split_cpu_output(self, job: dict[str, str]) -> None:
+        if self.settings.split_results and os.path.isfile(self.vina_split):
+            subprocess.run([self.vina_split, "--input", job["output_file"]], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def _gpu_devices(self) -> list[tuple[int, int, str]]:
+        """OpenCL devices (platform_id, device_id, label) that Vina-GPU batches are spread over."""
+        if self.settings.multi_gpu:
+            devices = [device for device in detect_opencl_devices() if "GPU" in str(device.get("device_type", "")).upper()]
+            if devices:
+                return [
+                    (int(device.get("platform_id", -1)), int(device.get("device_id", -1)), str(device.get("device_name", "")))
+                    for device in devices
+                ]
+        return [(self.settings.opencl_platform_id, self.settings.opencl_device_id, "selected device")]
+
+    def _gpu_batch_size(self, device: tuple[int, int, str]) -> int:
+        """Ligands per Vina-GPU batch on `device`: its gpu_device_batch_sizes entry, or gpu_batch_size."""
+        sizes = _parse_device_batch_sizes(self.settings.gpu_device_batch_sizes)
+        return sizes.get((device[0], device[1]), max(1, int(self.settings.gpu_batch_size)))
+
+    def _run_gpu_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        total = len(jobs)
+        csv_path = self._run_csv_path(result_folder)
+        self._ensure_result_csv(csv_path)
+        pool = _GpuWorkPool(jobs)
+        devices = self._gpu_devices()
+        for device in devices:
+            self.progress_text.emit(
+                f"Using OpenCL selection: platform_id={device[0]} device_id={device[1]} ({device[2]}), "
+                f"batches of up to {self._gpu_batch_size(device)} ligand(s)"
+            )
+
+        # One thread per device; finished batches come back through `events`, so only this thread
+        # writes the CSV and emits signals.
+        events: queue.Queue = queue.Queue()
+
+        def device_loop(device: tuple[int, int, str], work_dir: str) -> None:
+            try:
+                self._gpu_device_pipeline(
+                    result_folder,
+                    pool,
+                    device,
+                    work_dir,
+                    on_start=lambda batch: events.put(("start", device, batch, None)),
+                    on_done=lambda batch, result: events.put(("done", device, batch, result)),
+                    on_ligand=lambda ligand_name: events.put(("ligand", device, [], ligand_name)),
+                )
+            finally:
+                events.put(("exit", device, [], None))
+
+        threads = []
+        for device, work_dir in self._gpu_work_dirs(devices):
+            thread = threading.Thread(target=device_loop, args=(device, work_dir), daemon=True)
+            threads.append(thread)
+            thread.start()
+
+        completed = 0
+        total_cost = sum(job["cost"] for job in jobs)
+        done_cost = 0
+        per_device: dict[tuple[int, int], int] = {}
+        # Ligands of each device's running batch that Vina-GPU reported as finished so far.
+        streamed: dict[tuple[int, int], set[str]] = {}
+        meter = _ThroughputMeter(total)
+        running_devices = len(threads)
+        while running_devices:
+            kind, device, batch, result = events.get()
+            device_tag = f"GPU P{device[0]}:D{device[1]}"
+            if kind == "exit":
+                running_devices -= 1
+                continue
+            if kind == "ligand":
+                streamed.setdefault(device[:2], set()).add(result)
+                self._emit_progress_stats(meter, completed + sum(len(names) for names in streamed.values()))
+                continue
+            target_name, ligand_group = batch[0]["target_name"], batch[0]["ligand_group"]
+            if kind == "start":
+                streamed[device[:2]] = set()
+                self.ledger.mark_running(self._pair_key(job) for job in batch)
+                self.progress_text.emit(
+                    f"[{device_tag}] Running GPU docking of {len(batch)} ligand(s) of {ligand_group} against {target_name} "
+                    f"(TORSDOF {batch[-1]['torsdof']}-{batch[0]['torsdof']})"
+                )
+                continue
+            per_device[device[:2]] = per_device.get(device[:2], 0) + 1
+            if result.returncode != 0:
+                self.progress_text.emit(
+                    f"[{device_tag}] Vina-GPU exited with code {result.returncode} on {ligand_group} against {target_name}; "
+                    "keeping the ligands it finished."
+                )
+            output_dir = os.path.join(result_folder, target_name, ligand_group)
+            self._harvest_gpu_outputs(csv_path, output_dir, batch, result.stdout)
+            completed += len(batch)
+            done_cost += sum(job["cost"] for job in batch)
+            streamed.pop(device[:2], None)
+            self.progress_value.emit(int(done_cost * 100 / max(total_cost, 1)))
+            self._emit_progress_stats(meter, completed + sum(len(names) for names in streamed.values()))
+            self.progress_text.emit(
+                f"[{device_tag}] Finished {len(batch)} ligand(s) of {ligand_group} against {target_name} "
+                f"({per_device[device[:2]]} batch(es) on this device, {completed}/{total} ligands overall)"
+            )
+        for thread in threads:
+            thread.join()
+
+    def _gpu_work_dirs(self, devices: list[tuple[int, int, str]]) -> list[tuple[tuple[int, int, str], str]]:
+        """(device, working directory) pairs; each Vina-GPU process writes its scratch files into its own."""
+        pairs = []
+        for device in devices:
+            work_dir = os.path.join(self.app_dir, f".gpu_p{device[0]}_d{device[1]}")
+            os.makedirs(work_dir, exist_ok=True)
+            pairs.append((device, work_dir))
+        return pairs
+
+    def _stage_gpu_batch(self, result_folder: str, group_jobs: list[dict[str, str]], device: tuple[int, int, str]) -> str:
+        """Symlink a batch of ligands and its config into a fresh staging folder and return it."""
+        output_dir = os.path.join(result_folder, group_jobs[0]["target_name"], group_jobs[0]["ligand_group"])
+        os.makedirs(output_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix="codoc_gpu_batch_")
+        try:
+            ligand_dir = os.path.join(staging_dir, "ligands")
+            os.makedirs(ligand_dir)
+            for job in group_jobs:
+                os.symlink(job["ligand_file"], os.path.join(ligand_dir, os.path.basename(job["ligand_file"])))
+            self._write_gpu_config(os.path.join(staging_dir, "gpu_config.txt"), group_jobs[0], ligand_dir, output_dir, device[0], device[1])
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        return staging_dir
+
+    def _run_gpu_batch(
+        self,
+        group_jobs: list[dict[str, str]],
+        work_dir: str,
+        staging_dir: str,
+        on_ligand: Optional[Callable[[str], None]] = None,
+    ) -> subprocess.CompletedProcess[str]:
+        """Run Vina-GPU on a staged batch, calling on_ligand(name) as each of its ligands finishes."""
+
+        def on_line(line: str) -> None:
+            match = _VINA_GPU_LIGAND_DONE_RE.match(line)
+            if match and on_ligand is not None:
+                on_ligand(match.group(1))
+
+        # Vina-GPU docks the batch in parallel, so the summed per-pair limits only catch a hung process.
+        return _run_watched(
+            [self.vina_gpu, "--config", os.path.join(staging_dir, "gpu_config.txt")],
+            sum(self._pair_timeout(job) for job in group_jobs),
+            cwd=work_dir,
+            control=self.control,
+            on_line=on_line,
+            # A stopped Vina-GPU would keep its OpenCL context and VRAM for the whole pause.
+            release_on_pause=True,
+        )
+
+    def _run_gpu_batch_with_retries(
+        self,
+        result_folder: str,
+        group_jobs: list[dict[str, str]],
+        device: tuple[int, int, str],
+        work_dir: str,
+        staging_dir: str = "",
+        on_ligand: Optional[Callable[[str], None]] = None,
+    ) -> subprocess.CompletedProcess[str]:
+        """Run one Vina-GPU batch, rerunning the ligands left without output after a failure or a pause."""
+        output_dir = os.path.join(result_folder, group_jobs[0]["target_name"], group_jobs[0]["ligand_group"])
+        batch = group_jobs
+        retries = max(0, int(self.settings.max_retries))
+        rerun = False
+        while True:
+            if rerun:
+                batch = [job for job in batch if not self._gpu_output_path(output_dir, job)]
+                if not batch or self.control.cancelled:
+                    break
+                self.ledger.mark_running(self._pair_key(job) for job in batch)
+            try:
+                staging_dir = staging_dir or self._stage_gpu_batch(result_folder, batch, device)
+                result = self._run_gpu_batch(batch, work_dir, staging_dir, on_ligand)
+            except Exception as exc:
+                result = subprocess.CompletedProcess([], 1, str(exc))
+            finally:
+                if staging_dir:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                staging_dir = ""
+            if result.returncode == 0:
+                break
+            if result.returncode == RELEASED_ON_PAUSE:
+                if not self.control.checkpoint():
+                    break
+            elif retries:
+                retries -= 1
+            else:
+                break
+            rerun = True
+        return result
+
+    def _gpu_device_pipeline(
+        self,
+        result_folder: str,
+        pool: _GpuWorkPool,
+        device: tuple[int, int, str],
+        work_dir: str,
+        on_start: Callable[[list[dict[str, str]]], None],
+        on_done: Callable[[list[dict[str, str]], subprocess.CompletedProcess[str]], None],
+        on_ligand: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        """Keep one OpenCL device busy with batches from `pool`, staging the next batch while one runs."""
+        size = self._gpu_batch_size(device)
+        staged: queue.Queue = queue.Queue(maxsize=1)
+
+        def stager() -> None:
+            try:
+                while self.control.checkpoint():
+                    batch = pool.take_gpu_batch(size)
+                    if batch is None:
+                        break
+                    try:
+                        staging_dir = self._stage_gpu_batch(result_folder, batch, device)
+                    except Exception:
+                        staging_dir = ""  # staged again, and reported, by the run itself
+                    staged.put((batch, staging_dir))
+            finally:
+                staged.put(None)
+
+        stager_thread = threading.Thread(target=stager, name=f"codoc-gpu-stager-p{device[0]}-d{device[1]}", daemon=True)
+        stager_thread.start()
+        while True:
+            item = staged.get()
+            if item is None:
+                break
+            batch, staging_dir = item
+            # Do not start a staged batch while paused, so the GPU stays free.
+            if not self.control.checkpoint():
+                if staging_dir:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                continue
+            on_start(batch)
+            on_done(batch, self._run_gpu_batch_with_retries(result_folder, batch, device, work_dir, staging_dir, on_ligand))
+        stager_thread.join()
+
+    def _gpu_output_path(self, output_dir: str, job: dict[str, str]) -> str:
+        """Flat pose file Vina-GPU wrote for a ligand of the batch, or "" when there is none."""
+        for name in (f"{job['ligand_name']}_out.pdbqt", f"{job['ligand_name']}.pdbqt"):
+            path = os.path.join(output_dir, name)
+            if os.path.isfile(path):
+                return path
+        return ""
+
+    def _harvest_gpu_outputs(self, csv_path: str, output_dir: str, group_jobs: list[dict[str, str]], log: str = "") -> None:
+        for job in group_jobs:
+            flat_output = self._gpu_output_path(output_dir, job)
+            if not flat_output:
+                self._record_failure(job, log or "Vina-GPU wrote no output for this ligand.")
+                continue
             os.makedirs(job["output_dir"], exist_ok=True)
-            config_path = os.path.join(job["output_dir"], "config.txt")
-            self._write_cpu_config(config_path, job)
-            self.progress_value.emit(int(index * 100 / max(total, 1)))
+            shutil.move(flat_output, job["output_file"])
+            self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+
+    def _run_hybrid_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        """Dock on the GPU(s) and on spare CPU cores at once, both pulling from one work pool."""
+        total = len(jobs)
+        csv_path = self._run_csv_path(result_folder)
+        self._ensure_result_csv(csv_path)
+        threshold = int(self.settings.hybrid_cpu_torsions)
+        cpu_jobs: list[dict[str, str]] = []
+        gpu_jobs: list[dict[str, str]] = []
+        for job in jobs:
+            if job["macrocycle"] or job["torsdof"] >= threshold:
+                cpu_jobs.append(job)
+            else:
+                gpu_jobs.append(job)
+        # Any ligand may reach the CPU side through stealing, so every target needs its maps.
+        self._attach_receptor_maps(jobs)
+        pool = _GpuWorkPool(gpu_jobs, cpu_jobs)
+        devices = self._gpu_devices()
+        cpu_workers = max(1, int(self.settings.cpu_parallelism))
+        cpu_per_process = self._cpu_threads_per_process()
+        self.progress_text.emit(
+            f"Hybrid run: {total} docking job(s), {len(cpu_jobs)} routed to the CPU first "
+            f"(TORSDOF >= {threshold} or macrocycle), {len(gpu_jobs)} to the GPU in batches on {len(devices)} device(s), "
+            f"{cpu_workers} CPU Vina process(es) with {cpu_per_process} thread(s) each."
+        )
+
+        # As in _run_gpu_jobs, only this thread writes the CSV and emits signals.
+        events: queue.Queue = queue.Queue()
+
+        def gpu_loop(device: tuple[int, int, str], work_dir: str) -> None:
+            tag = f"GPU P{device[0]}:D{device[1]}"
+            try:
+                self._gpu_device_pipeline(
+                    result_folder,
+                    pool,
+                    device,
+                    work_dir,
+                    on_start=lambda batch: events.put(("start", tag, batch, None)),
+                    on_done=lambda batch, result: events.put(("gpu", tag, batch, result)),
+                    on_ligand=lambda ligand_name: events.put(("ligand", tag, [], ligand_name)),
+                )
+            finally:
+                events.put(("exit", "", [], None))
+
+        def cpu_loop() -> None:
+            try:
+                while self.control.checkpoint():
+                    job = pool.take_cpu_job()
+                    if job is None:
+                        break
+                    self.ledger.mark_running([self._pair_key(job)])
+                    try:
+                        outcome = self._run_cpu_job([job], cpu_per_process)
+                    except Exception as exc:
+                        outcome = [(job, 1, f"CPU docking raised {type(exc).__name__}: {exc}")]
+                    events.put(("cpu", "CPU", [job], outcome))
+            finally:
+                events.put(("exit", "", [], None))
+
+        threads = [
+            threading.Thread(target=gpu_loop, args=(device, work_dir), daemon=True) for device, work_dir in self._gpu_work_dirs(devices)
+        ]
+        threads += [threading.Thread(target=cpu_loop, daemon=True) for _ in range(cpu_workers)]
+        for thread in threads:
+            thread.start()
+
+        completed = 0
+        docked_by = {"cpu": 0, "gpu": 0}
+        streamed: dict[str, set[str]] = {}
+        meter = _ThroughputMeter(total)
+        running = len(threads)
+        while running:
+            kind, tag, batch, result = events.get()
+            if kind == "exit":
+                running -= 1
+                continue
+            if kind == "start":
+                streamed[tag] = set()
+                self.ledger.mark_running(self._pair_key(job) for job in batch)
+                continue
+            if kind == "ligand":
+                streamed.setdefault(tag, set()).add(result)
+                self._emit_progress_stats(meter, completed + sum(len(names) for names in streamed.values()))
+                continue
+            if kind == "gpu":
+                streamed.pop(tag, None)
+                if result.returncode != 0:
+                    self.progress_text.emit(
+                        f"[{tag}] Vina-GPU exited with code {result.returncode} on {batch[0]['target_name']}/{batch[0]['ligand_group']}; "
+                        "keeping the ligands it finished."
+                    )
+                output_dir = os.path.join(result_folder, batch[0]["target_name"], batch[0]["ligand_group"])
+                self._harvest_gpu_outputs(csv_path, output_dir, batch, result.stdout)
+            else:
+                job, returncode, log = result[0]
+                if returncode != 0:
+                    self._record_failure(job, log)
+                else:
+                    self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+            completed += len(batch)
+            docked_by[kind] += len(batch)
+            self.progress_value.emit(int(completed * 100 / max(total, 1)))
+            self._emit_progress_stats(meter, completed + sum(len(names) for names in streamed.values()))
             self.progress_text.emit(
-                f"Running {self.docking_type} docking on {job['ligand_name']} against {job['target_name']} "
-                f"({index}/{total})"
+                f"[{tag}] Finished {len(batch)} ligand(s) against {batch[0]['target_name']} "
+                f"({completed}/{total}; GPU {docked_by['gpu']}, CPU {docked_by['cpu']})"
             )
-            result = subprocess.run([self.vina, "--config", config_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            if result.returncode != 0:
-                raise RuntimeError(
-                    f"Docking failed for ligand {job['ligand_name']} and target {job['target_name']}:\n{result.stdout}"
-                )
-            if self.settings.split_results and os.path.isfile(self.vina_split):
-                subprocess.run([self.vina_split, "--input", job["output_file"]], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+        for thread in threads:
+            thread.join()
 
-    def _run_gpu_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
-        grouped: dict[tuple[str, str], list[dict[str, str]]] = {}
-        for job in jobs:
-            grouped.setdefault((job["target_name"], job["ligand_group"]), []).append(job)
-
-        total = len(grouped)
+    def _run_distributed_jobs(self, result_folder: str, jobs: list[dict[str, str]]) -> None:
+        """Lease the jobs to codoc-worker processes through a TCP coordinator."""
+        total = len(jobs)
         csv_path = self._run_csv_path(result_folder)
         self._ensure_result_csv(csv_path)
-        self.progress_text.emit(
-            f"Using OpenCL selection: platform_id={self.settings.opencl_platform_id} "
-            f"device_id={self.settings.opencl_device_id}"
+        params = {
+            "scoring": self.settings.scoring_function,
+            "docking_mode": self.settings.docking_mode,
+            "exhaustiveness": self.settings.exhaustiveness,
+            "poses": self.settings.poses,
+            "min_rmsd": self.settings.min_rmsd,
+            "energy_range": self.settings.energy_range,
+            "seed": self.settings.seed,
+            "spacing": self.settings.spacing,
+            "pair_timeout": self.settings.pair_timeout,
+            "pair_timeout_per_torsion": self.settings.pair_timeout_per_torsion,
+            "flexible": self.docking_type == "Flexible",
+        }
+        coordinator = Coordinator(
+            jobs,
+            params,
+            batch_size=max(1, int(self.settings.cpu_batch_size)),
+            port=int(self.settings.distributed_port),
+            token=self.settings.distributed_token,
+            lease_timeout=max(10, int(self.settings.distributed_lease_timeout)),
+            max_attempts=max(0, int(self.settings.max_retries)) + 1,
         )
-        for index, ((target_name, ligand_group), group_jobs) in enumerate(grouped.items(), start=1):
-            ligand_dir = str(Path(group_jobs[0]["ligand_file"]).parent)
-            output_dir = os.path.join(result_folder, target_name, ligand_group)
-            config_path = os.path.join(output_dir, "gpu_config.txt")
-            self._write_gpu_config(config_path, group_jobs[0], ligand_dir, output_dir)
-            self.progress_text.emit(f"Running GPU docking on group {ligand_group} against {target_name} ({index}/{total})")
-            result = subprocess.run(
-                [self.vina_gpu, "--config", config_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                cwd=self.app_dir,
-            )
-            if result.returncode != 0:
-                raise RuntimeError(f"GPU docking failed for {target_name}/{ligand_group}:\n{result.stdout}")
-
-            for job in group_jobs:
-                flat_output = os.path.join(output_dir, f"{job['ligand_name']}_out.pdbqt")
-                if not os.path.isfile(flat_output):
-                    alt_output = os.path.join(output_dir, f"{job['ligand_name']}.pdbqt")
-                    if os.path.isfile(alt_output):
-                        flat_output = alt_output
-                    else:
+        local_workers: list[subprocess.Popen] = []
+        with coordinator:
+            command = [sys.executable, "-m", "MODULES.module_distributed", "--port", str(coordinator.port)]
+            if self.settings.distributed_token:
+                command += ["--token", self.settings.distributed_token]
+                self.progress_text.emit(
+                    f"Coordinator serving {total} docking job(s) on port {coordinator.port}. Start workers from a CODOC "
+                    f"checkout with: python3 {' '.join(command[1:3])} --host {platform.node()} --port {coordinator.port} --token <token>"
+                )
+            else:
+                self.progress_text.emit(
+                    f"Coordinator serving {total} docking job(s) on 127.0.0.1:{coordinator.port} to local workers only; "
+                    "set a worker token to accept workers from other machines."
+                )
+            for index in range(max(0, int(self.settings.distributed_local_workers))):
+                local_workers.append(
+                    subprocess.Popen(
+                        command + ["--host", "127.0.0.1", "--vina", self.vina, "--cpu", str(self._cpu_threads_per_process()), "--name", f"local{index + 1}"],
+                        cwd=self.app_dir,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        start_new_session=True,
+                    )
+                )
+            try:
+                completed = 0
+                while not coordinator.finished():
+                    # Paused or cancelled: lease nothing new.
+                    coordinator.hold(self.control.paused)
+                    if self.control.cancelled:
+                        coordinator.drain()
+                        if self.control.killed:
+                            break
+                    event = coordinator.next_event(timeout=1.0)
+                    if event is None:
                         continue
-                os.makedirs(job["output_dir"], exist_ok=True)
-                shutil.move(flat_output, job["output_file"])
-                self._append_csv_result(csv_path, target_name, ligand_group, job["ligand_name"], job["output_file"])
+                    kind, payload, data, worker = event
+                    if kind == "lease":
+                        self.ledger.mark_running(self._pair_key(job) for job in payload)
+                        self.progress_text.emit(
+                            f"[{worker}] Leased {len(payload)} ligand(s) of {payload[0]['ligand_group']} against {payload[0]['target_name']}"
+                        )
+                        continue
+                    job = payload
+                    completed += 1
+                    self.progress_value.emit(int(completed * 100 / max(total, 1)))
+                    if kind == "failed":
+                        self._record_failure(job, data)
+                        continue
+                    os.makedirs(job["output_dir"], exist_ok=True)
+                    with open(job["output_file"], "wb") as handle:
+                        handle.write(data)
+                    self._split_cpu_output(job)
+                    self._append_csv_result(csv_path, job["target_name"], job["ligand_group"], job["ligand_name"], job["output_file"])
+                    self.progress_text.emit(
+                        f"[{worker}] Finished {self.docking_type} docking of {job['ligand_name']} against {job['target_name']} "
+                        f"({completed}/{total})"
+                    )
+            finally:
+                for process in local_workers:
+                    if self.control.killed:
+                        # The worker's own Vina process is in its session too.
+                        signal_process_group(process, signal.SIGKILL)
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
 
-    def _write_cpu_config(self, config_path: str, job: dict[str, str]) -> None:
-        lines = [
-            f"receptor = {job['receptor']}",
-            f"ligand = {job['ligand_file']}",
+    def _write_cpu_config(
+        self,
+        config_path: str,
+        job: dict[str, str],
+        cpu_threads: Optional[int] = None,
+        batch_dir: str = "",
+        exhaustiveness: Optional[int] = None,
+        seed: Optional[int] = None,
+        output_file: str = "",
+        ligand_file: str = "",
+        docking_mode: str = "",
+    ) -> None:
+        # Vina refuses a rigid receptor together with precomputed maps (flex is still allowed).
+        lines = [f"maps = {job['maps']}" if job.get("maps") else f"receptor = {job['receptor']}"]
+        if self.docking_type == "Flexible":
+            lines.append(f"flex = {job['flex_receptor']}")
+        if batch_dir:
+            lines.append(f"dir = {batch_dir}")
+        else:
+            lines.append(f"ligand = {ligand_file or job['ligand_file']}")
+        lines += [
             f"scoring = {self.settings.scoring_function}",
             f"center_x = {job['center_x']}",
             f"center_y = {job['center_y']}",
@@ -571,24 +2651,31 @@ class DockingWorker(QThread):
             f"size_x = {job['size_x']}",
             f"size_y = {job['size_y']}",
             f"size_z = {job['size_z']}",
-            f"out = {job['output_file']}",
-            f"cpu = {self.settings.cpu_threads}",
-            f"exhaustiveness = {self.settings.exhaustiveness}",
+        ]
+        if not batch_dir:
+            lines.append(f"out = {output_file or job['output_file']}")
+        lines += [
+            f"cpu = {cpu_threads or self.settings.cpu_threads}",
+            f"exhaustiveness = {exhaustiveness or job['exhaustiveness']}",
             f"num_modes = {self.settings.poses}",
             f"min_rmsd = {self.settings.min_rmsd}",
             f"energy_range = {self.settings.energy_range}",
             f"spacing = {self.settings.spacing}",
         ]
-        if self.settings.docking_mode == "score_only":
+        seed = int(self.settings.seed) if seed is None else seed
+        if seed:
+            lines.append(f"seed = {seed}")
+        docking_mode = docking_mode or self.settings.docking_mode
+        if docking_mode == "score_only":
             lines.append("score_only = true")
-        elif self.settings.docking_mode == "local_only":
+        elif docking_mode == "local_only":
             lines.append("local_only = true")
-        if self.docking_type == "Flexible":
-            lines.insert(1, f"flex = {job['flex_receptor']}")
         with open(config_path, "w", encoding="utf-8") as handle:
             handle.write("\n".join(lines) + "\n")
 
-    def _write_gpu_config(self, config_path: str, job: dict[str, str], ligand_dir: str, output_dir: str) -> None:
+    def _write_gpu_config(
+        self, config_path: str, job: dict[str, str], ligand_dir: str, output_dir: str, platform_id: int = -1, device_id: int = -1
+    ) -> None:
         lines = [
             f"receptor = {job['receptor']}",
             f"ligand_directory = {ligand_dir}",
@@ -600,12 +2687,14 @@ class DockingWorker(QThread):
             f"size_x = {job['size_x']}",
             f"size_y = {job['size_y']}",
             f"size_z = {job['size_z']}",
-            f"thread = {self.settings.gpu_threads}",
+            f"thread = {job['gpu_threads']}",
         ]
-        if self.settings.opencl_platform_id >= 0:
-            lines.append(f"platform_id = {self.settings.opencl_platform_id}")
-        if self.settings.opencl_device_id >= 0:
-            lines.append(f"device_id = {self.settings.opencl_device_id}")
+        if int(self.settings.seed):
+            lines.append(f"seed = {self.settings.seed}")
+        if platform_id >= 0:
+            lines.append(f"platform_id = {platform_id}")
+        if device_id >= 0:
+            lines.append(f"device_id = {device_id}")
         if self.docking_type == "Flexible":
             lines.insert(1, f"flex = {job['flex_receptor']}")
         with open(config_path, "w", encoding="utf-8") as handle:
@@ -622,10 +2711,152 @@ class DockingWorker(QThread):
             writer.writerow(RESULT_CSV_HEADER)
 
     def _append_csv_result(self, csv_path: str, target_name: str, ligand_group: str, ligand_name: str, output_file: str) -> None:
+        for duplicate in self.duplicates.pop((target_name, ligand_group, ligand_name), []):
+            link_or_copy(output_file, duplicate["output_file"])
+            self._split_cpu_output(duplicate)
+            self._append_csv_result(csv_path, target_name, duplicate["ligand_group"], duplicate["ligand_name"], duplicate["output_file"])
+        if self.result_writer is not None:
+            cache_key = self.cache_keys.get((target_name, ligand_group, ligand_name), "")
+            self.result_writer.submit(target_name, ligand_group, ligand_name, output_file, cache_key)
+            return
         energy, rmsd_mean, smiles = _parse_vina_pose_data(output_file)
         with open(csv_path, "a", encoding="utf-8", newline="") as handle:
             writer = csv.writer(handle)
             writer.writerow([ligand_name, smiles, ligand_group, target_name, energy, rmsd_mean])
+        if self.ledger is not None:
+            self.ledger.mark_done((target_name, ligand_group, ligand_name), energy)
+
+
+class RescoreWorker(DockingWorker):
+    """Bulk score_only rescoring of existing poses (see MODULES/module_rescore.py)."""
+
+    CHUNK_SIZE = 256
+
+    def __init__(
+        self,
+        app_dir: str,
+        targets_dir: str,
+        results_dir: str,
+        job_name: str,
+        settings: DockingSettings,
+        scoring_functions: list[str],
+        docking_type: str = "Rigid",
+        poses_dir: str = "",
+        target_name: str = "",
+    ) -> None:
+        super().__init__(app_dir, "", targets_dir, results_dir, job_name, settings, docking_type, "CPU", "RESTART")
+        self.scoring_functions = scoring_functions
+        self.poses_dir = poses_dir
+        self.target_name = target_name
+
+    def run(self) -> None:
+        try:
+            if Vina is None:
+                raise RuntimeError("The vina Python module is not available in the current environment. Install vina to rescore poses.")
+            if self.docking_type == "Flexible":
+                raise RuntimeError("Rescoring scores poses against rigid receptors; flexible-residue poses are not supported.")
+            poses = self._collect_poses()
+            total = sum(len(target_poses) for target_poses in poses.values())
+            if not total:
+                self.finished_ok.emit(f"No pose files to rescore in {self.poses_dir or self.results_dir}.")
+                return
+            scores = self._rescore(poses, total)
+            if self.poses_dir:
+                pose_files = {key: pose_file for target_poses in poses.values() for key, pose_file in target_poses}
+                output = write_rescored_csv(self.poses_dir, scores, pose_files, self.scoring_functions)
+            else:
+                output = self._run_csv_path(self.results_dir)
+                if not os.path.isfile(output):
+                    rebuild_result_csv(self.results_dir, self.job_name)
+                merge_scores(output, scores, self.scoring_functions)
+            state = "cancelled after" if self.control.cancelled else "finished:"
+            self.finished_ok.emit(
+                f"Rescoring {state} {len(scores)} of {total} pose(s) scored with {', '.join(self.scoring_functions)}. Scores written to {output}."
+            )
+        except Exception as exc:
+            self.failed.emit(str(exc))
+
+    def _collect_poses(self) -> dict[str, list[tuple[tuple[str, str, str], str]]]:
+        """{target: [((target, databank, ligand), pose file)]} of the job folder or the pose folder."""
+        poses: dict[str, list[tuple[tuple[str, str, str], str]]] = {}
+        if self.poses_dir:
+            if not self.target_name or not os.path.isdir(os.path.join(self.targets_dir, self.target_name)):
+                raise RuntimeError(f"Choose a prepared target to rescore the poses of {self.poses_dir} against.")
+            for folder, _dirs, files in os.walk(self.poses_dir):
+                group = os.path.relpath(folder, self.poses_dir)
+                group = "" if group == "." else group
+                for name in sorted(files):
+                    if name.endswith(".pdbqt"):
+                        key = (self.target_name, group, name[: -len(".pdbqt")])
+                        poses.setdefault(self.target_name, []).append((key, os.path.join(folder, name)))
+            return poses
+        for target_dir in sorted(path for path in Path(self.results_dir).glob("*/") if path.is_dir()):
+            for group_dir in sorted(path for path in target_dir.glob("*/") if path.is_dir()):
+                for ligand_dir in sorted(path for path in group_dir.glob("*/") if path.is_dir()):
+                    pose_file = ligand_dir / f"{ligand_dir.name}.pdbqt"
+                    if pose_file.is_file():
+                        key = (target_dir.name, group_dir.name, ligand_dir.name)
+                        poses.setdefault(target_dir.name, []).append((key, str(pose_file)))
+        return poses
+
+    def _rescore(self, poses: dict[str, list[tuple[tuple[str, str, str], str]]], total: int) -> dict[tuple[str, str, str], dict[str, str]]:
+        scores: dict[tuple[str, str, str], dict[str, str]] = {}
+        parallelism = max(1, int(self.settings.cpu_threads))
+        mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        meter = _ThroughputMeter(total)
+        done_poses = 0
+        for target_name, target_poses in poses.items():
+            if self.control.cancelled:
+                break
+            target_path = Path(self.targets_dir, target_name)
+            if not target_path.is_dir():
+                self.progress_text.emit(f"Skipping {len(target_poses)} pose(s) of {target_name}: the target is no longer in {self.targets_dir}.")
+                continue
+            job = {"target_name": target_name, "target_dir": str(target_path), **self._target_requirements(target_path)}
+            maps: dict[str, str] = {}
+            if "ad4" in self.scoring_functions:
+                base_settings = self.settings
+                self.settings = replace(base_settings, scoring_function="ad4")
+                try:
+                    maps["ad4"] = self._ensure_receptor_maps(job)
+                finally:
+                    self.settings = base_settings
+            options = {
+                "functions": self.scoring_functions,
+                "receptor": job["receptor"],
+                "center": [float(job["center_x"]), float(job["center_y"]), float(job["center_z"])],
+                "size": [float(job["size_x"]), float(job["size_y"]), float(job["size_z"])],
+                "spacing": self.settings.spacing,
+                "maps": maps,
+            }
+            self.progress_text.emit(
+                f"Rescoring {len(target_poses)} pose(s) against {target_name} with {', '.join(self.scoring_functions)} "
+                f"in {parallelism} worker process(es)..."
+            )
+            chunks = (target_poses[start:start + self.CHUNK_SIZE] for start in range(0, len(target_poses), self.CHUNK_SIZE))
+            in_flight: set[Future] = set()
+            with self.control.process_pool(parallelism, mp_context, _rescore_worker_init, (options,)) as executor:
+                while True:
+                    while len(in_flight) < parallelism * 2 and self.control.checkpoint():
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        in_flight.add(executor.submit(_rescore_worker, chunk))
+                    self.control.attach_pool(executor)
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results = future.result()
+                        scores.update(results)
+                        done_poses += len(results)
+                    self.progress_value.emit(int(done_poses * 100 / total))
+                    stats = meter.update(done_poses, 10.0, force=done_poses >= total)
+                    if stats is not None:
+                        eta = "unknown" if stats["eta"] is None else _format_duration(stats["eta"])
+                        self.progress_text.emit(f"Rescored {done_poses}/{total} pose(s), {stats['rate']:.0f} poses/min, ETA {eta}.")
+            self.control.detach_pool(executor)
+        return scores
 
 
 # --------------------------------------------------------------------------------------
@@ -707,6 +2938,33 @@ def _lig_mol_from_file(file_path: Path) -> Optional[Any]:
     return None
 
 
+def _lig_pdbqt_inchikey(path: str) -> str:
+    """InChIKey of a ligand PDBQT from its "REMARK SMILES" line; "" when it has none or RDKit fails."""
+    smiles = ""
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as handle:
+            for line in handle:
+                if line.startswith("REMARK SMILES"):
+                    smiles = line.split("REMARK SMILES", 1)[1].strip()
+                    break
+                if line.startswith(("ATOM", "HETATM")):
+                    break
+    except OSError:
+        return ""
+    mol = Chem.MolFromSmiles(smiles) if smiles else None
+    if mol is None:
+        return ""
+    try:
+        return Chem.MolToInchiKey(mol) or ""
+    except Exception:
+        return ""
+
+
+def _lig_inchikey_worker(paths: list[str]) -> list[tuple[str, str]]:
+    """(path, InChIKey) for a chunk of ligand PDBQT files; runs in a worker process."""
+    return [(path, _lig_pdbqt_inchikey(path)) for path in paths]
+
+
 def _lig_canonical_smiles(mol: Any) -> str:
     return Chem.MolToSmiles(mol, canonical=True) if mol is not None else ""
 
@@ -908,6 +3166,7 @@ class LigandToolsWorker(QThread):
         self.empty_dir = os.path.join(conversion_dir, "EMPTY_LIGANDS")
         self.dataframes_dir = os.path.join(conversion_dir, "DATAFRAMES")
         self.macrocycles_dir = os.path.join(conversion_dir, "MACROCYCLES")
+        self.control = RunControl()
 
     def run(self) -> None:
         try:
@@ -922,16 +3181,21 @@ class LigandToolsWorker(QThread):
                 "reject_pdbqt": self._reject_invalid_pdbqt,
                 "recover_pdbqt": self._recover_failed_pdbqt,
                 "fix_macrocycles": self._fix_macrocycles,
+                "find_duplicates": self._find_duplicate_ligands,
             }
             handler = operations.get(self.operation)
             if handler is None:
                 raise RuntimeError(f"Unsupported ligand operation: {self.operation}")
             message = handler()
             self.finished_ok.emit(message)
+        except RunCancelled as exc:
+            self.finished_ok.emit(f"{exc} Files handled before the cancel were kept; run the action again to finish.")
         except Exception as exc:
             self.failed.emit(str(exc))
 
     def _emit_progress(self, index: int, total: int, text: str) -> None:
+        # Every loop reports before its next item, so this is where a pause waits and a cancel stops.
+        self.control.raise_if_cancelled()
         value = int(index * 100 / max(total, 1))
         self.progress_value.emit(value)
         self.progress_text.emit(text)
@@ -1040,7 +3304,7 @@ class LigandToolsWorker(QThread):
         return molecules
 
     def _split_multimodel_files(self) -> str:
-        root_files = [path for path in sorted(Path(self.ligands_dir).iterdir()) if path.is_file()]
+        root_files = [path for path in sorted(Path(self.ligands_dir).iterdir()) if path.is_file() and not is_inchikey_index(str(path))]
         if not root_files:
             return "No multi-model ligand files were found in the ligands root directory."
 
@@ -1282,41 +3546,61 @@ class LigandToolsWorker(QThread):
         self.progress_text.emit(
             f"Converting {total} ligand(s) to PDBQT using {selected_engine} with {workers} parallel worker process(es)..."
         )
-        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
-            future_map = {
-                executor.submit(
-                    _lig_convert_worker,
-                    (
-                        str(input_path),
-                        str(output_path),
-                        group_name,
-                        selected_engine,
-                        self.settings.ph,
-                        self.settings.minimization_steps,
-                        self.settings.minimization_forcefield,
-                        self.settings.minimization_algorithm,
-                    ),
-                ): (input_path, group_name)
-                for input_path, output_path, group_name in jobs
-            }
-            for future in as_completed(future_map):
-                input_path, group_name = future_map[future]
-                counter += 1
-                try:
-                    _, error = future.result()
-                except Exception as exc:
-                    error = f"Worker process failed for {input_path.name}: {exc}"
-                self._emit_progress(counter, total, f"Converting {input_path.name} to PDBQT using {selected_engine}")
-                if error is not None:
-                    failure_group = Path(self.failure_dir) / group_name
-                    failure_group.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(str(input_path), failure_group / input_path.name)
-                    self.progress_text.emit(error)
-
+        processed: set[Path] = set()
+        pending = iter(jobs)
+        in_flight: dict[Future, tuple[Path, str]] = {}
+        with self.control.process_pool(workers, mp_context) as executor:
+            while True:
+                # Fed two per worker, so a pause or a cancel takes effect after the ligands handed out.
+                while len(in_flight) < workers * 2 and self.control.checkpoint():
+                    item = next(pending, None)
+                    if item is None:
+                        break
+                    input_path, output_path, group_name = item
+                    future = executor.submit(
+                        _lig_convert_worker,
+                        (
+                            str(input_path),
+                            str(output_path),
+                            group_name,
+                            selected_engine,
+                            self.settings.ph,
+                            self.settings.minimization_steps,
+                            self.settings.minimization_forcefield,
+                            self.settings.minimization_algorithm,
+                        ),
+                    )
+                    in_flight[future] = (input_path, group_name)
+                self.control.attach_pool(executor)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    input_path, group_name = in_flight.pop(future)
+                    processed.add(input_path)
+                    counter += 1
+                    try:
+                        _, error = future.result()
+                    except Exception as exc:
+                        error = f"Worker process failed for {input_path.name}: {exc}"
+                    self.progress_value.emit(int(counter * 100 / max(total, 1)))
+                    self.progress_text.emit(f"Converting {input_path.name} to PDBQT using {selected_engine}")
+                    if error is not None:
+                        failure_group = Path(self.failure_dir) / group_name
+                        failure_group.mkdir(parents=True, exist_ok=True)
+                        shutil.copy2(str(input_path), failure_group / input_path.name)
+                        self.progress_text.emit(error)
+        self.control.detach_pool(executor)
+
+        cancelled = self.control.cancelled
         for folder in ligand_dirs:
             for file_path in sorted(folder.iterdir()):
                 if file_path.is_file() and file_path.suffix.lower() != ".pdbqt":
-                    self._archive_original_file(file_path)
+                    # After a cancel only the converted inputs are archived; the rest stay for the next run.
+                    if not cancelled or file_path in processed:
+                        self._archive_original_file(file_path)
+        if cancelled:
+            raise RunCancelled(f"PDBQT conversion cancelled after {counter} of {total} ligand(s).")
         return (
             f"Ligand conversion to PDBQT completed ({total} file(s), {workers} worker process(es)). "
             f"Original files were moved to {self.originals_dir}."
@@ -1518,6 +3802,294 @@ class LigandToolsWorker(QThread):
                 file_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
         return f"Macrocyclic ring fixes completed. Backups are in {self.macrocycles_dir}."
 
+    def _find_duplicate_ligands(self) -> str:
+        """Index the InChIKey of every ligand PDBQT; files unchanged since the last run keep their key."""
+        _lig_require_rdkit()
+        previous = read_inchikey_index(self.ligands_dir)
+        entries: dict[tuple[str, str], tuple[str, tuple[int, int]]] = {}
+        todo: list[tuple[str, tuple[str, str], tuple[int, int]]] = []
+        for folder in sorted(path for path in Path(self.ligands_dir).glob("*/") if path.is_dir()):
+            for file_path in sorted(folder.glob("*.pdbqt")):
+                ligand = (folder.name, file_path.stem)
+                signature = file_signature(str(file_path))
+                known = previous.get(ligand)
+                if known is not None and known[1] == signature:
+                    entries[ligand] = known
+                else:
+                    todo.append((str(file_path), ligand, signature))
+        reused = len(entries)
+        total = len(todo)
+        workers = max(1, int(self.settings.conversion_workers or 1))
+        chunk_size = 256
+        chunks = [todo[start:start + chunk_size] for start in range(0, total, chunk_size)]
+        self.progress_text.emit(
+            f"Computing InChIKeys of {total} ligand(s) with {workers} worker process(es); {reused} unchanged ligand(s) keep theirs."
+        )
+        mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        missing = 0
+        counter = 0
+        pending = iter(chunks)
+        in_flight: dict[Future, list[tuple[str, tuple[str, str], tuple[int, int]]]] = {}
+        with self.control.process_pool(workers, mp_context) as executor:
+            while True:
+                while len(in_flight) < workers * 2 and self.control.checkpoint():
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    in_flight[executor.submit(_lig_inchikey_worker, [path for path, _, _ in chunk])] = chunk
+                self.control.attach_pool(executor)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    keys = dict(future.result())
+                    for path, ligand, signature in chunk:
+                        if keys.get(path):
+                            entries[ligand] = (keys[path], signature)
+                        else:
+                            missing += 1
+                    counter += len(chunk)
+                    self.progress_value.emit(int(counter * 100 / max(total, 1)))
+                    self.progress_text.emit(f"InChIKeys computed for {counter}/{total} ligand(s)")
+        self.control.detach_pool(executor)
+        # Keys computed before a cancel are kept, so the next run only does the rest.
+        index_path = write_inchikey_index(self.ligands_dir, entries)
+        if self.control.cancelled:
+            raise RunCancelled(f"InChIKey indexing cancelled after {counter} of {total} ligand(s).")
+        duplicates = duplicate_sets((ligand, inchikey) for ligand, (inchikey, _) in entries.items())
+        redundant = sum(len(ligands) - 1 for ligands in duplicates.values())
+        for inchikey, ligands in list(duplicates.items())[:20]:
+            self.progress_text.emit(f"{inchikey}: {', '.join(f'{group}/{name}' for group, name in ligands)}")
+        message = (
+            f"{len(entries)} ligand(s) indexed in {index_path}: {len(entries) - redundant} unique structure(s), "
+            f"{redundant} duplicate(s) in {len(duplicates)} set(s). With 'Collapse duplicates' on, each structure "
+            "is docked once per target and its result is copied to every duplicate."
+        )
+        if missing:
+            message += f" {missing} ligand(s) without a usable REMARK SMILES line are always docked on their own."
+        return message
+
+
+# --------------------------------------------------------------------------------------
+# Job, target and result helpers shared by MainWindow and the headless command line.
+# --------------------------------------------------------------------------------------
+
+LIGAND_OPERATIONS = (
+    "split_multimodel",
+    "split_large_folders",
+    "generate_lipinski",
+    "druggability_filter",
+    "move_empty",
+    "convert_pdbqt",
+    "reject_pdbqt",
+    "recover_pdbqt",
+    "fix_macrocycles",
+    "find_duplicates",
+)
+
+GridValues = tuple[float, tuple[int, int, int], tuple[float, float, float]]
+
+
+def generate_job_name(settings: DockingSettings) -> str:
+    scoring = (settings.scoring_function or "vina").strip().upper()
+    docking_type = (settings.docking_type or "Rigid").strip().upper()
+    processing_type = (settings.processing_type or "CPU").strip().upper()
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    return f"{timestamp}_{scoring}_{docking_type}_{processing_type}"
+
+
+def write_job_settings_snapshots(
+    docking_dir: str,
+    conversion_dir: str,
+    settings: DockingSettings,
+    ligand_settings: LigandSettings,
+) -> None:
+    """Write the settings active right now next to the results they will produce, so each
+    job folder carries its own record of what configuration was used (in addition to the
+    shared .codoc_settings.json used to restore the UI on the next app launch)."""
+    try:
+        with open(os.path.join(conversion_dir, "ligand_settings.json"), "w", encoding="utf-8") as handle:
+            json.dump(asdict(ligand_settings), handle, indent=2)
+        with open(os.path.join(docking_dir, "docking_settings.json"), "w", encoding="utf-8") as handle:
+            json.dump(asdict(settings), handle, indent=2)
+    except OSError:
+        pass
+
+
+def create_job(jobs_dir: str, settings: DockingSettings, ligand_settings: LigandSettings) -> str:
+    """Create a new job folder (DOCKING and CONVERSION plus settings snapshots); returns its name."""
+    os.makedirs(jobs_dir, exist_ok=True)
+    base_name = generate_job_name(settings)
+    job_name = base_name
+    counter = 1
+    while os.path.isdir(os.path.join(jobs_dir, job_name)):
+        job_name = f"{base_name}_{counter}"
+        counter += 1
+    docking_dir = os.path.join(jobs_dir, job_name, "DOCKING")
+    conversion_dir = os.path.join(jobs_dir, job_name, "CONVERSION")
+    os.makedirs(docking_dir, exist_ok=True)
+    os.makedirs(conversion_dir, exist_ok=True)
+    write_job_settings_snapshots(docking_dir, conversion_dir, settings, ligand_settings)
+    return job_name
+
+
+def log_ligand_action(conversion_dir: str, operation: str) -> None:
+    """Append a record of a successfully completed Step 2 action, so the Final Report
+    (Step 5) can later tell which conversion actions actually ran for this job."""
+    try:
+        os.makedirs(conversion_dir, exist_ok=True)
+        with open(os.path.join(conversion_dir, "actions.log"), "a", encoding="utf-8") as handle:
+            handle.write(f"{datetime.now().isoformat(timespec='seconds')}\t{operation}\tOK\n")
+    except OSError:
+        pass
+
+
+def safe_target_name(value: str) -> str:
+    cleaned = re.sub(r"[^A-Za-z0-9_.-]+", "_", value.strip())
+    return cleaned.strip("._") or "target"
+
+
+def copy_if_different(src: str, dst: str) -> None:
+    """Merge into an existing target folder instead of crashing when the selected source
+    file already is the destination file (e.g. Target name matches the folder the picked
+    file already lives in)."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    shutil.copy2(src, dst)
+
+
+def grid_values_from_settings(settings: DockingSettings) -> GridValues:
+    return (
+        settings.spacing,
+        (settings.grid_x_size, settings.grid_y_size, settings.grid_z_size),
+        (settings.grid_x_center, settings.grid_y_center, settings.grid_z_center),
+    )
+
+
+def write_grid_file(grid_path: str, target_name: str, grid: GridValues) -> None:
+    spacing, npts, center = grid
+    with open(grid_path, "w", encoding="utf-8") as handle:
+        handle.write(
+            f"{target_name}\n"
+            f"spacing\t{spacing}\n"
+            f"npts\t{npts[0]}\t{npts[1]}\t{npts[2]}\n"
+            f"center\t{center[0]}\t{center[1]}\t{center[2]}\n"
+        )
+
+
+def _install_grid(target_dir: str, target_name: str, grid_file: str, grid: GridValues) -> None:
+    grid_path = os.path.join(target_dir, "grid.txt")
+    if grid_file and os.path.isfile(grid_file):
+        copy_if_different(grid_file, grid_path)
+    else:
+        write_grid_file(grid_path, target_name, grid)
+
+
+def register_flexible_target(
+    targets_dir: str,
+    rigid_file: str,
+    flex_file: str,
+    target_name: str,
+    grid_file: str,
+    grid: GridValues,
+) -> str:
+    """Copy a prepared protein_rigid/protein_flex pair into TARGETS; returns the target folder."""
+    target_base = target_name or Path(rigid_file).stem.replace("protein_rigid", "").strip("_-") or "flex_target"
+    target_base = safe_target_name(target_base)
+    target_dir = os.path.join(targets_dir, target_base)
+    os.makedirs(target_dir, exist_ok=True)
+    copy_if_different(rigid_file, os.path.join(target_dir, "protein_rigid.pdbqt"))
+    copy_if_different(flex_file, os.path.join(target_dir, "protein_flex.pdbqt"))
+    _install_grid(target_dir, target_base, grid_file, grid)
+    return target_dir
+
+
+def primary_targets(targets_dir: str) -> list[str]:
+    """Targets marked as the primary target of a selectivity cascade."""
+    return [path.name for path in sorted(Path(targets_dir).glob("*/")) if (path / PRIMARY_TARGET_MARKER).is_file()]
+
+
+def target_ensembles(target_names: Iterable[str]) -> dict[str, list[str]]:
+    """{reference target: other conformations} of pockets prepared as <pocket>_<n>; the lowest n is the reference."""
+    by_pocket: dict[str, list[tuple[int, str]]] = {}
+    for name in target_names:
+        match = re.fullmatch(r"(.+)_(\d+)", name)
+        if match:
+            by_pocket.setdefault(match.group(1), []).append((int(match.group(2)), name))
+    ensembles: dict[str, list[str]] = {}
+    for conformations in by_pocket.values():
+        if len(conformations) > 1:
+            conformations.sort()
+            ensembles[conformations[0][1]] = [name for _, name in conformations[1:]]
+    return ensembles
+
+
+def set_primary_target(targets_dir: str, target_name: str) -> None:
+    """Make `target_name` the only primary target (no primary at all when it is empty)."""
+    if target_name and not os.path.isdir(os.path.join(targets_dir, target_name)):
+        raise RuntimeError(f"Target folder not found: {os.path.join(targets_dir, target_name)}")
+    for name in primary_targets(targets_dir):
+        if name != target_name:
+            os.remove(os.path.join(targets_dir, name, PRIMARY_TARGET_MARKER))
+    if target_name:
+        Path(targets_dir, target_name, PRIMARY_TARGET_MARKER).touch()
+
+
+def prepare_rigid_target(
+    targets_dir: str,
+    target_file: str,
+    target_name: str,
+    ph: float,
+    grid_file: str,
+    grid: GridValues,
+) -> tuple[str, Any]:
+    """Copy a receptor into TARGETS, protonate it at `ph` and write protein.pdbqt."""
+    target_base = safe_target_name(target_name or Path(target_file).stem)
+    target_dir = os.path.join(targets_dir, target_base)
+    os.makedirs(target_dir, exist_ok=True)
+    copied_target = os.path.join(target_dir, os.path.basename(target_file))
+    copy_if_different(target_file, copied_target)
+    _install_grid(target_dir, target_base, grid_file, grid)
+    prep_result = prepare_receptor_with_protonation(
+        input_path=copied_target,
+        output_pdbqt_path=os.path.join(target_dir, "protein.pdbqt"),
+        ph=ph,
+        venv_bin_dir=os.path.join(venv_paths("CODOC")["venv_dir"], "bin"),
+        log_path=os.path.join(target_dir, "protonation_log.txt"),
+    )
+    return target_dir, prep_result
+
+
+def run_csv_path(result_folder: str, result_name: str) -> str:
+    return os.path.join(result_folder, f"{result_name}.csv")
+
+
+def rebuild_result_csv(result_folder: str, result_name: str) -> str:
+    """Rescan every ligand PDBQT under a result folder and rewrite its unified CSV, keeping score columns."""
+    csv_path = run_csv_path(result_folder, result_name)
+    score_columns, score_values = read_score_columns(csv_path)
+    with open(csv_path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(RESULT_CSV_HEADER + score_columns)
+        for target_dir in sorted(p for p in Path(result_folder).glob("*/") if p.is_dir()):
+            target_name = target_dir.name
+            for group_dir in sorted(p for p in target_dir.glob("*/") if p.is_dir()):
+                ligand_group = group_dir.name
+                for ligand_dir in sorted(p for p in group_dir.glob("*/") if p.is_dir()):
+                    ligand_name = ligand_dir.name
+                    output_file = ligand_dir / f"{ligand_name}.pdbqt"
+                    if not output_file.is_file():
+                        continue
+                    energy, rmsd_mean, smiles = _parse_vina_pose_data(str(output_file))
+                    extra = score_values.get((target_name, ligand_group, ligand_name), {})
+                    writer.writerow([ligand_name, smiles, ligand_group, target_name, energy, rmsd_mean] + [extra.get(column, "") for column in score_columns])
+        # Pairs a selectivity cascade did not dock have no pose file; the ledger keeps them.
+        for target_name, ligand_group, ligand_name in sorted(read_pairs_in_state(result_folder, STATE_SKIPPED)):
+            writer.writerow([ligand_name, "", ligand_group, target_name, CASCADE_SKIPPED, ""])
+    return csv_path
+
+
 class MainWindow(QMainWindow):
     def __init__(self) -> None:
         super().__init__()
@@ -1576,15 +4148,20 @@ class MainWindow(QMainWindow):
     def _job_docking_dir(self, job_name: str) -> str:
         return os.path.join(self._job_dir(job_name), "DOCKING")
 
+    def _job_prescreen_dir(self, job_name: str) -> str:
+        return os.path.join(self._job_dir(job_name), PRESCREEN_DIRNAME)
+
+    def _job_results_stage_dir(self, job_name: str) -> str:
+        """Result folder of the stage picked in Step 5: DOCKING, or PRESCREEN for funnel stage 1."""
+        if hasattr(self, "cb_results_stage") and self.cb_results_stage.currentData() == PRESCREEN_DIRNAME:
+            return self._job_prescreen_dir(job_name)
+        return self._job_docking_dir(job_name)
+
     def _job_conversion_dir(self, job_name: str) -> str:
         return os.path.join(self._job_dir(job_name), "CONVERSION")
 
     def _generate_job_name(self) -> str:
-        scoring = (self.settings.scoring_function or "vina").strip().upper()
-        docking_type = (self.settings.docking_type or "Rigid").strip().upper()
-        processing_type = (self.settings.processing_type or "CPU").strip().upper()
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
-        return f"{timestamp}_{scoring}_{docking_type}_{processing_type}"
+        return generate_job_name(self.settings)
 
     def _set_current_job(self, job_name: str, create: bool = False) -> None:
         self.current_job_name = job_name
@@ -1596,16 +4173,7 @@ class MainWindow(QMainWindow):
             self._write_job_settings_snapshots()
 
     def _write_job_settings_snapshots(self) -> None:
-        """Write the settings active right now next to the results they will produce, so each
-        job folder carries its own record of what configuration was used (in addition to the
-        shared .codoc_settings.json used to restore the UI on the next app launch)."""
-        try:
-            with open(os.path.join(self.conversion_results_dir, "ligand_settings.json"), "w", encoding="utf-8") as handle:
-                json.dump(asdict(self.ligand_settings), handle, indent=2)
-            with open(os.path.join(self.results_dir, "docking_settings.json"), "w", encoding="utf-8") as handle:
-                json.dump(asdict(self.settings), handle, indent=2)
-        except OSError:
-            pass
+        write_job_settings_snapshots(self.results_dir, self.conversion_results_dir, self.settings, self.ligand_settings)
 
     def _create_new_job(self) -> str:
         os.makedirs(self.jobs_dir, exist_ok=True)
@@ -2158,10 +4726,121 @@ class MainWindow(QMainWindow):
         self.cb_scoring.addItems(["vina", "ad4", "vinardo"])
         self.cb_split = QComboBox()
         self.cb_split.addItems(["no", "yes"])
+        self.cb_multi_gpu = QComboBox()
+        self.cb_multi_gpu.addItems(["no", "yes"])
+        self.cb_multi_gpu.setToolTip("yes: run one Vina-GPU process on every detected OpenCL GPU, sharing the ligand batches.")
+        self.sp_hybrid_torsions = QSpinBox(); self.sp_hybrid_torsions.setRange(0, 64)
+        self.sp_hybrid_torsions.setToolTip(
+            "HYBRID processing only: ligands with at least this many torsions (TORSDOF), and all\n"
+            "macrocycles, are docked on the CPU first; the GPU takes the rest in batches."
+        )
         self.sp_cpu_threads = QSpinBox(); self.sp_cpu_threads.setRange(1, 512)
         self.sp_cpu_parallel = QSpinBox(); self.sp_cpu_parallel.setRange(1, 512)
+        self.sp_cpu_batch = QSpinBox(); self.sp_cpu_batch.setRange(1, 5000)
+        self.cb_cpu_engine = QComboBox(); self.cb_cpu_engine.addItems(["binary", "python"])
+        self.cb_cpu_engine.setToolTip(
+            "binary: run the AutoDock Vina executable as separate processes.\n"
+            "python: dock inside worker processes through the vina Python module, each keeping\n"
+            "the receptor and its affinity maps loaded for every ligand of a target."
+        )
+        self.sp_cpu_batch.setToolTip(
+            "Ligands docked per AutoDock Vina process (vina --batch).\n"
+            "1 starts one process per ligand. Larger values reuse one process and one loaded\n"
+            "receptor for a chunk of ligands from the same target and ligand group (normal mode only)."
+        )
         self.sp_exhaustiveness = QSpinBox(); self.sp_exhaustiveness.setRange(1, 32768)
         self.sp_gpu_threads = QSpinBox(); self.sp_gpu_threads.setRange(1, 500000)
+        self.sp_gpu_batch_size = QSpinBox(); self.sp_gpu_batch_size.setRange(1, 1000000)
+        self.sp_gpu_batch_size.setToolTip(
+            "Ligands per Vina-GPU run. Each batch holds ligands of one target and ligand group with\n"
+            "similar torsion and atom counts, staged through symlinks instead of the whole folder."
+        )
+        self.ed_gpu_device_batch_sizes = QLineEdit()
+        self.ed_gpu_device_batch_sizes.setPlaceholderText("e.g. 0:0=2000, 0:1=500")
+        self.ed_gpu_device_batch_sizes.setToolTip("Batch size per OpenCL device as platform:device=size; other devices use the GPU batch size.")
+        self.cb_funnel = QComboBox(); self.cb_funnel.addItems(["no", "yes"])
+        self.cb_funnel.setToolTip(
+            "yes: dock the whole library with the prescreen settings first (job PRESCREEN folder),\n"
+            "then redock only the best ligands of each target with the full settings (DOCKING folder)."
+        )
+        self.sp_funnel_top = QDoubleSpinBox(); self.sp_funnel_top.setRange(0.1, 100.0); self.sp_funnel_top.setDecimals(1)
+        self.sp_funnel_top.setToolTip("Percentage of each target's prescreened ligands, by best energy, redocked in stage 2.")
+        self.sp_funnel_exhaustiveness = QSpinBox(); self.sp_funnel_exhaustiveness.setRange(1, 32768)
+        self.sp_funnel_gpu_threads = QSpinBox(); self.sp_funnel_gpu_threads.setRange(1, 500000)
+        self.sp_pair_timeout = QSpinBox(); self.sp_pair_timeout.setRange(0, 604800)
+        self.sp_pair_timeout.setToolTip(
+            "Seconds a Vina process may run for one ligand before the watchdog kills it (0 = no limit).\n"
+            "Each torsion of the ligand adds the per-torsion allowance; batches get the sum of their ligands."
+        )
+        self.sp_timeout_per_torsion = QSpinBox(); self.sp_timeout_per_torsion.setRange(0, 86400)
+        self.sp_max_retries = QSpinBox(); self.sp_max_retries.setRange(0, 10)
+        self.sp_max_retries.setToolTip("Extra attempts for a failed or timed-out pair before it is recorded as failed and skipped.")
+        self.sp_dist_port = QSpinBox(); self.sp_dist_port.setRange(0, 65535)
+        self.sp_dist_port.setToolTip(
+            "DISTRIBUTED processing: TCP port the docking coordinator listens on (0 = any free port).\n"
+            "Workers connect with: python3 -m MODULES.module_distributed --host <this machine> --port <port>"
+        )
+        self.sp_dist_local_workers = QSpinBox(); self.sp_dist_local_workers.setRange(0, 512)
+        self.sp_dist_local_workers.setToolTip("DISTRIBUTED processing: workers started on this machine besides the remote ones.")
+        self.ed_dist_token = QLineEdit(); self.ed_dist_token.setEchoMode(QLineEdit.Password)
+        self.ed_dist_token.setToolTip(
+            "DISTRIBUTED processing: shared token workers must pass with --token.\n"
+            "Empty = the coordinator listens on 127.0.0.1 only and just the local workers can connect."
+        )
+        self.sp_lease_timeout = QSpinBox(); self.sp_lease_timeout.setRange(10, 86400)
+        self.sp_lease_timeout.setToolTip("Seconds without a heartbeat after which a worker's batch is handed to another worker.")
+        self.cb_result_cache = QComboBox(); self.cb_result_cache.addItems(["yes", "no"])
+        self.cb_result_cache.setToolTip(
+            "yes: reuse the pose of any earlier job that docked the same receptor, box, ligand file and\n"
+            "parameters (kept in the CACHE folder of the CODOC folder), and add new results to that cache.\n"
+            f"The key includes the engine and its version. A seed of 0 docks with the fixed seed {CACHE_SEED} while the cache is on."
+        )
+        self.sp_seed = QSpinBox(); self.sp_seed.setRange(0, 2147483647)
+        self.sp_seed.setToolTip(f"Random seed passed to Vina and Vina-GPU (0 = a new random seed for every run;\nwith the result cache on, 0 docks with the fixed seed {CACHE_SEED} so results can be reused).")
+        self.cb_collapse_duplicates = QComboBox(); self.cb_collapse_duplicates.addItems(["yes", "no"])
+        self.cb_collapse_duplicates.setToolTip(
+            "yes: dock ligands sharing an InChIKey (see 'Find duplicate ligands' in Step 2) once per target\n"
+            "and copy the result to every ligand databank and name the structure appears under.\n"
+            "Only used with the normal docking mode: score_only and local_only dock every copy from its own coordinates."
+        )
+        self.cb_adaptive_search = QComboBox(); self.cb_adaptive_search.addItems(["no", "yes"])
+        self.cb_adaptive_search.setToolTip(
+            "yes: choose exhaustiveness and Vina-GPU threads per ligand from its torsions and heavy atoms\n"
+            "(first matching search rule; ligands matching none use the values above)."
+        )
+        self.cb_convergence_mode = QComboBox(); self.cb_convergence_mode.addItems(["no", "yes"])
+        self.cb_convergence_mode.setToolTip(
+            "yes: dock each ligand as repeated short Vina searches with different seeds and stop once the two best\n"
+            "agree in energy and pose; ligands that do not converge get the full exhaustiveness (CPU / HYBRID CPU side)."
+        )
+        self.sp_convergence_exhaustiveness = QSpinBox(); self.sp_convergence_exhaustiveness.setRange(1, 32768)
+        self.sp_convergence_runs = QSpinBox(); self.sp_convergence_runs.setRange(2, 50)
+        self.sp_convergence_runs.setToolTip("Short searches tried per ligand before falling back to the full search.")
+        self.sp_convergence_energy = QDoubleSpinBox(); self.sp_convergence_energy.setRange(0.0, 10.0); self.sp_convergence_energy.setDecimals(2)
+        self.sp_convergence_energy.setToolTip("Largest best-pose energy difference (kcal/mol) between two short searches that still agree.")
+        self.sp_convergence_rmsd = QDoubleSpinBox(); self.sp_convergence_rmsd.setRange(0.0, 20.0); self.sp_convergence_rmsd.setDecimals(2)
+        self.sp_convergence_rmsd.setToolTip("Largest heavy-atom RMSD (A) between the best poses of two short searches that still agree.")
+        self.cb_cascade_mode = QComboBox(); self.cb_cascade_mode.addItems(["no", "yes"])
+        self.cb_cascade_mode.setToolTip(
+            "yes: dock every ligand against the primary target first (marked in Step 3), then only the ligands\n"
+            "passing the energy cutoff or the top N there against the other targets; skipped pairs are listed in the CSV."
+        )
+        self.sp_cascade_energy = QDoubleSpinBox(); self.sp_cascade_energy.setRange(-30.0, 0.0); self.sp_cascade_energy.setDecimals(2)
+        self.sp_cascade_energy.setToolTip("Ligands with a primary-target energy at or below this value (kcal/mol) go on to the other targets.")
+        self.sp_cascade_top_n = QSpinBox(); self.sp_cascade_top_n.setRange(0, 10000000)
+        self.sp_cascade_top_n.setToolTip("The N best ligands on the primary target also go on, whatever their energy (0 = energy cutoff only).")
+        self.cb_ensemble_mode = QComboBox(); self.cb_ensemble_mode.addItems(["no", "yes"])
+        self.cb_ensemble_mode.setToolTip(
+            "yes: treat targets named <pocket>_1, <pocket>_2, ... as conformations of one pocket: full search against\n"
+            "the first, local_only refinement of its poses on the others (full search only when the refined pose is worse)."
+        )
+        self.sp_ensemble_margin = QDoubleSpinBox(); self.sp_ensemble_margin.setRange(0.0, 20.0); self.sp_ensemble_margin.setDecimals(2)
+        self.sp_ensemble_margin.setToolTip("A refined pose more than this many kcal/mol above its reference energy triggers a full search.")
+        self.ed_adaptive_rules = QLineEdit()
+        self.ed_adaptive_rules.setToolTip(
+            "Rules separated by ';', tried in order: 'torsdof<=T heavy<=H: exhaustiveness/threads'.\n"
+            "Either limit may be omitted, as may '/threads'. Example: " + DEFAULT_ADAPTIVE_RULES
+        )
         self.sp_poses = QSpinBox(); self.sp_poses.setRange(1, 100)
         self.sp_min_rmsd = QDoubleSpinBox(); self.sp_min_rmsd.setRange(0.0, 100.0); self.sp_min_rmsd.setDecimals(3)
         self.sp_energy = QDoubleSpinBox(); self.sp_energy.setRange(0.0, 100.0); self.sp_energy.setDecimals(3)
@@ -2171,7 +4850,7 @@ class MainWindow(QMainWindow):
 
         # Moved here from the former "Docking execution" group in Step 4.
         self.cb_docking_type = QComboBox(); self.cb_docking_type.addItems(["Rigid", "Flexible"])
-        self.cb_processing_type = QComboBox(); self.cb_processing_type.addItems(["CPU", "GPU"])
+        self.cb_processing_type = QComboBox(); self.cb_processing_type.addItems(["CPU", "GPU", "HYBRID", "DISTRIBUTED"])
         self.cb_docking_mode = QComboBox(); self.cb_docking_mode.addItems(["normal", "score_only", "local_only"])
         self.cb_run_type = QComboBox(); self.cb_run_type.addItems(["NEW", "RESTART"])
         self.cb_existing_result = QComboBox()
@@ -2186,6 +4865,22 @@ class MainWindow(QMainWindow):
             ("Minimum RMSD", self.sp_min_rmsd, "OpenCL platform", self.cb_opencl_platform),
             ("Docking type", self.cb_docking_type, "Processing type", self.cb_processing_type),
             ("Vina mode", self.cb_docking_mode, "Run type", self.cb_run_type),
+            ("Ligands per Vina run", self.sp_cpu_batch, "CPU engine", self.cb_cpu_engine),
+            ("Use all GPUs", self.cb_multi_gpu, "Hybrid CPU torsions", self.sp_hybrid_torsions),
+            ("Screening funnel", self.cb_funnel, "Funnel top %", self.sp_funnel_top),
+            ("Prescreen exhaustiveness", self.sp_funnel_exhaustiveness, "Prescreen GPU threads", self.sp_funnel_gpu_threads),
+            ("Pair timeout (s)", self.sp_pair_timeout, "Timeout per torsion (s)", self.sp_timeout_per_torsion),
+            ("Retries per pair", self.sp_max_retries, "Coordinator port", self.sp_dist_port),
+            ("Local workers", self.sp_dist_local_workers, "Lease timeout (s)", self.sp_lease_timeout),
+            ("Worker token", self.ed_dist_token, "GPU batch size", self.sp_gpu_batch_size),
+            ("Per-device batch sizes", self.ed_gpu_device_batch_sizes, "Result cache", self.cb_result_cache),
+            ("Random seed", self.sp_seed, "Collapse duplicates", self.cb_collapse_duplicates),
+            ("Adaptive search", self.cb_adaptive_search, "Search rules", self.ed_adaptive_rules),
+            ("Convergence stop", self.cb_convergence_mode, "Short-search exhaustiveness", self.sp_convergence_exhaustiveness),
+            ("Max short searches", self.sp_convergence_runs, "Energy tolerance", self.sp_convergence_energy),
+            ("Pose RMSD tolerance", self.sp_convergence_rmsd, "Selectivity cascade", self.cb_cascade_mode),
+            ("Cascade energy cutoff", self.sp_cascade_energy, "Cascade top N", self.sp_cascade_top_n),
+            ("Receptor ensemble", self.cb_ensemble_mode, "Ensemble margin", self.sp_ensemble_margin),
         ]
         for row_idx, (label_left, widget_left, label_right, widget_right) in enumerate(param_rows):
             settings_form.addWidget(QLabel(label_left), row_idx, 0)
@@ -2374,6 +5069,7 @@ class MainWindow(QMainWindow):
             ("Reject invalid PDBQT", lambda: self._run_ligand_tool("reject_pdbqt")),
             ("Recover failed ligands", lambda: self._run_ligand_tool("recover_pdbqt")),
             ("Fix macrocycles for GPU", lambda: self._run_ligand_tool("fix_macrocycles")),
+            ("Find duplicate ligands", lambda: self._run_ligand_tool("find_duplicates")),
         ]
         for idx, (label, handler) in enumerate(ligand_actions):
             button = QPushButton(label)
@@ -2388,6 +5084,12 @@ class MainWindow(QMainWindow):
         self.pb_ligand = QProgressBar()
         self.pb_ligand.setValue(0)
         add_centered_group(self.pb_ligand)
+        ligand_controls = QHBoxLayout()
+        ligand_controls.setAlignment(Qt.AlignCenter)
+        ligand_controls.setSpacing(10)
+        for button in self._build_run_control_buttons("ligand"):
+            ligand_controls.addWidget(button)
+        layout.addLayout(ligand_controls)
         self.txt_ligand_log = QPlainTextEdit()
         self.txt_ligand_log.setReadOnly(True)
         add_centered_group(self.txt_ligand_log)
@@ -2546,10 +5248,15 @@ class MainWindow(QMainWindow):
         btn_remove_target = QPushButton("Remove target")
         btn_remove_target.setFixedWidth(170)
         btn_remove_target.clicked.connect(self._remove_selected_target)
+        btn_primary_target = QPushButton("Toggle primary")
+        btn_primary_target.setFixedWidth(170)
+        btn_primary_target.setToolTip("Mark (or unmark) the selected target as the primary target of a selectivity cascade.")
+        btn_primary_target.clicked.connect(self._toggle_selected_target_primary)
         manage_row.addWidget(self.cb_prepared_targets)
         manage_row.addWidget(btn_refresh_targets)
         manage_row.addWidget(btn_open_target)
         manage_row.addWidget(btn_remove_target)
+        manage_row.addWidget(btn_primary_target)
         manage_layout.addLayout(manage_row)
         add_centered_group(manage_box)
 
@@ -2590,7 +5297,7 @@ class MainWindow(QMainWindow):
         self.cb_monitor_interval = QComboBox()
         for seconds in (1, 2, 5, 10, 15, 30, 60):
             self.cb_monitor_interval.addItem(f"{seconds} s", seconds)
-        self.cb_monitor_interval.setCurrentIndex(2)
+        self.cb_monitor_interval.setCurrentIndex(0)
         self.cb_monitor_interval.currentIndexChanged.connect(self._update_monitor_interval)
         interval_row.addWidget(self.cb_monitor_interval)
         interval_row.addStretch(1)
@@ -2600,12 +5307,14 @@ class MainWindow(QMainWindow):
         self.lbl_monitor_docked = QLabel("-")
         self.lbl_monitor_total = QLabel("-")
         self.lbl_monitor_percent = QLabel("-")
+        self.lbl_monitor_rate = QLabel("-")
         self.lbl_monitor_eta = QLabel("-")
         self.lbl_monitor_running_time = QLabel("-")
         self.lbl_monitor_completion = QLabel("-")
         monitor_form.addRow("Ligands docked", self.lbl_monitor_docked)
         monitor_form.addRow("Total ligands", self.lbl_monitor_total)
         monitor_form.addRow("Percent complete", self.lbl_monitor_percent)
+        monitor_form.addRow("Throughput", self.lbl_monitor_rate)
         monitor_form.addRow("ETA", self.lbl_monitor_eta)
         monitor_form.addRow("Running time", self.lbl_monitor_running_time)
         monitor_form.addRow("Estim. completion", self.lbl_monitor_completion)
@@ -2614,10 +5323,13 @@ class MainWindow(QMainWindow):
         btn_run = QPushButton("Run docking")
         btn_run.setFixedWidth(180)
         btn_run.clicked.connect(self.run_docking)
-        monitor_layout.addWidget(btn_run, alignment=Qt.AlignCenter)
-
-        self.monitor_timer = QTimer(self)
-        self.monitor_timer.timeout.connect(self._refresh_docking_monitor)
+        run_row = QHBoxLayout()
+        run_row.setAlignment(Qt.AlignCenter)
+        run_row.setSpacing(10)
+        run_row.addWidget(btn_run)
+        for button in self._build_run_control_buttons("docking"):
+            run_row.addWidget(button)
+        monitor_layout.addLayout(run_row)
 
         add_centered_group(monitor_group)
 
@@ -2666,6 +5378,12 @@ class MainWindow(QMainWindow):
         self.cb_results_target.setMaximumWidth(260)
         self.cb_results_databank = QComboBox()
         self.cb_results_databank.setMaximumWidth(260)
+        self.cb_results_stage = QComboBox()
+        self.cb_results_stage.addItem("Final docking", "DOCKING")
+        self.cb_results_stage.addItem("Funnel prescreen", PRESCREEN_DIRNAME)
+        self.cb_results_stage.setToolTip("Screening funnel jobs keep the stage 1 prescreen results apart from the final redock.")
+        self.cb_results_stage.currentIndexChanged.connect(self._refresh_result_targets)
+        self.cb_results_stage.currentIndexChanged.connect(self._refresh_result_databanks)
         self.cb_results_folder.currentTextChanged.connect(self._refresh_result_targets)
         self.cb_results_folder.currentTextChanged.connect(self._refresh_result_databanks)
         btn_refresh = QPushButton("Refresh")
@@ -2686,8 +5404,20 @@ class MainWindow(QMainWindow):
         btn_plot = QPushButton("Plot filtered results")
         btn_plot.setFixedWidth(255)
         btn_plot.clicked.connect(self.plot_filtered_result)
+        self.ed_rescore_functions = QLineEdit()
+        self.ed_rescore_functions.setMaximumWidth(260)
+        self.ed_rescore_functions.setToolTip("Scoring functions to rescore with, comma-separated: vina, vinardo, ad4.")
+        btn_rescore = QPushButton("Rescore job poses")
+        btn_rescore.setFixedWidth(255)
+        btn_rescore.setToolTip("score_only every pose of the selected job and stage; scores are added as columns of its CSV.")
+        btn_rescore.clicked.connect(lambda: self.rescore_poses(from_folder=False))
+        btn_rescore_folder = QPushButton("Rescore pose folder")
+        btn_rescore_folder.setFixedWidth(255)
+        btn_rescore_folder.setToolTip("score_only every *.pdbqt of a folder against the selected target; scores go to rescored.csv there.")
+        btn_rescore_folder.clicked.connect(lambda: self.rescore_poses(from_folder=True))
         selectors_row.addStretch(1)
         selectors_row.addWidget(self.cb_results_folder)
+        selectors_row.addWidget(self.cb_results_stage)
         selectors_row.addWidget(self.cb_results_target)
         selectors_row.addWidget(self.cb_results_databank)
         selectors_row.addStretch(1)
@@ -2708,6 +5438,14 @@ class MainWindow(QMainWindow):
         for idx, button in enumerate(result_buttons):
             buttons_grid.addWidget(button, idx // 3, idx % 3)
         controls_layout.addLayout(buttons_grid)
+        rescore_row = QHBoxLayout()
+        rescore_row.addStretch(1)
+        rescore_row.addWidget(QLabel("Rescoring functions"))
+        rescore_row.addWidget(self.ed_rescore_functions)
+        rescore_row.addWidget(btn_rescore)
+        rescore_row.addWidget(btn_rescore_folder)
+        rescore_row.addStretch(1)
+        controls_layout.addLayout(rescore_row)
         add_centered_group(controls_box)
 
         self.tbl_results = QTableWidget()
@@ -2974,29 +5712,104 @@ class MainWindow(QMainWindow):
         self.ligand_worker.finished_ok.connect(self._on_ligand_tool_finished)
         self.ligand_worker.failed.connect(self._on_ligand_tool_failed)
         self.ligand_worker.start()
+        self._set_run_controls_active("ligand", True)
 
     def _log_ligand_action(self, conversion_dir: str, operation: str) -> None:
-        """Append a record of a successfully completed Step 2 action, so the Final Report
-        (Step 5) can later tell which conversion actions actually ran for this job."""
-        try:
-            os.makedirs(conversion_dir, exist_ok=True)
-            with open(os.path.join(conversion_dir, "actions.log"), "a", encoding="utf-8") as handle:
-                handle.write(f"{datetime.now().isoformat(timespec='seconds')}\t{operation}\tOK\n")
-        except OSError:
-            pass
+        log_ligand_action(conversion_dir, operation)
 
     def _on_ligand_tool_finished(self, message: str) -> None:
-        self.pb_ligand.setValue(100)
+        self._set_run_controls_active("ligand", False)
+        cancelled = self.ligand_worker.control.cancelled
+        if not cancelled:
+            self.pb_ligand.setValue(100)
         self.txt_ligand_log.appendPlainText(message)
-        if hasattr(self, "_ligand_tool_operation") and hasattr(self, "_ligand_tool_conversion_dir"):
+        if not cancelled and hasattr(self, "_ligand_tool_operation") and hasattr(self, "_ligand_tool_conversion_dir"):
             self._log_ligand_action(self._ligand_tool_conversion_dir, self._ligand_tool_operation)
         self._refresh_ligand_summary()
         QMessageBox.information(self, APP_NAME, message)
 
     def _on_ligand_tool_failed(self, message: str) -> None:
+        self._set_run_controls_active("ligand", False)
         self.txt_ligand_log.appendPlainText(message)
         QMessageBox.critical(self, APP_NAME, message)
 
+    _RUN_CONTROL_TARGETS = {"ligand": ("ligand_worker", "txt_ligand_log"), "docking": ("worker", "txt_docking_log")}
+
+    def _build_run_control_buttons(self, kind: str) -> tuple[QPushButton, QPushButton]:
+        btn_pause = QPushButton("Pause")
+        btn_pause.setFixedWidth(180)
+        btn_pause.setStyleSheet(_SS_BTN_SECONDARY)
+        btn_pause.setEnabled(False)
+        btn_pause.setToolTip(
+            "Pause: start no new work. Running Vina processes and worker pools are stopped and keep their memory;\n"
+            "running Vina-GPU batches are ended to free the GPU and their unfinished ligands run again on Resume.\n"
+            "DISTRIBUTED workers get no new batches but finish the ones they hold."
+        )
+        btn_pause.clicked.connect(lambda: self._toggle_run_pause(kind))
+        btn_cancel = QPushButton("Cancel")
+        btn_cancel.setFixedWidth(180)
+        btn_cancel.setStyleSheet(_SS_BTN_SECONDARY)
+        btn_cancel.setEnabled(False)
+        btn_cancel.clicked.connect(lambda: self._cancel_run(kind))
+        setattr(self, f"btn_{kind}_pause", btn_pause)
+        setattr(self, f"btn_{kind}_cancel", btn_cancel)
+        return btn_pause, btn_cancel
+
+    def _set_run_controls_active(self, kind: str, active: bool) -> None:
+        if not hasattr(self, f"btn_{kind}_pause"):
+            return
+        getattr(self, f"btn_{kind}_pause").setText("Pause")
+        getattr(self, f"btn_{kind}_pause").setEnabled(active)
+        getattr(self, f"btn_{kind}_cancel").setEnabled(active)
+
+    def _running_worker(self, kind: str) -> Optional[QThread]:
+        worker = getattr(self, self._RUN_CONTROL_TARGETS[kind][0], None)
+        return worker if worker is not None and worker.isRunning() else None
+
+    def _toggle_run_pause(self, kind: str) -> None:
+        worker = self._running_worker(kind)
+        if worker is None:
+            return
+        log = getattr(self, self._RUN_CONTROL_TARGETS[kind][1])
+        if worker.control.paused:
+            worker.control.resume()
+            getattr(self, f"btn_{kind}_pause").setText("Pause")
+            log.appendPlainText("Resumed.")
+        else:
+            worker.control.pause()
+            getattr(self, f"btn_{kind}_pause").setText("Resume")
+            log.appendPlainText(
+                "Paused: no new work is started and running processes are stopped until Resume "
+                "(Vina-GPU batches are ended to free the GPU and rerun for their unfinished ligands)."
+            )
+
+    def _cancel_run(self, kind: str) -> None:
+        worker = self._running_worker(kind)
+        if worker is None:
+            return
+        kill_running = False
+        if kind == "docking":
+            answer = QMessageBox.question(
+                self,
+                APP_NAME,
+                "Cancel the docking run?\n\n"
+                "Yes: kill the running Vina processes now; their pairs are docked again by a RESTART run.\n"
+                "No: let them finish and keep their results.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.No,
+            )
+            if answer == QMessageBox.Cancel:
+                return
+            kill_running = answer == QMessageBox.Yes
+        worker.control.cancel(kill_running=kill_running)
+        getattr(self, f"btn_{kind}_pause").setEnabled(False)
+        getattr(self, f"btn_{kind}_cancel").setEnabled(False)
+        getattr(self, self._RUN_CONTROL_TARGETS[kind][1]).appendPlainText(
+            "Cancelling: killing the running processes and saving the results so far..."
+            if kill_running
+            else "Cancelling: no new work is started; waiting for the running work to finish..."
+        )
+
     def _refresh_targets_summary(self) -> None:
         lines = []
         for target in sorted(Path(self.targets_dir).glob("*/")):
@@ -3007,6 +5820,8 @@ class MainWindow(QMainWindow):
                 markers.append("flex")
             if (target / "grid.txt").is_file():
                 markers.append("grid")
+            if (target / PRIMARY_TARGET_MARKER).is_file():
+                markers.append("primary")
             lines.append(f"{target.name}: {', '.join(markers) if markers else 'missing prepared files'}")
         self.txt_targets.setPlainText("\n".join(lines) if lines else f"No prepared targets found in {self.targets_dir}.")
 
@@ -3064,6 +5879,18 @@ class MainWindow(QMainWindow):
         if target_name:
             self._open_path(os.path.join(self.targets_dir, target_name))
 
+    def _toggle_selected_target_primary(self) -> None:
+        target_name = self.cb_prepared_targets.currentText().strip() if hasattr(self, "cb_prepared_targets") else ""
+        if not target_name:
+            QMessageBox.warning(self, APP_NAME, "Select a target to mark as primary.")
+            return
+        try:
+            set_primary_target(self.targets_dir, "" if target_name in primary_targets(self.targets_dir) else target_name)
+        except (OSError, RuntimeError) as exc:
+            QMessageBox.critical(self, APP_NAME, str(exc))
+            return
+        self._refresh_targets_summary()
+
     def _remove_selected_target(self) -> None:
         target_name = self.cb_prepared_targets.currentText().strip() if hasattr(self, "cb_prepared_targets") else ""
         if not target_name:
@@ -3090,28 +5917,21 @@ class MainWindow(QMainWindow):
     def prepare_target(self) -> None:
         flexible_mode = self.cb_target_mode.currentIndex() == 1 if hasattr(self, "cb_target_mode") else False
         target_name_input = self.ed_target_name.text().strip() if hasattr(self, "ed_target_name") else ""
+        grid_file = self.ed_target_grid_file.text().strip()
 
         try:
             if flexible_mode:
                 rigid_file = self.ed_target_rigid_file.text().strip()
                 flex_file = self.ed_target_flex_file.text().strip()
-                grid_file = self.ed_target_grid_file.text().strip()
                 if not rigid_file or not os.path.isfile(rigid_file):
                     QMessageBox.warning(self, APP_NAME, "Select a valid protein_rigid.pdbqt file.")
                     return
                 if not flex_file or not os.path.isfile(flex_file):
                     QMessageBox.warning(self, APP_NAME, "Select a valid protein_flex.pdbqt file.")
                     return
-                target_base = target_name_input or Path(rigid_file).stem.replace("protein_rigid", "").strip("_-") or "flex_target"
-                target_base = self._safe_target_name(target_base)
-                target_dir = os.path.join(self.targets_dir, target_base)
-                os.makedirs(target_dir, exist_ok=True)
-                self._copy_if_different(rigid_file, os.path.join(target_dir, "protein_rigid.pdbqt"))
-                self._copy_if_different(flex_file, os.path.join(target_dir, "protein_flex.pdbqt"))
-                if grid_file and os.path.isfile(grid_file):
-                    self._copy_if_different(grid_file, os.path.join(target_dir, "grid.txt"))
-                else:
-                    self._write_grid_file(os.path.join(target_dir, "grid.txt"), target_base)
+                target_dir = register_flexible_target(
+                    self.targets_dir, rigid_file, flex_file, target_name_input, grid_file, self._grid_values_from_widgets()
+                )
                 QMessageBox.information(self, APP_NAME, f"Flexible target registered in {target_dir}.")
             else:
                 target_file = self.ed_target_file.text().strip()
@@ -3119,27 +5939,9 @@ class MainWindow(QMainWindow):
                     QMessageBox.warning(self, APP_NAME, "Select a valid target file first.")
                     return
                 target_ph = self.sp_target_ph.value() if hasattr(self, "sp_target_ph") else 7.4
-
-                target_base = self._safe_target_name(target_name_input or Path(target_file).stem)
-                target_dir = os.path.join(self.targets_dir, target_base)
-                os.makedirs(target_dir, exist_ok=True)
-                copied_target = os.path.join(target_dir, os.path.basename(target_file))
-                self._copy_if_different(target_file, copied_target)
-                protein_out = os.path.join(target_dir, "protein.pdbqt")
-                grid_path = os.path.join(target_dir, "grid.txt")
-                grid_file = self.ed_target_grid_file.text().strip()
-                if grid_file and os.path.isfile(grid_file):
-                    self._copy_if_different(grid_file, grid_path)
-                else:
-                    self._write_grid_file(grid_path, target_base)
-
                 try:
-                    prep_result = prepare_receptor_with_protonation(
-                        input_path=copied_target,
-                        output_pdbqt_path=protein_out,
-                        ph=target_ph,
-                        venv_bin_dir=os.path.join(venv_paths("CODOC")["venv_dir"], "bin"),
-                        log_path=os.path.join(target_dir, "protonation_log.txt"),
+                    target_dir, prep_result = prepare_rigid_target(
+                        self.targets_dir, target_file, target_name_input, target_ph, grid_file, self._grid_values_from_widgets()
                     )
                 except TargetPrepareError as exc:
                     QMessageBox.critical(self, APP_NAME, f"Target preparation failed:\n{exc}")
@@ -3159,26 +5961,12 @@ class MainWindow(QMainWindow):
         self._populate_prepared_targets()
         self._refresh_result_folders()
 
-    def _copy_if_different(self, src: str, dst: str) -> None:
-        """Merge into an existing target folder instead of crashing when the selected source
-        file already is the destination file (e.g. Target name matches the folder the picked
-        file already lives in)."""
-        if os.path.exists(dst) and os.path.samefile(src, dst):
-            return
-        shutil.copy2(src, dst)
-
-    def _safe_target_name(self, value: str) -> str:
-        cleaned = re.sub(r"[^A-Za-z0-9_.-]+", "_", value.strip())
-        return cleaned.strip("._") or "target"
-
-    def _write_grid_file(self, grid_path: str, target_name: str) -> None:
-        with open(grid_path, "w", encoding="utf-8") as handle:
-            handle.write(
-                f"{target_name}\n"
-                f"spacing\t{self.sp_spacing.value()}\n"
-                f"npts\t{self.sp_grid_x.value()}\t{self.sp_grid_y.value()}\t{self.sp_grid_z.value()}\n"
-                f"center\t{self.sp_center_x.value()}\t{self.sp_center_y.value()}\t{self.sp_center_z.value()}\n"
-            )
+    def _grid_values_from_widgets(self) -> GridValues:
+        return (
+            self.sp_spacing.value(),
+            (self.sp_grid_x.value(), self.sp_grid_y.value(), self.sp_grid_z.value()),
+            (self.sp_center_x.value(), self.sp_center_y.value(), self.sp_center_z.value()),
+        )
 
     def _toggle_restart_combo(self) -> None:
         is_restart = self.cb_run_type.currentText() == "RESTART"
@@ -3190,7 +5978,7 @@ class MainWindow(QMainWindow):
             return
         current_mode = self.cb_docking_mode.currentText().strip() or "normal"
         processing_type = self.cb_processing_type.currentText().strip()
-        allowed_modes = ["normal"] if processing_type == "GPU" else ["normal", "score_only", "local_only"]
+        allowed_modes = ["normal"] if processing_type in {"GPU", "HYBRID"} else ["normal", "score_only", "local_only"]
         self.cb_docking_mode.blockSignals(True)
         self.cb_docking_mode.clear()
         self.cb_docking_mode.addItems(allowed_modes)
@@ -3230,7 +6018,7 @@ class MainWindow(QMainWindow):
         result_name = self.cb_results_folder.currentText().strip()
         if not result_name:
             return
-        result_dir = Path(self._job_docking_dir(result_name))
+        result_dir = Path(self._job_results_stage_dir(result_name))
         targets = [path.name for path in sorted(result_dir.glob("*/")) if path.is_dir()]
         self.cb_results_target.addItem("All targets")
         self.cb_results_target.addItems(targets)
@@ -3242,7 +6030,7 @@ class MainWindow(QMainWindow):
         result_name = self.cb_results_folder.currentText().strip()
         if not result_name:
             return
-        result_dir = Path(self._job_docking_dir(result_name))
+        result_dir = Path(self._job_results_stage_dir(result_name))
         databanks: set[str] = set()
         for target_dir in result_dir.glob("*/"):
             if not target_dir.is_dir():
@@ -3283,10 +6071,43 @@ class MainWindow(QMainWindow):
             device_id = self.cb_opencl_device.currentData()
             self.settings.opencl_device_id = int(device_id) if device_id is not None else -1
         self.settings.split_results = self.cb_split.currentText().strip() == "yes"
+        self.settings.multi_gpu = self.cb_multi_gpu.currentText().strip() == "yes"
+        self.settings.hybrid_cpu_torsions = self.sp_hybrid_torsions.value()
         self.settings.cpu_threads = self.sp_cpu_threads.value()
         self.settings.cpu_parallelism = self.sp_cpu_parallel.value()
+        self.settings.cpu_batch_size = self.sp_cpu_batch.value()
+        self.settings.cpu_engine = self.cb_cpu_engine.currentText().strip()
         self.settings.exhaustiveness = self.sp_exhaustiveness.value()
         self.settings.gpu_threads = self.sp_gpu_threads.value()
+        self.settings.gpu_batch_size = self.sp_gpu_batch_size.value()
+        self.settings.gpu_device_batch_sizes = self.ed_gpu_device_batch_sizes.text().strip()
+        self.settings.funnel_mode = self.cb_funnel.currentText().strip() == "yes"
+        self.settings.funnel_top_percent = self.sp_funnel_top.value()
+        self.settings.funnel_prescreen_exhaustiveness = self.sp_funnel_exhaustiveness.value()
+        self.settings.funnel_prescreen_gpu_threads = self.sp_funnel_gpu_threads.value()
+        self.settings.pair_timeout = self.sp_pair_timeout.value()
+        self.settings.pair_timeout_per_torsion = self.sp_timeout_per_torsion.value()
+        self.settings.max_retries = self.sp_max_retries.value()
+        self.settings.result_cache = self.cb_result_cache.currentText().strip() == "yes"
+        self.settings.seed = self.sp_seed.value()
+        self.settings.collapse_duplicates = self.cb_collapse_duplicates.currentText().strip() == "yes"
+        self.settings.adaptive_search = self.cb_adaptive_search.currentText().strip() == "yes"
+        self.settings.adaptive_rules = self.ed_adaptive_rules.text().strip()
+        self.settings.convergence_mode = self.cb_convergence_mode.currentText().strip() == "yes"
+        self.settings.convergence_exhaustiveness = self.sp_convergence_exhaustiveness.value()
+        self.settings.convergence_max_runs = self.sp_convergence_runs.value()
+        self.settings.convergence_energy_tolerance = self.sp_convergence_energy.value()
+        self.settings.convergence_rmsd = self.sp_convergence_rmsd.value()
+        self.settings.cascade_mode = self.cb_cascade_mode.currentText().strip() == "yes"
+        self.settings.cascade_energy_threshold = self.sp_cascade_energy.value()
+        self.settings.cascade_top_n = self.sp_cascade_top_n.value()
+        self.settings.ensemble_mode = self.cb_ensemble_mode.currentText().strip() == "yes"
+        self.settings.ensemble_margin = self.sp_ensemble_margin.value()
+        self.settings.rescore_functions = self.ed_rescore_functions.text().strip()
+        self.settings.distributed_port = self.sp_dist_port.value()
+        self.settings.distributed_local_workers = self.sp_dist_local_workers.value()
+        self.settings.distributed_token = self.ed_dist_token.text().strip()
+        self.settings.distributed_lease_timeout = self.sp_lease_timeout.value()
         self.settings.poses = self.sp_poses.value()
         self.settings.min_rmsd = self.sp_min_rmsd.value()
         self.settings.energy_range = self.sp_energy.value()
@@ -3328,14 +6149,80 @@ class MainWindow(QMainWindow):
                 self.cb_opencl_device.setCurrentIndex(index)
         if hasattr(self, "cb_split"):
             self.cb_split.setCurrentText("yes" if self.settings.split_results else "no")
+        if hasattr(self, "cb_multi_gpu"):
+            self.cb_multi_gpu.setCurrentText("yes" if self.settings.multi_gpu else "no")
+        if hasattr(self, "sp_hybrid_torsions"):
+            self.sp_hybrid_torsions.setValue(self.settings.hybrid_cpu_torsions)
         if hasattr(self, "sp_cpu_threads"):
             self.sp_cpu_threads.setValue(self.settings.cpu_threads)
         if hasattr(self, "sp_cpu_parallel"):
             self.sp_cpu_parallel.setValue(self.settings.cpu_parallelism)
+        if hasattr(self, "sp_cpu_batch"):
+            self.sp_cpu_batch.setValue(self.settings.cpu_batch_size)
+        if hasattr(self, "cb_cpu_engine"):
+            self.cb_cpu_engine.setCurrentText(self.settings.cpu_engine)
         if hasattr(self, "sp_exhaustiveness"):
             self.sp_exhaustiveness.setValue(self.settings.exhaustiveness)
         if hasattr(self, "sp_gpu_threads"):
             self.sp_gpu_threads.setValue(self.settings.gpu_threads)
+        if hasattr(self, "sp_gpu_batch_size"):
+            self.sp_gpu_batch_size.setValue(self.settings.gpu_batch_size)
+        if hasattr(self, "ed_gpu_device_batch_sizes"):
+            self.ed_gpu_device_batch_sizes.setText(self.settings.gpu_device_batch_sizes)
+        if hasattr(self, "cb_funnel"):
+            self.cb_funnel.setCurrentText("yes" if self.settings.funnel_mode else "no")
+        if hasattr(self, "sp_funnel_top"):
+            self.sp_funnel_top.setValue(self.settings.funnel_top_percent)
+        if hasattr(self, "sp_funnel_exhaustiveness"):
+            self.sp_funnel_exhaustiveness.setValue(self.settings.funnel_prescreen_exhaustiveness)
+        if hasattr(self, "sp_funnel_gpu_threads"):
+            self.sp_funnel_gpu_threads.setValue(self.settings.funnel_prescreen_gpu_threads)
+        if hasattr(self, "sp_pair_timeout"):
+            self.sp_pair_timeout.setValue(self.settings.pair_timeout)
+        if hasattr(self, "sp_timeout_per_torsion"):
+            self.sp_timeout_per_torsion.setValue(self.settings.pair_timeout_per_torsion)
+        if hasattr(self, "sp_max_retries"):
+            self.sp_max_retries.setValue(self.settings.max_retries)
+        if hasattr(self, "cb_result_cache"):
+            self.cb_result_cache.setCurrentText("yes" if self.settings.result_cache else "no")
+        if hasattr(self, "sp_seed"):
+            self.sp_seed.setValue(self.settings.seed)
+        if hasattr(self, "cb_collapse_duplicates"):
+            self.cb_collapse_duplicates.setCurrentText("yes" if self.settings.collapse_duplicates else "no")
+        if hasattr(self, "cb_adaptive_search"):
+            self.cb_adaptive_search.setCurrentText("yes" if self.settings.adaptive_search else "no")
+        if hasattr(self, "ed_adaptive_rules"):
+            self.ed_adaptive_rules.setText(self.settings.adaptive_rules)
+        if hasattr(self, "cb_convergence_mode"):
+            self.cb_convergence_mode.setCurrentText("yes" if self.settings.convergence_mode else "no")
+        if hasattr(self, "sp_convergence_exhaustiveness"):
+            self.sp_convergence_exhaustiveness.setValue(self.settings.convergence_exhaustiveness)
+        if hasattr(self, "sp_convergence_runs"):
+            self.sp_convergence_runs.setValue(self.settings.convergence_max_runs)
+        if hasattr(self, "sp_convergence_energy"):
+            self.sp_convergence_energy.setValue(self.settings.convergence_energy_tolerance)
+        if hasattr(self, "sp_convergence_rmsd"):
+            self.sp_convergence_rmsd.setValue(self.settings.convergence_rmsd)
+        if hasattr(self, "cb_cascade_mode"):
+            self.cb_cascade_mode.setCurrentText("yes" if self.settings.cascade_mode else "no")
+        if hasattr(self, "sp_cascade_energy"):
+            self.sp_cascade_energy.setValue(self.settings.cascade_energy_threshold)
+        if hasattr(self, "sp_cascade_top_n"):
+            self.sp_cascade_top_n.setValue(self.settings.cascade_top_n)
+        if hasattr(self, "cb_ensemble_mode"):
+            self.cb_ensemble_mode.setCurrentText("yes" if self.settings.ensemble_mode else "no")
+        if hasattr(self, "sp_ensemble_margin"):
+            self.sp_ensemble_margin.setValue(self.settings.ensemble_margin)
+        if hasattr(self, "ed_rescore_functions"):
+            self.ed_rescore_functions.setText(self.settings.rescore_functions)
+        if hasattr(self, "sp_dist_port"):
+            self.sp_dist_port.setValue(self.settings.distributed_port)
+        if hasattr(self, "sp_dist_local_workers"):
+            self.sp_dist_local_workers.setValue(self.settings.distributed_local_workers)
+        if hasattr(self, "ed_dist_token"):
+            self.ed_dist_token.setText(self.settings.distributed_token)
+        if hasattr(self, "sp_lease_timeout"):
+            self.sp_lease_timeout.setValue(self.settings.distributed_lease_timeout)
         if hasattr(self, "sp_poses"):
             self.sp_poses.setValue(self.settings.poses)
         if hasattr(self, "sp_min_rmsd"):
@@ -3427,63 +6314,37 @@ class MainWindow(QMainWindow):
         except Exception as exc:
             QMessageBox.warning(self, APP_NAME, f"Failed to load settings: {exc}")
 
-    def _docking_monitor_path(self) -> str:
-        return os.path.join(self.app_dir, ".track_progress.log")
-
     def _update_monitor_interval(self) -> None:
-        if not hasattr(self, "monitor_timer"):
-            return
         seconds = self.cb_monitor_interval.currentData()
-        if seconds and self.monitor_timer.isActive():
-            self.monitor_timer.setInterval(int(seconds) * 1000)
+        if seconds and hasattr(self, "worker"):
+            self.worker.stats_interval = float(seconds)
 
     def _reset_docking_monitor(self) -> None:
         for label in (
             self.lbl_monitor_docked,
             self.lbl_monitor_total,
             self.lbl_monitor_percent,
+            self.lbl_monitor_rate,
             self.lbl_monitor_eta,
             self.lbl_monitor_running_time,
             self.lbl_monitor_completion,
         ):
             label.setText("-")
 
-    _MONITOR_LINE_PATTERNS = (
-        ("lbl_monitor_docked", re.compile(r"^(\d+)\s+ligands docked")),
-        ("lbl_monitor_total", re.compile(r"^(\d+)\s+total ligands")),
-        ("lbl_monitor_percent", re.compile(r"^([\d.]+%)\s+complete")),
-        ("lbl_monitor_eta", re.compile(r"^(\d{2}:\d{2}:\d{2})\s+ETA")),
-        ("lbl_monitor_running_time", re.compile(r"^(\d{2}:\d{2}:\d{2})\s+running time")),
-        ("lbl_monitor_completion", re.compile(r"^(.+?)\s*\(Estim\. completion\)")),
-    )
-    _MONITOR_PERCENT_RE = re.compile(r"^([\d.]+)%")
-
-    def _refresh_docking_monitor(self) -> None:
-        if self.cb_processing_type.currentText().strip() != "GPU":
-            self._reset_docking_monitor()
-            return
-        log_path = self._docking_monitor_path()
-        try:
-            lines = Path(log_path).read_text(encoding="utf-8", errors="ignore").splitlines()
-        except OSError:
+    def _show_docking_stats(self, stats: dict[str, Any]) -> None:
+        """Fill the Step 4 monitor from a DockingWorker.progress_stats report."""
+        self.lbl_monitor_docked.setText(str(stats["done"]))
+        self.lbl_monitor_total.setText(str(stats["total"]))
+        self.lbl_monitor_percent.setText(f"{stats['percent']:.1f}%")
+        self.lbl_monitor_rate.setText(f"{stats['rate']:.1f} ligands/min")
+        self.lbl_monitor_running_time.setText(_format_duration(stats["elapsed"]))
+        if stats["eta"] is None:
+            self.lbl_monitor_eta.setText("-")
+            self.lbl_monitor_completion.setText("-")
             return
-
-        percent_value: Optional[float] = None
-        for line in lines:
-            stripped = line.strip()
-            for attr_name, pattern in self._MONITOR_LINE_PATTERNS:
-                match = pattern.match(stripped)
-                if not match:
-                    continue
-                getattr(self, attr_name).setText(match.group(1))
-                if attr_name == "lbl_monitor_percent":
-                    percent_match = self._MONITOR_PERCENT_RE.match(match.group(1))
-                    if percent_match:
-                        percent_value = float(percent_match.group(1))
-                break
-
-        if percent_value is not None and hasattr(self, "worker") and self.worker.isRunning():
-            self.pb_docking.setValue(max(0, min(100, int(round(percent_value)))))
+        self.lbl_monitor_eta.setText(_format_duration(stats["eta"]))
+        completion = datetime.now() + timedelta(seconds=stats["eta"])
+        self.lbl_monitor_completion.setText(completion.strftime("%Y-%m-%d %H:%M:%S"))
 
     def run_docking(self) -> None:
         self._save_settings()
@@ -3506,21 +6367,23 @@ class MainWindow(QMainWindow):
         )
         self.worker.progress_value.connect(self.pb_docking.setValue)
         self.worker.progress_text.connect(self.txt_docking_log.appendPlainText)
+        self.worker.progress_stats.connect(self._show_docking_stats)
         self.worker.finished_ok.connect(self._on_docking_finished)
         self.worker.failed.connect(self._on_docking_failed)
+        self._update_monitor_interval()
         self.worker.start()
-        interval_seconds = self.cb_monitor_interval.currentData() or 5
-        self.monitor_timer.start(int(interval_seconds) * 1000)
+        self._set_run_controls_active("docking", True)
 
     def _on_docking_finished(self, message: str) -> None:
-        self.monitor_timer.stop()
-        self.pb_docking.setValue(100)
+        self._set_run_controls_active("docking", False)
+        if not self.worker.control.cancelled:
+            self.pb_docking.setValue(100)
         self.txt_docking_log.appendPlainText(message)
         self._refresh_result_folders()
         QMessageBox.information(self, APP_NAME, message)
 
     def _on_docking_failed(self, message: str) -> None:
-        self.monitor_timer.stop()
+        self._set_run_controls_active("docking", False)
         self.txt_docking_log.appendPlainText(message)
         QMessageBox.critical(self, APP_NAME, message)
 
@@ -3531,7 +6394,7 @@ class MainWindow(QMainWindow):
         if not result_name:
             QMessageBox.warning(self, APP_NAME, "Select a result folder first.")
             return
-        result_folder = self._job_docking_dir(result_name)
+        result_folder = self._job_results_stage_dir(result_name)
         if not os.path.isdir(result_folder):
             QMessageBox.warning(self, APP_NAME, f"Result folder not found: {result_folder}")
             return
@@ -3562,8 +6425,8 @@ class MainWindow(QMainWindow):
         except Exception as exc:
             QMessageBox.warning(self, APP_NAME, str(exc))
             return
-        target_slug = self._safe_target_name(target_name)
-        default_name = os.path.join(self._job_docking_dir(result_name), f"{target_slug}_top{self.result_view_settings.top_results}.csv")
+        target_slug = safe_target_name(target_name)
+        default_name = os.path.join(self._job_results_stage_dir(result_name), f"{target_slug}_top{self.result_view_settings.top_results}.csv")
         save_path, _ = QFileDialog.getSaveFileName(self, "Export filtered result", default_name, "CSV (*.csv)")
         if not save_path:
             return
@@ -3632,14 +6495,65 @@ class MainWindow(QMainWindow):
         dialog.exec_()
 
     def _save_result_plot(self, fig: Any, result_name: str, target_name: str, parent: QWidget) -> None:
-        target_slug = self._safe_target_name(target_name)
-        default_path = os.path.join(self._job_docking_dir(result_name), f"{target_slug}_top{self.result_view_settings.top_results}.png")
+        target_slug = safe_target_name(target_name)
+        default_path = os.path.join(self._job_results_stage_dir(result_name), f"{target_slug}_top{self.result_view_settings.top_results}.png")
         file_path, _ = QFileDialog.getSaveFileName(parent, "Save chart", default_path, "PNG (*.png);;SVG (*.svg);;PDF (*.pdf)")
         if not file_path:
             return
         fig.savefig(file_path, bbox_inches="tight", dpi=300)
         QMessageBox.information(self, APP_NAME, f"Chart saved to {file_path}.")
 
+    def rescore_poses(self, from_folder: bool) -> None:
+        if getattr(self, "worker", None) is not None and self.worker.isRunning():
+            QMessageBox.warning(self, APP_NAME, "Wait for the running docking job to finish before rescoring.")
+            return
+        self._save_settings()
+        try:
+            functions = parse_scoring_functions(self.settings.rescore_functions)
+        except ValueError as exc:
+            QMessageBox.warning(self, APP_NAME, str(exc))
+            return
+        result_name = self.cb_results_folder.currentText().strip()
+        poses_dir = ""
+        target_name = ""
+        docking_type = "Rigid"
+        if from_folder:
+            target_name = self.cb_results_target.currentText().strip()
+            if not target_name or target_name == "All targets":
+                QMessageBox.warning(self, APP_NAME, "Select the target the poses were docked against.")
+                return
+            poses_dir = self._browse_directory(self.app_dir) or ""
+            if not poses_dir:
+                return
+            results_dir = poses_dir
+        else:
+            if not result_name:
+                QMessageBox.warning(self, APP_NAME, "Select a result folder first.")
+                return
+            results_dir = self._job_results_stage_dir(result_name)
+            if not os.path.isdir(results_dir):
+                QMessageBox.warning(self, APP_NAME, f"Result folder not found: {results_dir}")
+                return
+            docking_type = load_job_settings(self._job_dir(result_name))[0].get("docking_type", self.settings.docking_type)
+        self.txt_docking_log.clear()
+        self.worker = RescoreWorker(
+            app_dir=self.app_dir,
+            targets_dir=self.targets_dir,
+            results_dir=results_dir,
+            job_name=result_name,
+            settings=self.settings,
+            scoring_functions=functions,
+            docking_type=docking_type,
+            poses_dir=poses_dir,
+            target_name=target_name,
+        )
+        self.worker.progress_value.connect(self.pb_docking.setValue)
+        self.worker.progress_text.connect(self.txt_docking_log.appendPlainText)
+        self.worker.finished_ok.connect(self._on_docking_finished)
+        self.worker.failed.connect(self._on_docking_failed)
+        self.worker.start()
+        self._set_run_controls_active("docking", True)
+
     def generate_final_report(self) -> None:
         result_name = self.cb_results_folder.currentText().strip()
         if not result_name:
@@ -3686,26 +6600,10 @@ class MainWindow(QMainWindow):
         QMessageBox.information(self, APP_NAME, f"Final report saved to:\n{output_path}")
 
     def _run_csv_path(self, result_folder: str, result_name: str) -> str:
-        return os.path.join(result_folder, f"{result_name}.csv")
+        return run_csv_path(result_folder, result_name)
 
     def _rebuild_result_csv(self, result_folder: str, result_name: str) -> str:
-        """Rescan every ligand PDBQT under a result folder and rewrite its unified CSV."""
-        csv_path = self._run_csv_path(result_folder, result_name)
-        with open(csv_path, "w", encoding="utf-8", newline="") as handle:
-            writer = csv.writer(handle)
-            writer.writerow(RESULT_CSV_HEADER)
-            for target_dir in sorted(p for p in Path(result_folder).glob("*/") if p.is_dir()):
-                target_name = target_dir.name
-                for group_dir in sorted(p for p in target_dir.glob("*/") if p.is_dir()):
-                    ligand_group = group_dir.name
-                    for ligand_dir in sorted(p for p in group_dir.glob("*/") if p.is_dir()):
-                        ligand_name = ligand_dir.name
-                        output_file = ligand_dir / f"{ligand_name}.pdbqt"
-                        if not output_file.is_file():
-                            continue
-                        energy, rmsd_mean, smiles = _parse_vina_pose_data(str(output_file))
-                        writer.writerow([ligand_name, smiles, ligand_group, target_name, energy, rmsd_mean])
-        return csv_path
+        return rebuild_result_csv(result_folder, result_name)
 
     def _locate_result_columns(self, frame: Any) -> dict[str, Optional[str]]:
         lower_map = {str(col).strip().lower(): col for col in frame.columns}
@@ -3750,7 +6648,7 @@ class MainWindow(QMainWindow):
         databank_name = self.cb_results_databank.currentText().strip()
         if not result_name:
             raise RuntimeError("Select a result folder first.")
-        csv_path = self._run_csv_path(self._job_docking_dir(result_name), result_name)
+        csv_path = self._run_csv_path(self._job_results_stage_dir(result_name), result_name)
         if not os.path.isfile(csv_path):
             raise RuntimeError(f"Result CSV not found: {csv_path}. Click 'Load raw CSV' first.")
         frame = self._load_result_dataframe(csv_path)
@@ -3922,7 +6820,326 @@ class MainWindow(QMainWindow):
             self.lbl_gpu_top.setStyleSheet(self._mon_ss("#2980B9"))
 
 
+# --------------------------------------------------------------------------------------
+# Headless command line: `python3 CODOC.py <command> ...` runs one pipeline step without
+# the GUI, driving the same workers as the Qt slots and printing their signals to stdout.
+# --------------------------------------------------------------------------------------
+
+@dataclass
+class CliContext:
+    app_dir: str
+    ligands_dir: str
+    targets_dir: str
+    jobs_dir: str
+    current_job_name: str
+    settings: DockingSettings
+    ligand_settings: LigandSettings
+    result_view_settings: ResultViewSettings
+
+    def job_dir(self, job_name: str) -> str:
+        return os.path.join(self.jobs_dir, job_name)
+
+
+def _merged_settings(base: Any, overrides: dict[str, Any]) -> Any:
+    """`base` updated with the `overrides` it has fields for; keys of other CODOC versions are ignored."""
+    known = {field.name for field in fields(base)}
+    return replace(base, **{name: value for name, value in overrides.items() if name in known})
+
+
+def load_cli_context(settings_file: str = "") -> CliContext:
+    """Paths and settings for a headless run, read like MainWindow._load_settings does."""
+    app_dir = os.path.abspath(os.path.dirname(__file__))
+    payload: dict[str, Any] = {}
+    path = settings_file or os.path.join(app_dir, ".codoc_settings.json")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    elif settings_file:
+        raise RuntimeError(f"Settings file not found: {settings_file}")
+    return CliContext(
+        app_dir=app_dir,
+        ligands_dir=payload.get("ligands_dir") or os.path.join(app_dir, "LIGANDS"),
+        targets_dir=payload.get("targets_dir") or os.path.join(app_dir, "TARGETS"),
+        jobs_dir=payload.get("jobs_dir") or os.path.join(app_dir, "JOBS"),
+        current_job_name=payload.get("current_job_name", ""),
+        settings=_merged_settings(DockingSettings(), payload.get("docking", {})),
+        ligand_settings=_merged_settings(LigandSettings(), payload.get("ligand", {})),
+        result_view_settings=_merged_settings(ResultViewSettings(), payload.get("results_view", {})),
+    )
+
+
+def _cli_existing_job(context: CliContext, job_name: str) -> str:
+    job_name = job_name or context.current_job_name
+    if not job_name:
+        raise RuntimeError("No job selected: pass --job NAME or save a job in the GUI first.")
+    if not os.path.isdir(context.job_dir(job_name)):
+        raise RuntimeError(f"Job folder not found: {context.job_dir(job_name)}")
+    return job_name
+
+
+def _run_worker_headless(worker: QThread, tag: str) -> int:
+    """Run a QThread worker to completion on this thread, printing its signals."""
+    outcome: dict[str, str] = {}
+    last_value = -1
+
+    def on_value(value: int) -> None:
+        nonlocal last_value
+        if value != last_value and value % 10 == 0:
+            last_value = value
+            print(f"[{tag}] {value}%", flush=True)
+
+    worker.progress_value.connect(on_value)
+    worker.progress_text.connect(lambda text: print(f"[{tag}] {text}", flush=True))
+    if hasattr(worker, "progress_stats"):
+
+        def on_stats(stats: dict[str, Any]) -> None:
+            eta = "unknown" if stats["eta"] is None else _format_duration(stats["eta"])
+            print(
+                f"[{tag}] {stats['done']}/{stats['total']} ligands docked ({stats['percent']:.1f}%), "
+                f"{stats['rate']:.1f} ligands/min, ETA {eta}",
+                flush=True,
+            )
+
+        worker.stats_interval = 30.0
+        worker.progress_stats.connect(on_stats)
+    worker.finished_ok.connect(lambda message: outcome.update(ok=message))
+    worker.failed.connect(lambda message: outcome.update(error=message))
+
+    # Ctrl+C stops scheduling; a second Ctrl+C or SIGTERM kills the run. SIGUSR1 pauses, SIGUSR2 resumes.
+    # The handlers only start a thread: RunControl takes locks the interrupted code may hold.
+    control = worker.control
+
+    def on_signal(signum: int, _frame: Any) -> None:
+        if signum in (signal.SIGINT, signal.SIGTERM):
+            kill_running = control.cancelled or signum == signal.SIGTERM
+            print(f"[{tag}] {'Killing running work' if kill_running else 'Cancelling after the running work'}...", flush=True)
+            threading.Thread(target=control.cancel, kwargs={"kill_running": kill_running}, daemon=True).start()
+        else:
+            print(f"[{tag}] {'Paused' if signum == signal.SIGUSR1 else 'Resumed'}.", flush=True)
+            threading.Thread(target=control.pause if signum == signal.SIGUSR1 else control.resume, daemon=True).start()
+
+    previous = {signum: signal.signal(signum, on_signal) for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2)}
+    try:
+        # run() is called directly: the work happens on this thread, with no Qt event loop.
+        worker.run()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    if "error" in outcome:
+        print(f"[{tag}] {outcome['error']}", file=sys.stderr, flush=True)
+        return 1
+    print(f"[{tag}] {outcome.get('ok', '')}", flush=True)
+    return 0
+
+
+def _cli_ligands(context: CliContext, args: argparse.Namespace) -> int:
+    job_name = _cli_existing_job(context, args.job)
+    conversion_dir = os.path.join(context.job_dir(job_name), "CONVERSION")
+    for operation in args.operations:
+        worker = LigandToolsWorker(
+            app_dir=context.app_dir,
+            ligands_dir=context.ligands_dir,
+            conversion_dir=conversion_dir,
+            settings=context.ligand_settings,
+            operation=operation,
+        )
+        status = _run_worker_headless(worker, operation)
+        if status != 0:
+            return status
+        if worker.control.cancelled:
+            return 130
+        log_ligand_action(conversion_dir, operation)
+    return 0
+
+
+def _cli_target(context: CliContext, args: argparse.Namespace) -> int:
+    grid = grid_values_from_settings(context.settings)
+    if args.flex:
+        if not args.rigid or not os.path.isfile(args.rigid) or not os.path.isfile(args.flex):
+            raise RuntimeError("Flexible targets need existing --rigid protein_rigid.pdbqt and --flex protein_flex.pdbqt files.")
+        target_dir = register_flexible_target(context.targets_dir, args.rigid, args.flex, args.name, args.grid, grid)
+        print(f"[target] Flexible target registered in {target_dir}.", flush=True)
+        _cli_mark_primary(context, args, target_dir)
+        return 0
+    if not args.input or not os.path.isfile(args.input):
+        raise RuntimeError("Pass an existing receptor file with --input (or --rigid and --flex).")
+    ph = args.ph if args.ph is not None else context.settings.target_ph
+    target_dir, prep_result = prepare_rigid_target(context.targets_dir, args.input, args.name, ph, args.grid, grid)
+    print(f"[target] Target prepared in {target_dir}.", flush=True)
+    print(summarize_pka_table(prep_result.pka_table, prep_result.ph), flush=True)
+    print(f"[target] PROPKA/PDB2PQR log: {prep_result.log_path}", flush=True)
+    _cli_mark_primary(context, args, target_dir)
+    return 0
+
+
+def _cli_mark_primary(context: CliContext, args: argparse.Namespace, target_dir: str) -> None:
+    if args.primary:
+        set_primary_target(context.targets_dir, os.path.basename(target_dir))
+        print(f"[target] {os.path.basename(target_dir)} is now the primary target of the selectivity cascade.", flush=True)
+
+
+def _cli_dock(context: CliContext, args: argparse.Namespace) -> int:
+    shard_index, shard_count = parse_shard_spec(args.shard) if args.shard else (0, 1)
+    if args.new:
+        if args.shard:
+            raise RuntimeError("--new cannot be combined with --shard: create the job first, then dock its shards.")
+        job_name = create_job(context.jobs_dir, context.settings, context.ligand_settings)
+        run_type = "NEW"
+        print(f"[dock] Created job {job_name}", flush=True)
+    else:
+        job_name = _cli_existing_job(context, args.job)
+        run_type = "RESTART"
+    job_dir = context.job_dir(job_name)
+    job_docking_settings, _ = load_job_settings(job_dir)
+    settings = _merged_settings(context.settings, job_docking_settings)
+    worker = DockingWorker(
+        app_dir=context.app_dir,
+        ligands_dir=context.ligands_dir,
+        targets_dir=context.targets_dir,
+        results_dir=os.path.join(job_dir, "DOCKING"),
+        job_name=job_name,
+        settings=settings,
+        docking_type=settings.docking_type,
+        processing_type=settings.processing_type,
+        run_type=run_type,
+        shard_index=shard_index,
+        shard_count=shard_count,
+    )
+    return _run_worker_headless(worker, f"shard {args.shard}" if args.shard else "dock")
+
+
+def _cli_rescore(context: CliContext, args: argparse.Namespace) -> int:
+    functions = parse_scoring_functions(args.functions or context.settings.rescore_functions)
+    if args.poses:
+        if not os.path.isdir(args.poses):
+            raise RuntimeError(f"Pose folder not found: {args.poses}")
+        if not args.target:
+            raise RuntimeError("Pass the target the poses were docked against with --target.")
+        worker = RescoreWorker(
+            app_dir=context.app_dir,
+            targets_dir=context.targets_dir,
+            results_dir=args.poses,
+            job_name="",
+            settings=context.settings,
+            scoring_functions=functions,
+            poses_dir=args.poses,
+            target_name=args.target,
+        )
+        return _run_worker_headless(worker, "rescore")
+    job_name = _cli_existing_job(context, args.job)
+    job_dir = context.job_dir(job_name)
+    results_dir = os.path.join(job_dir, PRESCREEN_DIRNAME if args.prescreen else "DOCKING")
+    if not os.path.isdir(results_dir):
+        raise RuntimeError(f"Result folder not found: {results_dir}")
+    job_docking_settings, _ = load_job_settings(job_dir)
+    settings = _merged_settings(context.settings, job_docking_settings)
+    worker = RescoreWorker(
+        app_dir=context.app_dir,
+        targets_dir=context.targets_dir,
+        results_dir=results_dir,
+        job_name=job_name,
+        settings=settings,
+        scoring_functions=functions,
+        docking_type=settings.docking_type,
+    )
+    return _run_worker_headless(worker, "rescore")
+
+
+def _cli_report(context: CliContext, args: argparse.Namespace) -> int:
+    job_name = _cli_existing_job(context, args.job)
+    job_dir = context.job_dir(job_name)
+    docking_dir = os.path.join(job_dir, "DOCKING")
+    if not os.path.isdir(docking_dir):
+        raise RuntimeError(f"Result folder not found: {docking_dir}")
+    if pd is None:
+        raise RuntimeError("Pandas is required to read docking results.")
+    csv_path = rebuild_result_csv(docking_dir, job_name)
+    frame = pd.read_csv(csv_path)
+    job_docking_settings, job_ligand_settings = load_job_settings(job_dir)
+    output_path = _generate_final_report_docx(
+        job_dir=job_dir,
+        job_name=job_name,
+        ligands_dir=context.ligands_dir,
+        frame=frame,
+        docking_settings={**asdict(context.settings), **job_docking_settings},
+        ligand_settings={**asdict(context.ligand_settings), **job_ligand_settings},
+        top_results=args.top if args.top is not None else context.result_view_settings.top_results,
+        rmsd_limit=args.rmsd if args.rmsd is not None else context.result_view_settings.rmsd_limit,
+        progress_callback=lambda text: print(f"[report] {text}", flush=True),
+    )
+    print(f"[report] Final report saved to {output_path}", flush=True)
+    return 0
+
+
+def _cli_merge(context: CliContext, args: argparse.Namespace) -> int:
+    job_name = _cli_existing_job(context, args.job)
+    summary = merge_shards(context.job_dir(job_name), job_name)
+    print(
+        f"[merge] {summary['shards']} shard(s): {summary['merged']} pair(s) merged, "
+        f"{summary['already_present']} already in DOCKING, {summary['failed']} failed pair(s) recorded.",
+        flush=True,
+    )
+    return 0
+
+
+def build_cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="codoc", description="Run CODOC pipeline steps without the GUI.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--settings", default="", help="Settings file (default: .codoc_settings.json next to CODOC.py).")
+    common.add_argument("--job", default="", help="Job name under JOBS (default: the active job of the settings file).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ligands = subparsers.add_parser("ligands", parents=[common], help="Run Step 2 ligand operations, in the given order.")
+    ligands.add_argument("operations", nargs="+", choices=LIGAND_OPERATIONS, metavar="OPERATION",
+                         help=f"One or more of: {', '.join(LIGAND_OPERATIONS)}.")
+    ligands.set_defaults(handler=_cli_ligands)
+
+    target = subparsers.add_parser("target", parents=[common], help="Prepare a receptor (Step 3) into TARGETS.")
+    target.add_argument("--input", default="", help="Receptor PDB/PQR to protonate and convert to protein.pdbqt.")
+    target.add_argument("--rigid", default="", help="Prepared protein_rigid.pdbqt (flexible docking).")
+    target.add_argument("--flex", default="", help="Prepared protein_flex.pdbqt (flexible docking).")
+    target.add_argument("--name", default="", help="Target folder name (default: derived from the file name).")
+    target.add_argument("--grid", default="", help="grid.txt to copy (default: written from the settings' grid box).")
+    target.add_argument("--ph", type=float, default=None, help="Protonation pH (default: the settings' target pH).")
+    target.add_argument("--primary", action="store_true", help="Mark the target as the primary target of a selectivity cascade.")
+    target.set_defaults(handler=_cli_target)
+
+    dock = subparsers.add_parser("dock", parents=[common], help="Dock a job (Step 4); resumes an existing job.")
+    dock.add_argument("--new", action="store_true", help="Create a new job from the settings file and dock it.")
+    dock.add_argument("--shard", default="", help="Dock only shard i/N of the job, e.g. $SLURM_ARRAY_TASK_ID/16.")
+    dock.set_defaults(handler=_cli_dock)
+
+    rescore = subparsers.add_parser("rescore", parents=[common], help="score_only a job's poses (or a pose folder) in bulk.")
+    rescore.add_argument("--functions", default="", help="Scoring functions, e.g. vina,vinardo,ad4 (default: the settings' list).")
+    rescore.add_argument("--prescreen", action="store_true", help="Rescore the funnel prescreen poses instead of DOCKING.")
+    rescore.add_argument("--poses", default="", help="Folder of pose PDBQTs to rescore instead of a job; needs --target.")
+    rescore.add_argument("--target", default="", help="Prepared target the --poses folder was docked against.")
+    rescore.set_defaults(handler=_cli_rescore)
+
+    report = subparsers.add_parser("report", parents=[common], help="Rebuild the result CSV and write the final report.")
+    report.add_argument("--top", type=int, default=None, help="Number of top results in the report.")
+    report.add_argument("--rmsd", type=float, default=None, help="RMSD limit of the reported poses.")
+    report.set_defaults(handler=_cli_report)
+
+    merge = subparsers.add_parser("merge", parents=[common], help="Merge the shards of a job into its DOCKING folder.")
+    merge.set_defaults(handler=_cli_merge)
+    return parser
+
+
+def run_cli(argv: list[str]) -> int:
+    args = build_cli_parser().parse_args(argv)
+    try:
+        context = load_cli_context(args.settings)
+        return args.handler(context, args)
+    except (OSError, ValueError, RuntimeError, TargetPrepareError) as exc:
+        print(f"[codoc] {exc}", file=sys.stderr)
+        return 2
+
+
 def main() -> int:
+    if _HEADLESS:
+        return run_cli(sys.argv[1:])
+
     app = QApplication(sys.argv)
     dp_dir = os.path.abspath(os.path.dirname(__file__))
     splash = SplashScreen(dp_dir)
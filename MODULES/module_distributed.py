@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""Distributed docking over TCP (Step 4, DISTRIBUTED processing type).
+
+A Coordinator runs inside DockingWorker and leases batches of (target, ligand) pairs to
+``codoc-worker`` processes, which may run on any machine that can reach it:
+
+    python3 -m MODULES.module_distributed --host <coordinator host> --port 5765
+
+The protocol is one JSON object per line. Receptor, ligand and pose files travel base64
+encoded inside the messages, so a worker needs only the AutoDock Vina binary, not a shared
+filesystem; receptors are sent once per connection and cached by SHA-256 on the worker.
+
+Every batch is a lease. While it docks, the worker sends heartbeats; a worker that
+disconnects, or stays silent for ``lease_timeout`` seconds, loses its lease and the pairs
+it had not returned go back to the queue for another worker. Each lease counts as an
+attempt for its pairs, so a ligand that keeps killing workers is eventually reported as
+failed instead of being handed out forever. Results are only taken for pairs of a live
+lease held by the connection that sends them; a slow worker answering after its lease
+expired is ignored, the pair was already queued again.
+
+Without a shared token the coordinator listens on 127.0.0.1 only: anyone who can connect
+can hand back poses, so accepting remote workers requires ``--token`` on both sides.
+
+Kept free of PyQt so workers run on headless machines and the protocol can be tested
+with several workers on localhost.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import os
+import platform
+import queue
+import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+DEFAULT_PORT = 5765
+PROTOCOL_VERSION = 1
+WAIT_SECONDS = 2.0
+
+PairKey = tuple[str, str, str]
+
+# Ligand names as CODOC writes them (see _sanitize_name) and receptor digests as sent by _file_ref.
+_SAFE_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _pair_key(job: dict[str, Any]) -> PairKey:
+    return (job["target_name"], job["ligand_group"], job["ligand_name"])
+
+
+def _encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode(text: str) -> bytes:
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _send(stream: Any, lock: threading.Lock, message: dict[str, Any]) -> None:
+    data = (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+    with lock:
+        stream.write(data)
+        stream.flush()
+
+
+def _read(stream: Any) -> Optional[dict[str, Any]]:
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+class _Lease:
+    def __init__(self, lease_id: int, jobs: list[dict[str, Any]], worker: str, deadline: float) -> None:
+        self.lease_id = lease_id
+        self.jobs = jobs
+        self.worker = worker
+        self.deadline = deadline
+
+
+class Coordinator:
+    """TCP server handing pending docking jobs to codoc-worker processes.
+
+    `jobs` are DockingWorker job dicts; `params` holds the docking settings sent to every
+    worker. Progress comes back through next_event(), as tuples of
+    ("lease", [jobs], worker, ""), ("done", job, pose bytes, worker) or
+    ("failed", job, log, worker), so all result handling stays on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        jobs: list[dict[str, Any]],
+        params: dict[str, Any],
+        batch_size: int = 8,
+        host: Optional[str] = None,
+        port: int = DEFAULT_PORT,
+        token: str = "",
+        lease_timeout: float = 120.0,
+        max_attempts: int = 2,
+    ) -> None:
+        if host is None:
+            host = "0.0.0.0" if token else "127.0.0.1"
+        elif not token and host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError("A coordinator reachable from other machines needs a worker token.")
+        self.params = params
+        self.token = token
+        self.lease_timeout = float(lease_timeout)
+        self.max_attempts = max(1, int(max_attempts))
+        self._lock = threading.Lock()
+        self._events: queue.Queue = queue.Queue()
+        self._pending: collections.deque[list[dict[str, Any]]] = collections.deque()
+        self._leases: dict[int, _Lease] = {}
+        self._next_lease = 1
+        self._attempts: dict[PairKey, int] = {}
+        self._held = False
+        self._draining = False
+        self._jobs: dict[PairKey, dict[str, Any]] = {_pair_key(job): job for job in jobs}
+        self._remaining: set[PairKey] = set(self._jobs)
+        grouped: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for job in jobs:
+            grouped.setdefault((job["target_name"], job["ligand_group"]), []).append(job)
+        size = max(1, int(batch_size))
+        for group_jobs in grouped.values():
+            for start in range(0, len(group_jobs), size):
+                self._pending.append(group_jobs[start:start + size])
+
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                coordinator._serve_connection(self.rfile, self.wfile, self.client_address[0])
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server((host, int(port)), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="codoc-coordinator", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return int(self._server.server_address[1])
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "Coordinator":
+        self.start()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    def finished(self) -> bool:
+        """True once every pair is resolved (or, after drain(), every lease is back) and all
+        events were taken with next_event()."""
+        with self._lock:
+            settled = not self._remaining or (self._draining and not self._leases)
+        return settled and self._events.empty()
+
+    def hold(self, held: bool) -> None:
+        """Stop (or restart) handing out leases; workers are told to wait meanwhile."""
+        with self._lock:
+            self._held = held
+
+    def drain(self) -> None:
+        """Hand out no more leases and tell workers to quit; outstanding leases still report."""
+        with self._lock:
+            self._draining = True
+
+    def _resolved(self) -> bool:
+        with self._lock:
+            return not self._remaining
+
+    def next_event(self, timeout: float = 1.0) -> Optional[tuple[str, Any, Any, str]]:
+        """Next lease/result event, or None after `timeout`. Also reclaims expired leases."""
+        self._expire_leases()
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # --- lease bookkeeping ----------------------------------------------------------------
+
+    def _expire_leases(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [lease for lease in self._leases.values() if lease.deadline < now]
+            for lease in expired:
+                self._requeue_locked(lease, f"Lease {lease.lease_id} on {lease.worker} expired after {self.lease_timeout:g} s without a heartbeat.")
+
+    def _requeue_locked(self, lease: _Lease, reason: str) -> None:
+        self._leases.pop(lease.lease_id, None)
+        retry: list[dict[str, Any]] = []
+        for job in lease.jobs:
+            key = _pair_key(job)
+            if key not in self._remaining:
+                continue
+            if self._attempts.get(key, 0) >= self.max_attempts:
+                self._remaining.discard(key)
+                self._events.put(("failed", job, reason, lease.worker))
+            else:
+                retry.append(job)
+        if retry:
+            self._pending.appendleft(retry)
+
+    def _lease_batch(self, worker: str) -> Optional[_Lease]:
+        with self._lock:
+            while self._pending and not (self._held or self._draining):
+                jobs = [job for job in self._pending.popleft() if _pair_key(job) in self._remaining]
+                if not jobs:
+                    continue
+                for job in jobs:
+                    key = _pair_key(job)
+                    self._attempts[key] = self._attempts.get(key, 0) + 1
+                lease = _Lease(self._next_lease, jobs, worker, time.monotonic() + self.lease_timeout)
+                self._next_lease += 1
+                self._leases[lease.lease_id] = lease
+                self._events.put(("lease", jobs, worker, ""))
+                return lease
+        return None
+
+    def _renew(self, lease_id: int, worker: str) -> None:
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is not None and lease.worker == worker:
+                lease.deadline = time.monotonic() + self.lease_timeout
+
+    def _complete(self, lease_id: int, results: list[dict[str, Any]], worker: str) -> None:
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is None or lease.worker != worker:
+                return  # expired (its pairs are queued again) or not this worker's lease
+            del self._leases[lease_id]
+            leased = {_pair_key(job) for job in lease.jobs}
+            returned: set[PairKey] = set()
+            for result in results:
+                key = tuple(result.get("key", ()))
+                if key not in leased:
+                    continue
+                returned.add(key)
+                job = self._jobs[key]
+                if key not in self._remaining:
+                    continue
+                if result.get("pose") and not result.get("error"):
+                    self._remaining.discard(key)
+                    self._events.put(("done", job, _decode(result["pose"]), worker))
+                elif self._attempts.get(key, 0) >= self.max_attempts:
+                    self._remaining.discard(key)
+                    self._events.put(("failed", job, result.get("error") or "The worker returned no pose.", worker))
+                else:
+                    self._pending.append([job])
+            lease.jobs = [job for job in lease.jobs if _pair_key(job) not in returned]
+            if lease.jobs:
+                self._requeue_locked(lease, f"{worker} returned no result for these pairs.")
+
+    def _release(self, lease_ids: set[int], worker: str) -> None:
+        with self._lock:
+            for lease_id in lease_ids:
+                lease = self._leases.get(lease_id)
+                if lease is not None:
+                    self._requeue_locked(lease, f"{worker} disconnected while holding lease {lease_id}.")
+
+    # --- one worker connection ----------------------------------------------------------
+
+    def _file_ref(self, path: str, sent: set[str]) -> dict[str, Any]:
+        data = Path(path).read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        ref: dict[str, Any] = {"sha": digest, "name": os.path.basename(path)}
+        if digest not in sent:
+            ref["data"] = _encode(data)
+            sent.add(digest)
+        return ref
+
+    def _batch_message(self, lease: _Lease, sent: set[str]) -> dict[str, Any]:
+        first = lease.jobs[0]
+        return {
+            "type": "batch",
+            "lease": lease.lease_id,
+            "heartbeat": max(1.0, self.lease_timeout / 3.0),
+            "params": self.params,
+            "receptor": self._file_ref(first["receptor"], sent),
+            "flex": self._file_ref(first["flex_receptor"], sent) if self.params.get("flexible") else None,
+            "center": [float(first["center_x"]), float(first["center_y"]), float(first["center_z"])],
+            "size": [float(first["size_x"]), float(first["size_y"]), float(first["size_z"])],
+            "ligands": [
+                {
+                    "key": list(_pair_key(job)),
+                    "name": job["ligand_name"],
+                    "data": _encode(Path(job["ligand_file"]).read_bytes()),
+                    "exhaustiveness": job.get("exhaustiveness", self.params["exhaustiveness"]),
+                }
+                for job in lease.jobs
+            ],
+        }
+
+    def _serve_connection(self, reader: Any, writer: Any, address: str) -> None:
+        lock = threading.Lock()
+        hello = _read(reader)
+        if not hello or hello.get("type") != "hello":
+            return
+        token = str(hello.get("token") or "")
+        if hello.get("version") != PROTOCOL_VERSION or not hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8")):
+            _send(writer, lock, {"type": "error", "message": "Rejected: protocol version or token mismatch."})
+            return
+        worker = f"{hello.get('worker') or 'worker'}@{address}"
+        sent: set[str] = set()
+        held: set[int] = set()
+        try:
+            while True:
+                message = _read(reader)
+                if message is None:
+                    break
+                kind = message.get("type")
+                if kind == "request":
+                    lease = self._lease_batch(worker)
+                    if lease is not None:
+                        held.add(lease.lease_id)
+                        _send(writer, lock, self._batch_message(lease, sent))
+                    elif self._resolved() or self._draining:
+                        _send(writer, lock, {"type": "done"})
+                    else:
+                        _send(writer, lock, {"type": "wait", "seconds": WAIT_SECONDS})
+                elif kind == "heartbeat":
+                    lease_id = int(message.get("lease", 0))
+                    if lease_id in held:
+                        self._renew(lease_id, worker)
+                elif kind == "result":
+                    lease_id = int(message.get("lease", 0))
+                    if lease_id in held:
+                        held.discard(lease_id)
+                        self._complete(lease_id, message.get("results", []), worker)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._release(held, worker)
+
+
+# --- codoc-worker ---------------------------------------------------------------------------
+
+
+def _torsdof(ligand_text: str) -> int:
+    for line in ligand_text.splitlines():
+        if line.startswith("TORSDOF"):
+            parts = line.split()
+            if len(parts) > 1 and parts[1].isdigit():
+                return int(parts[1])
+    return 0
+
+
+def _safe_name(name: Any) -> str:
+    """`name` if it is a plain file name CODOC could have written; raises ValueError otherwise."""
+    text = str(name or "")
+    if os.path.basename(text) != text or text in (".", "..") or not _SAFE_NAME_RE.match(text):
+        raise ValueError(f"Refusing unsafe file name from the coordinator: {text!r}")
+    return text
+
+
+def _cached_file(cache_dir: str, ref: dict[str, Any]) -> str:
+    sha = str(ref.get("sha") or "")
+    if not _SHA256_RE.match(sha):
+        raise RuntimeError(f"Refusing receptor with a malformed SHA-256 from the coordinator: {sha!r}")
+    suffix = re.sub(r"[^A-Za-z0-9_.-]+", "_", os.path.basename(str(ref.get("name") or "")))
+    path = os.path.join(cache_dir, f"{sha}_{suffix}")
+    if "data" in ref and not os.path.isfile(path):
+        data = _decode(ref["data"])
+        if hashlib.sha256(data).hexdigest() != sha:
+            raise RuntimeError(f"Receptor file {ref.get('name')} does not match its SHA-256.")
+        with open(path + ".part", "wb") as handle:
+            handle.write(data)
+        os.replace(path + ".part", path)
+    if not os.path.isfile(path):
+        raise RuntimeError(f"Receptor file {ref['name']} was neither sent nor cached.")
+    return path
+
+
+def _dock_ligand(vina: str, cpu: int, batch: dict[str, Any], receptor: str, flex: str, ligand: dict[str, Any], work_dir: str) -> dict[str, Any]:
+    params = batch["params"]
+    try:
+        name = _safe_name(ligand.get("name"))
+    except ValueError as exc:
+        return {"key": ligand.get("key"), "error": str(exc)}
+    ligand_text = _decode(ligand["data"]).decode("utf-8", errors="ignore")
+    ligand_path = os.path.join(work_dir, f"{name}.pdbqt")
+    output_path = os.path.join(work_dir, f"{name}_out.pdbqt")
+    config_path = os.path.join(work_dir, "config.txt")
+    with open(ligand_path, "w", encoding="utf-8") as handle:
+        handle.write(ligand_text)
+    lines = [f"receptor = {receptor}"]
+    if flex:
+        lines.append(f"flex = {flex}")
+    lines += [
+        f"ligand = {ligand_path}",
+        f"scoring = {params['scoring']}",
+        f"center_x = {batch['center'][0]}",
+        f"center_y = {batch['center'][1]}",
+        f"center_z = {batch['center'][2]}",
+        f"size_x = {batch['size'][0]}",
+        f"size_y = {batch['size'][1]}",
+        f"size_z = {batch['size'][2]}",
+        f"out = {output_path}",
+        f"cpu = {cpu}",
+        f"exhaustiveness = {ligand.get('exhaustiveness', params['exhaustiveness'])}",
+        f"num_modes = {params['poses']}",
+        f"min_rmsd = {params['min_rmsd']}",
+        f"energy_range = {params['energy_range']}",
+        f"spacing = {params['spacing']}",
+    ]
+    if int(params.get("seed", 0)):
+        lines.append(f"seed = {params['seed']}")
+    if params["docking_mode"] == "score_only":
+        lines.append("score_only = true")
+    elif params["docking_mode"] == "local_only":
+        lines.append("local_only = true")
+    with open(config_path, "w", encoding="utf-8") as handle:
+        handle.write("\n".join(lines) + "\n")
+    timeout = 0
+    if int(params.get("pair_timeout", 0)) > 0:
+        timeout = int(params["pair_timeout"]) + int(params.get("pair_timeout_per_torsion", 0)) * _torsdof(ligand_text)
+    try:
+        result = subprocess.run([vina, "--config", config_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout or None)
+    except subprocess.TimeoutExpired as exc:
+        output = exc.stdout if isinstance(exc.stdout, str) else (exc.stdout or b"").decode("utf-8", errors="ignore")
+        return {"key": ligand["key"], "error": f"{output}\nKilled after {timeout} s."}
+    if result.returncode != 0 or not os.path.isfile(output_path):
+        return {"key": ligand["key"], "error": result.stdout or f"Vina exited with code {result.returncode}."}
+    return {"key": ligand["key"], "pose": _encode(Path(output_path).read_bytes())}
+
+
+def run_worker(host: str, port: int, vina: str, cpu: int, token: str = "", name: str = "", cache_dir: str = "") -> int:
+    """Dock batches leased from a coordinator until it reports the job done. Returns the pair count docked."""
+    if not os.path.isfile(vina):
+        raise RuntimeError(f"AutoDock Vina not found: {vina}")
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "codoc_worker_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    name = name or f"{platform.node()}:{os.getpid()}"
+    docked = 0
+    with socket.create_connection((host, int(port))) as sock:
+        stream = sock.makefile("rwb")
+        lock = threading.Lock()
+        _send(stream, lock, {"type": "hello", "version": PROTOCOL_VERSION, "worker": name, "token": token})
+        while True:
+            _send(stream, lock, {"type": "request"})
+            reply = _read(stream)
+            if reply is None or reply.get("type") == "done":
+                break
+            if reply.get("type") == "error":
+                raise RuntimeError(reply.get("message", "The coordinator rejected this worker."))
+            if reply.get("type") == "wait":
+                time.sleep(float(reply.get("seconds", WAIT_SECONDS)))
+                continue
+            receptor = _cached_file(cache_dir, reply["receptor"])
+            flex = _cached_file(cache_dir, reply["flex"]) if reply.get("flex") else ""
+            stop = threading.Event()
+
+            def heartbeat(lease_id: int = reply["lease"], interval: float = float(reply.get("heartbeat", 30.0))) -> None:
+                while not stop.wait(interval):
+                    try:
+                        _send(stream, lock, {"type": "heartbeat", "lease": lease_id})
+                    except OSError:
+                        return
+
+            beater = threading.Thread(target=heartbeat, daemon=True)
+            beater.start()
+            work_dir = tempfile.mkdtemp(prefix="codoc_worker_")
+            try:
+                results = [_dock_ligand(vina, cpu, reply, receptor, flex, ligand, work_dir) for ligand in reply["ligands"]]
+            finally:
+                stop.set()
+                beater.join()
+                shutil.rmtree(work_dir, ignore_errors=True)
+            _send(stream, lock, {"type": "result", "lease": reply["lease"], "results": results})
+            docked += sum(1 for result in results if "pose" in result)
+            print(f"[codoc-worker] {name}: {len(results)} ligand(s) of lease {reply['lease']} returned ({docked} docked so far)", flush=True)
+    return docked
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    app_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(prog="codoc-worker", description="Dock CODOC batches leased from a DockingWorker coordinator.")
+    parser.add_argument("--host", required=True, help="Host name or address of the machine running the CODOC docking job.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", default="", help="Shared token configured in the CODOC docking settings.")
+    parser.add_argument("--vina", default=str(app_dir / "bin" / "vina_1.2.5_linux_x86_64"), help="AutoDock Vina binary.")
+    parser.add_argument("--cpu", type=int, default=max(1, os.cpu_count() or 1), help="CPU threads per Vina run.")
+    parser.add_argument("--name", default="", help="Worker name shown in the CODOC log.")
+    parser.add_argument("--cache-dir", default="", help="Folder caching receptors between batches.")
+    args = parser.parse_args(argv)
+    try:
+        docked = run_worker(args.host, args.port, args.vina, args.cpu, args.token, args.name, args.cache_dir)
+    except (OSError, RuntimeError) as exc:
+        print(f"[codoc-worker] {exc}", file=sys.stderr)
+        return 1
+    print(f"[codoc-worker] Job finished; {docked} pair(s) docked by this worker.", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
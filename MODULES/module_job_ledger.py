@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Per-job SQLite ledger of docking pairs (Step 4).
+
+Every (target, ligand databank, ligand) pair of a job is one row holding its state
+(pending, running, done, failed, or skipped by a selectivity cascade), start/finish timestamps, attempt count, best energy
+and the last error. The ledger lives next to the results as DOCKING/docking_ledger.sqlite
+and replaces the old RESTART scan, which called os.path.isfile() on every target x ligand
+output path before docking could start: finding the finished work is now one indexed query.
+
+The database runs in WAL mode, so other tools (a terminal, a notebook, the report) can read
+progress while a docking run is writing to it.
+
+Kept free of PyQt so it can be unit-tested and reused without a running GUI.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+LEDGER_FILENAME = "docking_ledger.sqlite"
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_SKIPPED = "skipped"
+
+PairKey = tuple[str, str, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairs (
+    target TEXT NOT NULL,
+    ligand_group TEXT NOT NULL,
+    ligand TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    energy REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT,
+    finished_at TEXT,
+    error TEXT,
+    PRIMARY KEY (target, ligand_group, ligand)
+);
+CREATE INDEX IF NOT EXISTS idx_pairs_state ON pairs (state);
+"""
+
+
+def ledger_path(result_folder: str) -> str:
+    return os.path.join(result_folder, LEDGER_FILENAME)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _energy_or_none(energy: str | float | None) -> Optional[float]:
+    try:
+        return float(energy) if energy not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class JobLedger:
+    """Thread-safe handle on one job's ledger database."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "JobLedger":
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pairs LIMIT 1").fetchone() is None
+
+    def register(self, keys: Iterable[PairKey]) -> None:
+        """Add pairs as pending; pairs already in the ledger keep their state."""
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO pairs (target, ligand_group, ligand) VALUES (?, ?, ?)", keys)
+            self._conn.commit()
+
+    def pairs_in_state(self, state: str) -> set[PairKey]:
+        with self._lock:
+            rows = self._conn.execute("SELECT target, ligand_group, ligand FROM pairs WHERE state = ?", (state,)).fetchall()
+        return {(row[0], row[1], row[2]) for row in rows}
+
+    def errors_in_state(self, state: str) -> list[tuple[PairKey, str]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT target, ligand_group, ligand, error FROM pairs WHERE state = ?", (state,)).fetchall()
+        return [((row[0], row[1], row[2]), row[3] or "") for row in rows]
+
+    def done_energies(self) -> list[tuple[PairKey, Optional[float]]]:
+        """Finished pairs with their best energy (None when the ledger was seeded by a folder scan)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT target, ligand_group, ligand, energy FROM pairs WHERE state = 'done'").fetchall()
+        return [((row[0], row[1], row[2]), row[3]) for row in rows]
+
+    def mark_running(self, keys: Iterable[PairKey]) -> None:
+        now = _now()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO pairs (target, ligand_group, ligand, state, attempts, started_at) VALUES (?, ?, ?, 'running', 1, ?) "
+                "ON CONFLICT (target, ligand_group, ligand) DO UPDATE SET state = 'running', attempts = attempts + 1, "
+                "started_at = excluded.started_at, finished_at = NULL, error = NULL",
+                [(*key, now) for key in keys],
+            )
+            self._conn.commit()
+
+    def mark_done(self, key: PairKey, energy: str | float | None) -> None:
+        self.mark_done_many([(key, energy)])
+
+    def mark_done_many(self, results: Iterable[tuple[PairKey, str | float | None]]) -> None:
+        now = _now()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO pairs (target, ligand_group, ligand, state, energy, finished_at) VALUES (?, ?, ?, 'done', ?, ?) "
+                "ON CONFLICT (target, ligand_group, ligand) DO UPDATE SET state = 'done', energy = excluded.energy, "
+                "finished_at = excluded.finished_at, error = NULL",
+                [(*key, _energy_or_none(energy), now) for key, energy in results],
+            )
+            self._conn.commit()
+
+    def mark_failed(self, key: PairKey, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO pairs (target, ligand_group, ligand, state, finished_at, error) VALUES (?, ?, ?, 'failed', ?, ?) "
+                "ON CONFLICT (target, ligand_group, ligand) DO UPDATE SET state = 'failed', "
+                "finished_at = excluded.finished_at, error = excluded.error",
+                (*key, _now(), error),
+            )
+            self._conn.commit()
+
+    def mark_skipped_many(self, keys: Iterable[PairKey], reason: str) -> None:
+        """Record pairs a run decided not to dock; a later run may still dock them."""
+        now = _now()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO pairs (target, ligand_group, ligand, state, finished_at, error) VALUES (?, ?, ?, 'skipped', ?, ?) "
+                "ON CONFLICT (target, ligand_group, ligand) DO UPDATE SET state = 'skipped', "
+                "finished_at = excluded.finished_at, error = excluded.error",
+                [(*key, now, reason) for key in keys],
+            )
+            self._conn.commit()
+
+    def reset_running(self) -> int:
+        """Return pairs left 'running' by an interrupted run to 'pending'."""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE pairs SET state = 'pending' WHERE state = 'running'")
+            self._conn.commit()
+            return cursor.rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM pairs GROUP BY state").fetchall()
+        counts = {STATE_PENDING: 0, STATE_RUNNING: 0, STATE_DONE: 0, STATE_FAILED: 0, STATE_SKIPPED: 0}
+        counts.update({state: int(count) for state, count in rows})
+        return counts
+
+
+def read_pairs_in_state(result_folder: str, state: str) -> set[PairKey]:
+    """Pairs of a job's ledger in `state`, opened read-only; empty when there is no ledger."""
+    path = ledger_path(result_folder)
+    if not os.path.isfile(path):
+        return set()
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=60)
+    try:
+        rows = conn.execute("SELECT target, ligand_group, ligand FROM pairs WHERE state = ?", (state,)).fetchall()
+    finally:
+        conn.close()
+    return {(row[0], row[1], row[2]) for row in rows}
+
+
+def read_progress(result_folder: str) -> dict[str, int]:
+    """Per-state pair counts of a job's ledger, opened read-only (safe during a live run)."""
+    path = ledger_path(result_folder)
+    if not os.path.isfile(path):
+        return {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    try:
+        rows = conn.execute("SELECT state, COUNT(*) FROM pairs GROUP BY state").fetchall()
+    finally:
+        conn.close()
+    return {state: int(count) for state, count in rows}
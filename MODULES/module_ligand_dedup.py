@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""InChIKey index of the ligand library, used to dock each unique structure once (Steps 2 and 4).
+
+Merged libraries (ZINC, ChEMBL, COCONUT, in-house sets) share many molecules under other
+names. The "Find duplicate ligands" action of Step 2 computes the InChIKey of every ligand
+PDBQT and keeps it in LIGANDS/ligand_inchikeys.csv (skipped by the multi-model split):
+
+    LIGAND DATABANK, LIGAND, INCHIKEY, SIZE, MTIME_NS
+
+SIZE and MTIME_NS are the ligand file's stat() when its key was computed, so a later run of
+the action only recomputes new or changed files, and docking ignores entries whose file has
+changed since. With "Collapse duplicates" on, DockingWorker docks one copy of each InChIKey
+per target and fans the pose and the CSV row out to every other databank and name the
+structure appears under. This only holds for a full search (normal docking mode): score_only
+and local_only start from each file's own coordinates, so every copy is docked then.
+
+Kept free of PyQt (and of RDKit: the keys themselves are computed by the ligand worker).
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+from typing import Iterable
+
+INCHIKEY_INDEX_FILENAME = "ligand_inchikeys.csv"
+INCHIKEY_INDEX_HEADER = ["LIGAND DATABANK", "LIGAND", "INCHIKEY", "SIZE", "MTIME_NS"]
+
+LigandKey = tuple[str, str]
+FileSignature = tuple[int, int]
+
+
+def inchikey_index_path(ligands_dir: str) -> str:
+    return os.path.join(ligands_dir, INCHIKEY_INDEX_FILENAME)
+
+
+def is_inchikey_index(path: str) -> bool:
+    """True for the index (or its scratch file), which lives among the multi-model files of LIGANDS."""
+    return os.path.basename(path) in {INCHIKEY_INDEX_FILENAME, f"{INCHIKEY_INDEX_FILENAME}.tmp"}
+
+
+def file_signature(path: str) -> FileSignature:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_inchikey_index(ligands_dir: str) -> dict[LigandKey, tuple[str, FileSignature]]:
+    """{(databank, ligand): (InChIKey, file signature)}; empty when the index was never built."""
+    path = inchikey_index_path(ligands_dir)
+    if not os.path.isfile(path):
+        return {}
+    entries: dict[LigandKey, tuple[str, FileSignature]] = {}
+    with open(path, "r", encoding="utf-8", newline="") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                signature = (int(row["SIZE"]), int(row["MTIME_NS"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if row.get("INCHIKEY"):
+                entries[(row["LIGAND DATABANK"], row["LIGAND"])] = (row["INCHIKEY"], signature)
+    return entries
+
+
+def write_inchikey_index(ligands_dir: str, entries: dict[LigandKey, tuple[str, FileSignature]]) -> str:
+    """Replace the index with `entries` (written to a scratch file, then renamed). Returns its path."""
+    path = inchikey_index_path(ligands_dir)
+    scratch = f"{path}.tmp"
+    with open(scratch, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(INCHIKEY_INDEX_HEADER)
+        for (group, ligand), (inchikey, (size, mtime_ns)) in sorted(entries.items()):
+            writer.writerow([group, ligand, inchikey, size, mtime_ns])
+    os.replace(scratch, path)
+    return path
+
+
+def duplicate_sets(entries: Iterable[tuple[LigandKey, str]]) -> dict[str, list[LigandKey]]:
+    """InChIKeys shared by more than one (databank, ligand), with every ligand carrying them."""
+    by_key: dict[str, list[LigandKey]] = {}
+    for ligand, inchikey in entries:
+        by_key.setdefault(inchikey, []).append(ligand)
+    return {inchikey: sorted(ligands) for inchikey, ligands in by_key.items() if len(ligands) > 1}
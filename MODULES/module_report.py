@@ -54,6 +54,7 @@ LIGAND_ACTION_LABELS = [
     ("reject_pdbqt", "Reject invalid PDBQT"),
     ("recover_pdbqt", "Recover failed ligands"),
     ("fix_macrocycles", "Fix macrocycles for GPU"),
+    ("find_duplicates", "Find duplicate ligands"),
 ]
 
 
@@ -256,6 +257,28 @@ def _add_docking_parameters(document: Any, docking: dict[str, Any], ligand: dict
     _field_line(document, "Minimum RMSD", f"{_fmt_num(docking.get('min_rmsd', ''))} Angstrom")
     _field_line(document, "Energy range", f"{_fmt_num(docking.get('energy_range', ''))} Kcal/mol")
     _field_line(document, "Exhaustiveness", docking.get("exhaustiveness", ""))
+    if docking.get("funnel_mode"):
+        _field_line(
+            document,
+            "Screening funnel",
+            f"prescreen exhaustiveness {docking.get('funnel_prescreen_exhaustiveness', '')}, "
+            f"top {_fmt_num(docking.get('funnel_top_percent', ''))}% per target redocked",
+        )
+    if docking.get("cascade_mode"):
+        top_n = docking.get("cascade_top_n") or 0
+        _field_line(
+            document,
+            "Selectivity cascade",
+            f"other targets docked for ligands at or below {_fmt_num(docking.get('cascade_energy_threshold', ''))} Kcal/mol"
+            + (f" or in the top {top_n}" if top_n else "")
+            + " on the primary target",
+        )
+    if docking.get("ensemble_mode"):
+        _field_line(
+            document,
+            "Receptor ensemble",
+            f"reference poses refined with local_only, full search above {_fmt_num(docking.get('ensemble_margin', ''))} Kcal/mol",
+        )
     _field_line(document, "Conversion engine", ligand.get("conversion_engine", ""))
     _field_line(document, "Minimization algorithm", ligand.get("minimization_algorithm", ""))
     _field_line(document, "Minimization force field", ligand.get("minimization_forcefield", ""))
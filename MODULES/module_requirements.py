@@ -58,6 +58,7 @@ CODOC_PYTHON_DEFAULTS = {
     "meeko": "meeko>=0.5,<0.8",
     "dimorphite-dl": "dimorphite-dl>=2.0,<3.0",
     "python-docx": "python-docx>=1.1,<2.0",
+    "vina": "vina>=1.2.5,<1.3",
 }
 
 CODOC_SYSTEM_DEFAULTS = {
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Bulk score_only rescoring of existing poses (Step 5).
+
+Rescoring asks one question per pose - "what does scoring function X say about this exact
+pose?" - so it needs no search and no Vina process per pose. RescoreWorker keeps one warm
+Vina engine per scoring function in every worker process (receptor and maps loaded once
+per target) and streams pose 1 of each pose file through them in chunks.
+
+Two sources are supported:
+
+- a job's result folder (DOCKING or PRESCREEN): every <target>/<databank>/<ligand>/<ligand>.pdbqt;
+  the scores become extra columns of the job's run CSV, one per scoring function:
+
+      LIGAND, SMILES, LIGAND DATABANK, TARGET, BINDING ENERGY (Kcal/mol), RMSD (mean), VINARDO SCORE (Kcal/mol), ...
+
+- any folder of ligand poses (*.pdbqt, searched recursively) against one prepared target;
+  the scores go to <folder>/rescored.csv (LIGAND, LIGAND DATABANK = subfolder, TARGET, POSE FILE, ...).
+
+Columns of an earlier rescoring with the same function are replaced; other columns are kept,
+also when the run CSV is rebuilt from the pose files.
+
+Kept free of PyQt (and of vina: the engines live in the worker processes of CODOC.py).
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+from typing import Iterable
+
+RESCORE_SCORING_FUNCTIONS = ("vina", "vinardo", "ad4")
+RESCORED_CSV_FILENAME = "rescored.csv"
+RESCORED_CSV_HEADER = ["LIGAND", "LIGAND DATABANK", "TARGET", "POSE FILE"]
+# Rows of the run CSV are matched by (TARGET, LIGAND DATABANK, LIGAND).
+_KEY_COLUMNS = ("TARGET", "LIGAND DATABANK", "LIGAND")
+
+PairKey = tuple[str, str, str]
+
+
+def score_column(scoring_function: str) -> str:
+    return f"{scoring_function.upper()} SCORE (Kcal/mol)"
+
+
+def is_score_column(column: str) -> bool:
+    return column in {score_column(name) for name in RESCORE_SCORING_FUNCTIONS}
+
+
+def parse_scoring_functions(text: str) -> list[str]:
+    """Parse a comma-separated list of scoring functions, e.g. "vina, vinardo"."""
+    names: list[str] = []
+    for part in (text or "").replace(";", ",").split(","):
+        name = part.strip().lower()
+        if not name:
+            continue
+        if name not in RESCORE_SCORING_FUNCTIONS:
+            raise ValueError(f"Unknown scoring function '{part.strip()}': use {', '.join(RESCORE_SCORING_FUNCTIONS)}.")
+        if name not in names:
+            names.append(name)
+    if not names:
+        raise ValueError(f"Choose at least one scoring function to rescore with ({', '.join(RESCORE_SCORING_FUNCTIONS)}).")
+    return names
+
+
+def first_pose(text: str) -> str:
+    """Pose 1 of a (multi-model) Vina PDBQT as a single ligand Vina can read, without the
+    flexible residues of a flexible run or the pose's score remark; "" when it holds no atoms."""
+    lines: list[str] = []
+    in_residue = False
+    for line in text.splitlines(keepends=True):
+        if line.startswith("ENDMDL"):
+            break
+        if line.startswith("BEGIN_RES"):
+            in_residue = True
+        elif line.startswith("END_RES"):
+            in_residue = False
+        elif not in_residue and not line.startswith("MODEL") and "REMARK VINA RESULT:" not in line:
+            lines.append(line)
+    if not any(line.startswith(("ATOM", "HETATM")) for line in lines):
+        return ""
+    return "".join(lines)
+
+
+def read_score_columns(csv_path: str) -> tuple[list[str], dict[PairKey, dict[str, str]]]:
+    """Score columns of a run CSV and their values per (target, databank, ligand)."""
+    if not os.path.isfile(csv_path):
+        return [], {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as handle:
+        reader = csv.DictReader(handle)
+        columns = [column for column in (reader.fieldnames or []) if is_score_column(column)]
+        if not columns:
+            return [], {}
+        values = {
+            tuple(row.get(name) or "" for name in _KEY_COLUMNS): {column: row.get(column) or "" for column in columns}
+            for row in reader
+        }
+    return columns, values
+
+
+def merge_scores(csv_path: str, scores: dict[PairKey, dict[str, str]], scoring_functions: Iterable[str]) -> int:
+    """Write `scores` ({(target, databank, ligand): {scoring function: score}}) into the run
+    CSV as one column per scoring function. Returns the number of rows that got scores."""
+    with open(csv_path, "r", encoding="utf-8", newline="") as handle:
+        reader = csv.DictReader(handle)
+        header = list(reader.fieldnames or [])
+        rows = list(reader)
+    new_columns = [score_column(name) for name in scoring_functions]
+    header += [column for column in new_columns if column not in header]
+    updated = 0
+    for row in rows:
+        pair_scores = scores.get(tuple(row.get(name) or "" for name in _KEY_COLUMNS))
+        if pair_scores is None:
+            continue
+        for name in scoring_functions:
+            row[score_column(name)] = pair_scores.get(name, "")
+        updated += 1
+    scratch = f"{csv_path}.tmp"
+    with open(scratch, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=header, restval="", extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(scratch, csv_path)
+    return updated
+
+
+def write_rescored_csv(
+    poses_dir: str, scores: dict[PairKey, dict[str, str]], pose_files: dict[PairKey, str], scoring_functions: Iterable[str]
+) -> str:
+    """Write the scores of a folder of poses to <poses_dir>/rescored.csv. Returns its path."""
+    functions = list(scoring_functions)
+    path = os.path.join(poses_dir, RESCORED_CSV_FILENAME)
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(RESCORED_CSV_HEADER + [score_column(name) for name in functions])
+        for key in sorted(scores):
+            target_name, group, ligand = key
+            writer.writerow([ligand, group, target_name, pose_files.get(key, "")] + [scores[key].get(name, "") for name in functions])
+    return path
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of docking results shared by every job (Step 4).
+
+A finished pair is stored under a key built from what decides its result: the SHA-256 of
+the receptor (and flexible residues), the box, the SHA-256 of the ligand PDBQT, the scoring
+function, the engine with its version and search parameters and the seed. A random seed
+(0) is not reproducible, so runs with the cache on dock with CACHE_SEED instead. A later job - in any JOBS
+folder - that would dock the same receptor, box, ligand and parameters takes the cached pose
+file instead of running Vina again, so re-screening a databank after adding a few ligands
+only docks the new ones.
+
+    CACHE/<key[:2]>/<key>/pose.pdbqt     the pose file, hardlinked when on the same filesystem
+    CACHE/<key[:2]>/<key>/entry.json     energy, RMSD and the job output it was taken from
+
+Entries are built in a scratch folder and renamed into place, like the receptor map sets,
+so concurrent runs never see a half-written entry; the first run to finish a key keeps it.
+Pose files are hardlinked in both directions when possible, so the cache costs no extra
+space for results that are still in a job folder. Deleting the CACHE folder is always safe.
+
+Kept free of PyQt so it can be inspected and pruned from a terminal.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Any, Optional
+
+RESULT_CACHE_DIRNAME = "CACHE"
+POSE_FILENAME = "pose.pdbqt"
+ENTRY_FILENAME = "entry.json"
+CACHE_SEED = 42
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_key(fields: dict[str, Any]) -> str:
+    """Cache key of a docking pair from the fields that decide its result (JSON-serialisable)."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run_seed(seed: int, use_cache: bool) -> int:
+    """Seed a run docks with: a random seed (0) becomes CACHE_SEED when the result cache is on."""
+    return int(seed) or (CACHE_SEED if use_cache else 0)
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """Hardlink `source` to `destination` (replacing it), copying across filesystems."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    scratch = f"{destination}.{os.getpid()}.tmp"
+    try:
+        os.link(source, scratch)
+    except OSError:
+        shutil.copy2(source, scratch)
+    os.replace(scratch, destination)
+
+
+class ResultCache:
+    """Handle on a cache folder; safe to share between threads and processes."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, key: str) -> Optional[dict[str, Any]]:
+        """The entry's metadata plus its "pose" path, or None when the key is not cached."""
+        entry_dir = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, ENTRY_FILENAME), "r", encoding="utf-8") as handle:
+                entry = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        pose = os.path.join(entry_dir, POSE_FILENAME)
+        if not os.path.isfile(pose):
+            return None
+        entry["pose"] = pose
+        return entry
+
+    def fetch(self, key: str, destination: str) -> Optional[dict[str, Any]]:
+        """Place the cached pose file of `key` at `destination`; None on a miss."""
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        try:
+            link_or_copy(entry["pose"], destination)
+        except OSError:
+            return None
+        return entry
+
+    def store(self, key: str, pose_file: str, energy: str, rmsd: str) -> bool:
+        """Add a finished pair to the cache. False when the key was already cached."""
+        entry_dir = self.entry_dir(key)
+        if os.path.isfile(os.path.join(entry_dir, ENTRY_FILENAME)):
+            return False
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f".{key[:16]}_", dir=os.path.dirname(entry_dir))
+        try:
+            link_or_copy(pose_file, os.path.join(build_dir, POSE_FILENAME))
+            with open(os.path.join(build_dir, ENTRY_FILENAME), "w", encoding="utf-8") as handle:
+                json.dump(
+                    {
+                        "energy": energy,
+                        "rmsd": rmsd,
+                        "source": pose_file,
+                        "created": datetime.now().isoformat(timespec="seconds"),
+                    },
+                    handle,
+                    indent=2,
+                )
+            try:
+                os.rename(build_dir, entry_dir)
+            except OSError:
+                # Another run stored the same key first; keep theirs.
+                if not os.path.isfile(os.path.join(entry_dir, ENTRY_FILENAME)):
+                    raise
+                return False
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        return True
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Cooperative cancel / pause / resume for long-running workers (Steps 2 and 4).
+
+A RunControl is shared between the GUI thread, which flips it, and a worker with all
+the threads it runs. The worker asks checkpoint() before it schedules the next unit of
+work: while the run is paused the call blocks, and once the run is cancelled it returns
+False so the worker stops scheduling, lets whatever is already running finish (or not,
+see below), flushes its results and returns.
+
+External processes (Vina, Vina-GPU) are attach()ed while they run, so the control can act
+on them directly:
+
+- pause() sends SIGSTOP to each process group, which frees their CPU cores at once;
+  resume() sends SIGCONT;
+- a stopped process keeps its memory, and a stopped Vina-GPU keeps its OpenCL context and
+  VRAM, so processes attached with release_on_pause=True are killed by pause() instead;
+  detach() tells the caller, which runs the unfinished work again after resume();
+- cancel(kill_running=True) sends SIGKILL instead of waiting for them to finish.
+
+The worker processes of a ProcessPoolExecutor (Vina Python engine, ligand conversion,
+rescoring) are tracked when the pool comes from process_pool(), whose initializer reports
+each worker's pid, and attach_pool(): they are stopped and continued with the run, but
+never killed, since the pool owns them.
+
+Kept free of PyQt so it can be used by the headless command line and tested on its own.
+"""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+
+def signal_process_group(process: subprocess.Popen, signum: int) -> None:
+    """Send `signum` to the session of a process started with start_new_session=True."""
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _report_worker_pid(pids: Any, initializer: Optional[Callable[..., None]], initargs: tuple) -> None:
+    """Pool initializer of process_pool(): hand this worker's pid to the parent, then run the caller's."""
+    pids.put(os.getpid())
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class RunCancelled(Exception):
+    """Raised by workers that stop in the middle of a loop because the run was cancelled."""
+
+
+class RunControl:
+    """Thread-safe cancel / pause flags plus the external processes currently running."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._kill_running = False
+        self._processes: set[subprocess.Popen] = set()
+        self._release_on_pause: set[subprocess.Popen] = set()
+        self._released: set[subprocess.Popen] = set()
+        # Pid queue of each process_pool() and worker pids of each attached pool, by id(executor).
+        self._pool_queues: dict[int, Any] = {}
+        self._pools: dict[int, set[int]] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def killed(self) -> bool:
+        """True when the run was cancelled with kill_running: failures after that are not real."""
+        return self._cancelled.is_set() and self._kill_running
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set() and not self._cancelled.is_set()
+
+    def cancel(self, kill_running: bool = False) -> None:
+        with self._lock:
+            self._kill_running = self._kill_running or kill_running
+            self._cancelled.set()
+            processes = list(self._processes)
+            workers = self._pool_pids()
+        for process in processes:
+            # A stopped process would otherwise sit in the background until killed by hand.
+            signal_process_group(process, signal.SIGKILL if kill_running else signal.SIGCONT)
+        _signal_workers(workers, signal.SIGCONT)
+        self._running.set()
+
+    def pause(self) -> None:
+        with self._lock:
+            if self._cancelled.is_set() or not self._running.is_set():
+                return
+            self._running.clear()
+            processes = list(self._processes)
+            released = [process for process in processes if process in self._release_on_pause]
+            self._released.update(released)
+            workers = self._pool_pids()
+        for process in processes:
+            signal_process_group(process, signal.SIGKILL if process in released else signal.SIGSTOP)
+        _signal_workers(workers, signal.SIGSTOP)
+
+    def resume(self) -> None:
+        with self._lock:
+            if self._running.is_set():
+                return
+            self._running.set()
+            processes = [process for process in self._processes if process not in self._released]
+            workers = self._pool_pids()
+        for process in processes:
+            signal_process_group(process, signal.SIGCONT)
+        _signal_workers(workers, signal.SIGCONT)
+
+    def checkpoint(self) -> bool:
+        """Block while paused; False once the run is cancelled (stop scheduling work)."""
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """checkpoint() for loops that cannot simply stop: raise RunCancelled instead."""
+        if not self.checkpoint():
+            raise RunCancelled("Cancelled by the user.")
+
+    def attach(self, process: subprocess.Popen, release_on_pause: bool = False) -> None:
+        """Track a process started with start_new_session=True until detach(). With
+        release_on_pause, pause() kills it so it frees its device (see detach())."""
+        with self._lock:
+            self._processes.add(process)
+            if release_on_pause:
+                self._release_on_pause.add(process)
+            kill = self.killed
+            stop = not self._running.is_set()
+            if stop and release_on_pause and not kill:
+                self._released.add(process)
+        # The state may have changed between Popen() and attach(); catch the process up.
+        if kill or (stop and release_on_pause):
+            signal_process_group(process, signal.SIGKILL)
+        elif stop:
+            signal_process_group(process, signal.SIGSTOP)
+
+    def detach(self, process: subprocess.Popen) -> bool:
+        """Stop tracking a process. True when pause() killed it to release its device: its
+        work is unfinished rather than failed and should run again once the run resumes."""
+        with self._lock:
+            self._processes.discard(process)
+            self._release_on_pause.discard(process)
+            released = process in self._released
+            self._released.discard(process)
+        return released
+
+    def process_pool(
+        self, max_workers: int, mp_context: Any, initializer: Optional[Callable[..., None]] = None, initargs: tuple = ()
+    ) -> ProcessPoolExecutor:
+        """A ProcessPoolExecutor whose workers report their pid, so attach_pool() can track them."""
+        pids = mp_context.SimpleQueue()
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context, initializer=_report_worker_pid, initargs=(pids, initializer, initargs)
+        )
+        with self._lock:
+            self._pool_queues[id(executor)] = pids
+        return executor
+
+    def attach_pool(self, executor: Any) -> None:
+        """Track the workers of a process_pool() that have started so far, so they are stopped
+        while the run is paused. Workers start on submit(): call it after submitting."""
+        with self._lock:
+            if id(executor) not in self._pool_queues:
+                return
+            known = self._pools.setdefault(id(executor), set())
+            new = self._reported_pids(id(executor)) - known
+            known |= new
+            stop = not self._running.is_set()
+        if stop and new:
+            _signal_workers(new, signal.SIGSTOP)
+
+    def detach_pool(self, executor: Any) -> None:
+        """Stop tracking a pool once it is shut down or broken."""
+        with self._lock:
+            self._pools.pop(id(executor), None)
+            pids = self._pool_queues.pop(id(executor), None)
+        if pids is not None:
+            pids.close()
+
+    def _reported_pids(self, key: int) -> set[int]:
+        pids = self._pool_queues[key]
+        reported: set[int] = set()
+        while not pids.empty():
+            reported.add(pids.get())
+        return reported
+
+    def _pool_pids(self) -> list[int]:
+        # Workers that started since the last attach_pool() are picked up here as well.
+        for key in self._pool_queues:
+            self._pools.setdefault(key, set()).update(self._reported_pids(key))
+        return [pid for pids in self._pools.values() for pid in pids]
+
+
+def _signal_workers(pids: Iterable[int], signum: int) -> None:
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Static sharding of a docking job for clusters without network services (Step 4).
+
+The pending (target, ligand databank, ligand) pairs of a job are split into N shards by
+a hash of the pair key, so every array task computes the same split on its own with no
+coordination. Shard i of N docks into
+
+    JOBS/<job>/SHARDS/shard_<i>_of_<N>/<target>/<ligand databank>/<ligand>/<ligand>.pdbqt
+
+with its own <job>.csv and job ledger, so shards never share a file (SQLite locking on
+network filesystems is unreliable). merge_shards() then moves every finished ligand folder
+into JOBS/<job>/DOCKING, appends the matching CSV rows to DOCKING/<job>.csv and records
+the pairs in the DOCKING ledger, giving the layout _rebuild_result_csv and the report read.
+Merging is idempotent: rows and ledger entries are written before the folders move, ligand
+folders already present in DOCKING are left alone and rows are not appended twice, so a
+merge that was interrupted is completed by running it again.
+
+    python3 -m MODULES.module_sharding merge JOBS/<job>
+
+Kept free of PyQt so the merge can run on a login node.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Optional
+
+from MODULES.module_job_ledger import STATE_DONE, STATE_FAILED, JobLedger, ledger_path
+
+SHARDS_DIRNAME = "SHARDS"
+
+PairKey = tuple[str, str, str]
+
+
+def shard_of(key: PairKey, shard_count: int) -> int:
+    """Shard index (0-based) of a pair; stable across processes, machines and Python runs."""
+    digest = hashlib.sha1("\0".join(key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % max(1, shard_count)
+
+
+def shard_result_dir(job_dir: str, shard_index: int, shard_count: int) -> str:
+    return os.path.join(job_dir, SHARDS_DIRNAME, f"shard_{shard_index + 1:03d}_of_{shard_count:03d}")
+
+
+def parse_shard_spec(spec: str) -> tuple[int, int]:
+    """Parse "i/N" (1-based, as array task ids usually are) into (0-based index, count)."""
+    try:
+        index_text, count_text = spec.split("/", 1)
+        index, count = int(index_text), int(count_text)
+    except ValueError as exc:
+        raise ValueError(f"Invalid shard '{spec}': use i/N, for example 3/16.") from exc
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}': i must be between 1 and N.")
+    return index - 1, count
+
+
+def _read_rows(csv_path: Path) -> tuple[list[str], list[list[str]]]:
+    if not csv_path.is_file():
+        return [], []
+    with open(csv_path, "r", encoding="utf-8", newline="") as handle:
+        rows = list(csv.reader(handle))
+    return (rows[0], rows[1:]) if rows else ([], [])
+
+
+def merge_shards(job_dir: str, job_name: Optional[str] = None) -> dict[str, int]:
+    """Merge every shard of a job into its DOCKING folder. Returns counts of the merge."""
+    job_name = job_name or os.path.basename(os.path.normpath(job_dir))
+    docking_dir = os.path.join(job_dir, "DOCKING")
+    shards = sorted(path for path in Path(job_dir, SHARDS_DIRNAME).glob("shard_*") if path.is_dir())
+    if not shards:
+        raise RuntimeError(f"No shards found in {os.path.join(job_dir, SHARDS_DIRNAME)}.")
+    os.makedirs(docking_dir, exist_ok=True)
+    summary = {"shards": len(shards), "merged": 0, "already_present": 0, "failed": 0}
+    merged_csv = Path(docking_dir, f"{job_name}.csv")
+    # Result rows are (LIGAND, SMILES, LIGAND DATABANK, TARGET, energy, RMSD).
+    merged_rows = {(row[3], row[2], row[0]) for row in _read_rows(merged_csv)[1] if len(row) >= 4}
+    with JobLedger(ledger_path(docking_dir)) as ledger:
+        recorded = ledger.pairs_in_state(STATE_DONE)
+        for shard in shards:
+            header, rows = _read_rows(shard / f"{job_name}.csv")
+            shard_ledger = ledger_path(str(shard))
+            energies: dict[PairKey, Optional[float]] = {}
+            if os.path.isfile(shard_ledger):
+                with JobLedger(shard_ledger) as source:
+                    energies = dict(source.done_energies())
+            # Finished pairs of the shard: those with a pose folder still in the shard, plus those
+            # its ledger lists as done, whose folder an interrupted merge may already have moved.
+            finished = {
+                (target_dir.name, group_dir.name, ligand_dir.name)
+                for target_dir in shard.glob("*/")
+                if target_dir.is_dir()
+                for group_dir in target_dir.glob("*/")
+                if group_dir.is_dir()
+                for ligand_dir in group_dir.glob("*/")
+                if (ligand_dir / f"{ligand_dir.name}.pdbqt").is_file()
+            }
+            finished |= set(energies)
+            shard_rows = {(row[3], row[2], row[0]): row for row in rows if len(row) >= 4}
+            to_move: list[PairKey] = []
+            to_record: list[PairKey] = []
+            for key in sorted(finished):
+                in_shard = Path(shard, *key, f"{key[2]}.pdbqt").is_file()
+                in_docking = Path(docking_dir, *key, f"{key[2]}.pdbqt").is_file()
+                if not in_shard and not in_docking:
+                    continue
+                move = in_shard and not in_docking
+                record = key not in recorded or (key in shard_rows and key not in merged_rows)
+                if move:
+                    to_move.append(key)
+                if record:
+                    to_record.append(key)
+                if not move and not record:
+                    summary["already_present"] += 1
+            new_rows = [shard_rows[key] for key in to_record if key in shard_rows and key not in merged_rows]
+            if new_rows:
+                write_header = not merged_csv.is_file()
+                with open(merged_csv, "a", encoding="utf-8", newline="") as handle:
+                    writer = csv.writer(handle)
+                    if write_header and header:
+                        writer.writerow(header)
+                    writer.writerows(new_rows)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                merged_rows.update((row[3], row[2], row[0]) for row in new_rows)
+            ledger.mark_done_many((key, energies.get(key)) for key in to_record if key not in recorded)
+            recorded.update(to_record)
+            for key in to_move:
+                destination = Path(docking_dir, *key)
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                if destination.exists():
+                    shutil.rmtree(destination)
+                shutil.move(str(Path(shard, *key)), str(destination))
+            summary["merged"] += len(set(to_move) | set(to_record))
+            if os.path.isfile(shard_ledger):
+                with JobLedger(shard_ledger) as source:
+                    known = ledger.pairs_in_state(STATE_DONE) | ledger.pairs_in_state(STATE_FAILED)
+                    for key, error in source.errors_in_state(STATE_FAILED):
+                        if key not in known:
+                            ledger.mark_failed(key, error)
+                            summary["failed"] += 1
+    return summary
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="codoc-shards", description="Merge the shards of a CODOC docking job.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge = subparsers.add_parser("merge", help="Merge JOBS/<job>/SHARDS into JOBS/<job>/DOCKING.")
+    merge.add_argument("job_dir", help="Job folder, e.g. JOBS/2024-05-26_10-00_VINA_RIGID_CPU.")
+    args = parser.parse_args(argv)
+    try:
+        summary = merge_shards(args.job_dir)
+    except (OSError, RuntimeError) as exc:
+        print(f"[codoc-shards] {exc}", file=sys.stderr)
+        return 1
+    print(
+        f"[codoc-shards] {summary['shards']} shard(s): {summary['merged']} pair(s) merged, "
+        f"{summary['already_present']} already in DOCKING, {summary['failed']} failed pair(s) recorded."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Make the MODULES package importable when pytest runs from any folder."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
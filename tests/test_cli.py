@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+
+@pytest.fixture
+def codoc(monkeypatch):
+    monkeypatch.setenv("CODOC_VENV_ACTIVE", "1")
+    return pytest.importorskip("CODOC")
+
+
+def test_settings_with_unknown_keys_load(codoc, tmp_path):
+    settings_file = tmp_path / "settings.json"
+    settings_file.write_text(json.dumps({"docking": {"exhaustiveness": 16, "removed_option": 1}, "ligand": {"stale": True}}))
+    context = codoc.load_cli_context(str(settings_file))
+    assert context.settings.exhaustiveness == 16
+    assert context.ligand_settings == codoc.LigandSettings()
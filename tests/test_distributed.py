@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Coordinator and codoc-worker processes talking over localhost, with a stub Vina."""
+
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from MODULES import module_distributed
+from MODULES.module_distributed import Coordinator
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "s3cret"
+
+STUB_VINA = """#!{python}
+import os, sys, time
+config = dict(line.split(" = ", 1) for line in open(sys.argv[2]).read().splitlines() if " = " in line)
+time.sleep(float(os.environ.get("STUB_VINA_SLEEP", "0")))
+ligand = open(config["ligand"]).read()
+with open(config["out"], "w") as handle:
+    handle.write("MODEL 1\\nREMARK VINA RESULT:    -7.5      0.000      0.000\\n" + ligand + "ENDMDL\\n")
+"""
+
+
+@pytest.fixture
+def stub_vina(tmp_path):
+    path = tmp_path / "vina"
+    path.write_text(STUB_VINA.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    receptors = {}
+    for target in ("T1", "T2"):
+        receptors[target] = tmp_path / f"{target}.pdbqt"
+        receptors[target].write_text(f"REMARK receptor {target}\n")
+    result = []
+    for target in ("T1", "T2"):
+        for index in range(6):
+            ligand = tmp_path / f"lig{index}.pdbqt"
+            ligand.write_text(f"ATOM      1  C   LIG A   1       {index}.000   0.000   0.000  0.00  0.00     0.000 C\nTORSDOF 0\n")
+            result.append(
+                {
+                    "target_name": target,
+                    "ligand_group": "DB",
+                    "ligand_name": f"lig{index}",
+                    "ligand_file": str(ligand),
+                    "receptor": str(receptors[target]),
+                    "flex_receptor": "",
+                    "center_x": "0", "center_y": "0", "center_z": "0",
+                    "size_x": "20", "size_y": "20", "size_z": "20",
+                }
+            )
+    return result
+
+
+PARAMS = {
+    "scoring": "vina", "docking_mode": "normal", "exhaustiveness": 8, "poses": 9, "min_rmsd": 1.0,
+    "energy_range": 3.0, "seed": 1, "spacing": 0.375, "pair_timeout": 0, "pair_timeout_per_torsion": 0, "flexible": False,
+}
+
+
+@pytest.fixture
+def start_worker(tmp_path, stub_vina):
+    workers = []
+
+    def start(coordinator, name, sleep=0.0):
+        env = dict(os.environ, STUB_VINA_SLEEP=str(sleep))
+        command = [
+            sys.executable, "-m", "MODULES.module_distributed", "--host", "127.0.0.1", "--port", str(coordinator.port),
+            "--token", TOKEN, "--vina", stub_vina, "--cpu", "1", "--name", name, "--cache-dir", str(tmp_path / f"cache_{name}"),
+        ]
+        process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        workers.append(process)
+        return process
+
+    yield start
+    for process in workers:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def _collect(coordinator, until, timeout=60.0):
+    """Events of the coordinator until `until(events)` holds."""
+    events = []
+    deadline = time.monotonic() + timeout
+    while not until(events):
+        assert time.monotonic() < deadline, f"timed out; events so far: {[event[0] for event in events]}"
+        event = coordinator.next_event(timeout=0.1)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+def _done_keys(events):
+    return [module_distributed._pair_key(event[1]) for event in events if event[0] == "done"]
+
+
+def _first_lease(events):
+    return next((event for event in events if event[0] == "lease"), None)
+
+
+def test_workers_dock_every_pair_once(jobs, start_worker):
+    with Coordinator(jobs, PARAMS, batch_size=2, port=0, token=TOKEN) as coordinator:
+        for index in range(3):
+            start_worker(coordinator, f"w{index}")
+        events = _collect(coordinator, lambda _events: coordinator.finished())
+    done = _done_keys(events)
+    assert sorted(done) == sorted(module_distributed._pair_key(job) for job in jobs)
+    assert all(b"REMARK VINA RESULT" in event[2] for event in events if event[0] == "done")
+    assert not [event for event in events if event[0] == "failed"]
+
+
+def test_pairs_of_a_killed_worker_are_reassigned(jobs, start_worker):
+    with Coordinator(jobs, PARAMS, batch_size=3, port=0, token=TOKEN, max_attempts=2) as coordinator:
+        stuck = start_worker(coordinator, "stuck", sleep=120)
+        events = _collect(coordinator, _first_lease)
+        leased = {module_distributed._pair_key(job) for job in _first_lease(events)[1]}
+        os.killpg(stuck.pid, signal.SIGKILL)
+        stuck.wait()
+        start_worker(coordinator, "healthy")
+        events += _collect(coordinator, lambda _events: coordinator.finished())
+    done = {module_distributed._pair_key(event[1]): event[3] for event in events if event[0] == "done"}
+    assert len(done) == len(jobs)
+    assert all(done[key].startswith("healthy@") for key in leased)
+
+
+def test_lease_expires_without_heartbeats(jobs, start_worker):
+    with Coordinator(jobs, PARAMS, batch_size=3, port=0, token=TOKEN, lease_timeout=2.0, max_attempts=2) as coordinator:
+        frozen = start_worker(coordinator, "frozen", sleep=120)
+        events = _collect(coordinator, _first_lease)
+        leased = {module_distributed._pair_key(job) for job in _first_lease(events)[1]}
+        # The connection stays open, but a stopped worker sends no heartbeats.
+        os.killpg(frozen.pid, signal.SIGSTOP)
+        start_worker(coordinator, "healthy")
+        events += _collect(coordinator, lambda _events: coordinator.finished())
+    done = {module_distributed._pair_key(event[1]): event[3] for event in events if event[0] == "done"}
+    assert len(done) == len(jobs)
+    assert all(done[key].startswith("healthy@") for key in leased)
+
+
+def test_pair_failing_on_every_attempt_is_reported_once(jobs, start_worker):
+    with Coordinator(jobs[:1], PARAMS, batch_size=1, port=0, token=TOKEN, lease_timeout=2.0, max_attempts=2) as coordinator:
+        for name in ("a", "b"):
+            worker = start_worker(coordinator, name, sleep=120)
+            _collect(coordinator, _first_lease)
+            os.killpg(worker.pid, signal.SIGKILL)
+            worker.wait()
+        events = _collect(coordinator, lambda _events: coordinator.finished())
+    assert [event[0] for event in events] == ["failed"]
+
+
+# --- protocol checks with a hand-written client ---------------------------------------------
+
+
+class _Client:
+    def __init__(self, port, token=TOKEN):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.stream = self.sock.makefile("rwb")
+        self.lock = threading.Lock()
+        self.send({"type": "hello", "version": module_distributed.PROTOCOL_VERSION, "worker": "client", "token": token})
+
+    def send(self, message):
+        module_distributed._send(self.stream, self.lock, message)
+
+    def request(self):
+        self.send({"type": "request"})
+        return module_distributed._read(self.stream)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def _pose_result(key):
+    return {"key": list(key), "pose": module_distributed._encode(b"REMARK VINA RESULT:    -99.0\n")}
+
+
+def test_wrong_token_is_rejected(jobs):
+    with Coordinator(jobs, PARAMS, port=0, token=TOKEN) as coordinator:
+        client = _Client(coordinator.port, token="guess")
+        try:
+            reply = module_distributed._read(client.stream)
+        finally:
+            client.close()
+    assert reply["type"] == "error"
+
+
+def test_results_outside_the_senders_lease_are_dropped(jobs):
+    keys = [module_distributed._pair_key(job) for job in jobs[:2]]
+    with Coordinator(jobs[:2], PARAMS, batch_size=1, port=0, token=TOKEN) as coordinator:
+        owner, rogue = _Client(coordinator.port), _Client(coordinator.port)
+        try:
+            batch = owner.request()
+            assert [tuple(ligand["key"]) for ligand in batch["ligands"]] == [keys[0]]
+            rogue.send({"type": "result", "lease": 999, "results": [_pose_result(keys[0])]})
+            rogue.send({"type": "result", "lease": batch["lease"], "results": [_pose_result(keys[0])]})
+            owner.send({"type": "result", "lease": batch["lease"], "results": [_pose_result(keys[1]), _pose_result(keys[0])]})
+            events = _collect(coordinator, lambda events: any(event[0] == "done" for event in events), timeout=10)
+            time.sleep(0.3)
+            while (event := coordinator.next_event(timeout=0.1)) is not None:
+                events.append(event)
+        finally:
+            owner.close()
+            rogue.close()
+    assert _done_keys(events) == [keys[0]]
+    assert not coordinator.finished()
+
+
+def test_coordinator_without_token_only_listens_on_loopback(jobs):
+    with Coordinator(jobs, PARAMS, port=0) as coordinator:
+        assert coordinator._server.server_address[0] == "127.0.0.1"
+    with pytest.raises(ValueError):
+        Coordinator(jobs, PARAMS, host="0.0.0.0", port=0)
+
+
+def test_worker_refuses_unsafe_names(tmp_path):
+    with pytest.raises(ValueError):
+        module_distributed._safe_name("../../etc/cron.d/x")
+    with pytest.raises(ValueError):
+        module_distributed._safe_name("..")
+    assert module_distributed._safe_name("ZINC000001_a-b.c") == "ZINC000001_a-b.c"
+    with pytest.raises(RuntimeError):
+        module_distributed._cached_file(str(tmp_path), {"sha": "../x", "name": "r.pdbqt"})
+    data = module_distributed._encode(b"receptor")
+    with pytest.raises(RuntimeError):
+        module_distributed._cached_file(str(tmp_path), {"sha": "0" * 64, "name": "r.pdbqt", "data": data})
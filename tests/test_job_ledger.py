@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from MODULES.module_job_ledger import (
+    STATE_DONE,
+    STATE_FAILED,
+    STATE_PENDING,
+    STATE_RUNNING,
+    STATE_SKIPPED,
+    JobLedger,
+    ledger_path,
+    read_pairs_in_state,
+    read_progress,
+)
+
+A = ("T1", "DB", "lig1")
+B = ("T1", "DB", "lig2")
+C = ("T2", "DB", "lig1")
+
+
+def test_register_keeps_existing_state(tmp_path):
+    with JobLedger(ledger_path(str(tmp_path))) as ledger:
+        assert ledger.is_empty()
+        ledger.register([A, B])
+        ledger.mark_done(A, "-7.5")
+        ledger.register([A, B, C])
+        assert ledger.pairs_in_state(STATE_DONE) == {A}
+        assert ledger.pairs_in_state(STATE_PENDING) == {B, C}
+
+
+def test_state_transitions_and_counts(tmp_path):
+    with JobLedger(ledger_path(str(tmp_path))) as ledger:
+        ledger.register([A, B, C])
+        ledger.mark_running([A, B])
+        assert ledger.pairs_in_state(STATE_RUNNING) == {A, B}
+        ledger.mark_done_many([(A, "-8.1"), (B, "")])
+        ledger.mark_failed(C, "Vina exited with code 1.")
+        assert dict(ledger.done_energies()) == {A: -8.1, B: None}
+        assert ledger.errors_in_state(STATE_FAILED) == [(C, "Vina exited with code 1.")]
+        ledger.mark_skipped_many([C], "cascade")
+        assert ledger.counts() == {STATE_PENDING: 0, STATE_RUNNING: 0, STATE_DONE: 2, STATE_FAILED: 0, STATE_SKIPPED: 1}
+
+
+def test_reset_running_returns_interrupted_pairs(tmp_path):
+    with JobLedger(ledger_path(str(tmp_path))) as ledger:
+        ledger.mark_running([A, B])
+        ledger.mark_done(A, -6.0)
+        assert ledger.reset_running() == 1
+        assert ledger.pairs_in_state(STATE_PENDING) == {B}
+
+
+def test_read_only_helpers(tmp_path):
+    assert read_pairs_in_state(str(tmp_path), STATE_DONE) == set()
+    assert read_progress(str(tmp_path)) == {}
+    with JobLedger(ledger_path(str(tmp_path))) as ledger:
+        ledger.register([A, B])
+        ledger.mark_done(A, -6.0)
+        # Readable while the writer still holds the database open.
+        assert read_pairs_in_state(str(tmp_path), STATE_DONE) == {A}
+        assert read_progress(str(tmp_path)) == {STATE_DONE: 1, STATE_PENDING: 1}
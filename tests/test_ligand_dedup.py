@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from MODULES.module_ligand_dedup import (
+    duplicate_sets,
+    file_signature,
+    inchikey_index_path,
+    is_inchikey_index,
+    read_inchikey_index,
+    write_inchikey_index,
+)
+
+KEY = "BSYNRYMUTXBXSQ-UHFFFAOYSA-N"
+
+
+def test_index_roundtrip(tmp_path):
+    ligand = tmp_path / "aspirin.pdbqt"
+    ligand.write_text("ATOM\n")
+    assert read_inchikey_index(str(tmp_path)) == {}
+    entries = {("ZINC", "aspirin"): (KEY, file_signature(str(ligand)))}
+    assert write_inchikey_index(str(tmp_path), entries) == inchikey_index_path(str(tmp_path))
+    assert read_inchikey_index(str(tmp_path)) == entries
+
+
+def test_rows_without_key_or_signature_are_ignored(tmp_path):
+    (tmp_path / "ligand_inchikeys.csv").write_text(
+        "LIGAND DATABANK,LIGAND,INCHIKEY,SIZE,MTIME_NS\nZINC,a,,1,2\nZINC,b,KEY-B,x,2\nZINC,c,KEY-C,3,4\n"
+    )
+    assert read_inchikey_index(str(tmp_path)) == {("ZINC", "c"): ("KEY-C", (3, 4))}
+
+
+def test_duplicate_sets():
+    entries = [(("ZINC", "aspirin"), KEY), (("CHEMBL", "CHEMBL25"), KEY), (("ZINC", "other"), "OTHER-KEY")]
+    assert duplicate_sets(entries) == {KEY: [("CHEMBL", "CHEMBL25"), ("ZINC", "aspirin")]}
+
+
+def test_index_is_recognized():
+    assert is_inchikey_index(inchikey_index_path("/data/LIGANDS"))
+    assert is_inchikey_index("/data/LIGANDS/ligand_inchikeys.csv.tmp")
+    assert not is_inchikey_index("/data/LIGANDS/library.csv")
+
+
+def test_split_keeps_the_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODOC_VENV_ACTIVE", "1")
+    codoc = pytest.importorskip("CODOC")
+    ligands_dir = tmp_path / "LIGANDS"
+    ligands_dir.mkdir()
+    write_inchikey_index(str(ligands_dir), {("ZINC", "aspirin"): (KEY, (5, 1))})
+    (ligands_dir / "notes.txt").write_text("not a ligand\n")
+    worker = codoc.LigandToolsWorker(str(tmp_path), str(ligands_dir), str(tmp_path / "CONVERSION"), codoc.LigandSettings(), "split_multimodel")
+    worker._split_multimodel_files()
+    assert read_inchikey_index(str(ligands_dir)) == {("ZINC", "aspirin"): (KEY, (5, 1))}
+    assert (tmp_path / "CONVERSION" / "NOT_RECOGNIZED_LIGANDS" / "notes.txt").is_file()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import csv
+
+import pytest
+
+from MODULES.module_rescore import (
+    first_pose,
+    is_score_column,
+    merge_scores,
+    parse_scoring_functions,
+    read_score_columns,
+    score_column,
+    write_rescored_csv,
+)
+
+POSES = (
+    "MODEL 1\nREMARK VINA RESULT:    -7.5      0.000      0.000\nROOT\nATOM      1  C   LIG A   1\nENDROOT\n"
+    "BEGIN_RES ARG A 10\nATOM      2  N   ARG A  10\nEND_RES ARG A 10\nENDMDL\n"
+    "MODEL 2\nATOM      1  C   LIG A   1\nENDMDL\n"
+)
+
+
+def test_parse_scoring_functions():
+    assert parse_scoring_functions(" Vina; vinardo,vina ") == ["vina", "vinardo"]
+    with pytest.raises(ValueError):
+        parse_scoring_functions("vina, dock6")
+    with pytest.raises(ValueError):
+        parse_scoring_functions(" , ")
+
+
+def test_score_columns():
+    assert score_column("vinardo") == "VINARDO SCORE (Kcal/mol)"
+    assert is_score_column("AD4 SCORE (Kcal/mol)")
+    assert not is_score_column("BINDING ENERGY (Kcal/mol)")
+
+
+def test_first_pose_drops_other_models_residues_and_score():
+    pose = first_pose(POSES)
+    assert pose == "ROOT\nATOM      1  C   LIG A   1\nENDROOT\n"
+    assert first_pose("MODEL 1\nREMARK only\nENDMDL\n") == ""
+
+
+def _write_run_csv(path, extra=""):
+    header = "LIGAND,SMILES,LIGAND DATABANK,TARGET,BINDING ENERGY (Kcal/mol),RMSD (mean)" + extra
+    path.write_text(header + "\nlig1,C,DB,T1,-7.5,0.5" + (",-1.0" if extra else "") + "\nlig2,CC,DB,T1,-6.0,0.4" + (",-2.0" if extra else "") + "\n")
+
+
+def test_merge_scores_adds_and_replaces_columns(tmp_path):
+    run_csv = tmp_path / "job.csv"
+    _write_run_csv(run_csv, extra=",VINA SCORE (Kcal/mol)")
+    updated = merge_scores(str(run_csv), {("T1", "DB", "lig1"): {"vina": "-7.4", "vinardo": "-8.0"}}, ["vina", "vinardo"])
+    assert updated == 1
+    with open(run_csv, newline="") as handle:
+        rows = list(csv.DictReader(handle))
+    assert rows[0]["VINA SCORE (Kcal/mol)"] == "-7.4" and rows[0]["VINARDO SCORE (Kcal/mol)"] == "-8.0"
+    assert rows[1]["VINA SCORE (Kcal/mol)"] == "-2.0" and rows[1]["VINARDO SCORE (Kcal/mol)"] == ""
+    columns, values = read_score_columns(str(run_csv))
+    assert columns == ["VINA SCORE (Kcal/mol)", "VINARDO SCORE (Kcal/mol)"]
+    assert values[("T1", "DB", "lig2")]["VINA SCORE (Kcal/mol)"] == "-2.0"
+
+
+def test_read_score_columns_without_scores(tmp_path):
+    run_csv = tmp_path / "job.csv"
+    _write_run_csv(run_csv)
+    assert read_score_columns(str(run_csv)) == ([], {})
+    assert read_score_columns(str(tmp_path / "missing.csv")) == ([], {})
+
+
+def test_write_rescored_csv(tmp_path):
+    key = ("T1", "sub", "lig1")
+    path = write_rescored_csv(str(tmp_path), {key: {"vina": "-7.0"}}, {key: "sub/lig1.pdbqt"}, ["vina"])
+    with open(path, newline="") as handle:
+        rows = list(csv.reader(handle))
+    assert rows == [
+        ["LIGAND", "LIGAND DATABANK", "TARGET", "POSE FILE", "VINA SCORE (Kcal/mol)"],
+        ["lig1", "sub", "T1", "sub/lig1.pdbqt", "-7.0"],
+    ]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from MODULES.module_result_cache import CACHE_SEED, ResultCache, file_sha256, link_or_copy, result_key, run_seed
+
+
+def test_result_key_is_order_independent():
+    assert result_key({"a": 1, "b": "x"}) == result_key({"b": "x", "a": 1})
+    assert result_key({"a": 1, "seed": 1}) != result_key({"a": 1, "seed": 2})
+
+
+def test_store_fetch_roundtrip(tmp_path):
+    pose = tmp_path / "job" / "lig.pdbqt"
+    pose.parent.mkdir()
+    pose.write_text("REMARK VINA RESULT:    -7.5\n")
+    cache = ResultCache(str(tmp_path / "CACHE"))
+    key = result_key({"ligand": file_sha256(str(pose))})
+    assert cache.lookup(key) is None
+    assert cache.store(key, str(pose), "-7.5", "0.8")
+    assert not cache.store(key, str(pose), "-9.9", "0.0")  # the first result keeps the key
+    destination = tmp_path / "other" / "lig.pdbqt"
+    entry = cache.fetch(key, str(destination))
+    assert entry["energy"] == "-7.5" and entry["rmsd"] == "0.8"
+    assert destination.read_text() == pose.read_text()
+    assert not [name for name in os.listdir(os.path.dirname(cache.entry_dir(key))) if name.startswith(".")]
+
+
+def test_fetch_miss_and_broken_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "CACHE"))
+    key = result_key({"x": 1})
+    assert cache.fetch(key, str(tmp_path / "out.pdbqt")) is None
+    os.makedirs(cache.entry_dir(key))
+    (tmp_path / "CACHE" / key[:2] / key / "entry.json").write_text("{not json")
+    assert cache.lookup(key) is None
+
+
+def test_link_or_copy_replaces_destination(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("new")
+    destination = tmp_path / "sub" / "b.txt"
+    destination.parent.mkdir()
+    destination.write_text("old")
+    link_or_copy(str(source), str(destination))
+    assert destination.read_text() == "new"
+
+
+def test_run_seed():
+    assert run_seed(0, True) == CACHE_SEED
+    assert run_seed(0, False) == 0
+    assert run_seed(7, True) == run_seed(7, False) == 7
+
+
+def test_default_settings_use_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODOC_VENV_ACTIVE", "1")
+    codoc = pytest.importorskip("CODOC")
+    settings = codoc.DockingSettings()
+    worker = codoc.DockingWorker(
+        app_dir=str(tmp_path),
+        ligands_dir=str(tmp_path / "LIGANDS"),
+        targets_dir=str(tmp_path / "TARGETS"),
+        results_dir=str(tmp_path / "JOB" / "DOCKING"),
+        job_name="JOB",
+        settings=settings,
+        docking_type=settings.docking_type,
+        processing_type=settings.processing_type,
+        run_type="NEW",
+    )
+    assert settings.result_cache and settings.seed == 0
+    assert worker.settings.seed == CACHE_SEED and worker.seed_fixed_for_cache
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from MODULES.module_run_control import RunCancelled, RunControl
+
+
+def _pid_state(pid):
+    """One-letter state of a process from /proc (R, S, T, Z, ...)."""
+    with open(f"/proc/{pid}/stat") as handle:
+        return handle.read().rsplit(")", 1)[1].split()[0]
+
+
+def _wait_pid_state(pid, states, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while _pid_state(pid) not in states:
+        assert time.monotonic() < deadline, f"process stayed in state {_pid_state(pid)}"
+        time.sleep(0.02)
+
+
+def _state(process):
+    return _pid_state(process.pid)
+
+
+def _wait_state(process, states, timeout=5.0):
+    _wait_pid_state(process.pid, states, timeout)
+
+
+@pytest.fixture
+def sleeper():
+    process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    yield process
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+
+
+def test_checkpoint_blocks_while_paused():
+    control = RunControl()
+    assert control.checkpoint()
+    control.pause()
+    assert control.paused
+    passed = threading.Event()
+    waiter = threading.Thread(target=lambda: control.checkpoint() and passed.set())
+    waiter.start()
+    assert not passed.wait(0.2)
+    control.resume()
+    waiter.join(2)
+    assert passed.is_set()
+
+
+def test_cancel_releases_a_paused_run():
+    control = RunControl()
+    control.pause()
+    control.cancel()
+    assert not control.checkpoint()
+    assert not control.paused and not control.killed
+    with pytest.raises(RunCancelled):
+        control.raise_if_cancelled()
+
+
+def test_pause_stops_and_resume_continues_attached_processes(sleeper):
+    control = RunControl()
+    control.attach(sleeper)
+    control.pause()
+    _wait_state(sleeper, {"T"})
+    control.resume()
+    _wait_state(sleeper, {"S", "R"})
+    control.detach(sleeper)
+    control.pause()
+    time.sleep(0.1)
+    assert _state(sleeper) != "T"
+
+
+def test_process_attached_while_paused_is_stopped(sleeper):
+    control = RunControl()
+    control.pause()
+    control.attach(sleeper)
+    _wait_state(sleeper, {"T"})
+    control.cancel()
+    _wait_state(sleeper, {"S", "R"})
+
+
+def test_cancel_with_kill_running(sleeper):
+    control = RunControl()
+    control.attach(sleeper)
+    control.pause()
+    control.cancel(kill_running=True)
+    assert control.killed
+    assert sleeper.wait(5) == -9
+
+
+def test_pause_kills_processes_attached_for_release(sleeper):
+    control = RunControl()
+    control.attach(sleeper, release_on_pause=True)
+    control.pause()
+    assert sleeper.wait(5) == -9
+    assert control.detach(sleeper)
+    control.resume()
+    assert control.checkpoint()
+
+
+def test_detach_reports_no_release_for_normal_processes(sleeper):
+    control = RunControl()
+    control.attach(sleeper, release_on_pause=True)
+    assert not control.detach(sleeper)
+    control.attach(sleeper)
+    control.pause()
+    _wait_state(sleeper, {"T"})
+    assert not control.detach(sleeper)
+    control.resume()
+
+
+def _pid(_):
+    return os.getpid()
+
+
+def test_pause_stops_pool_workers():
+    control = RunControl()
+    with control.process_pool(1, multiprocessing.get_context("fork")) as executor:
+        pid = executor.submit(_pid, None).result()
+        control.attach_pool(executor)
+        control.pause()
+        _wait_pid_state(pid, {"T"})
+        control.resume()
+        _wait_pid_state(pid, {"S", "R"})
+        assert executor.submit(_pid, None).result() == pid
+        control.detach_pool(executor)
+        control.pause()
+        time.sleep(0.1)
+        assert _pid_state(pid) != "T"
+        control.resume()
+
+
+def test_pools_not_from_process_pool_are_ignored():
+    control = RunControl()
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        pid = executor.submit(_pid, None).result()
+        control.attach_pool(executor)
+        control.pause()
+        time.sleep(0.1)
+        assert _pid_state(pid) != "T"
+        control.resume()
+        control.detach_pool(executor)
+
+
+def _init_marker(path):
+    with open(path, "w") as handle:
+        handle.write(str(os.getpid()))
+
+
+def test_process_pool_runs_the_callers_initializer(tmp_path):
+    control = RunControl()
+    marker = tmp_path / "marker"
+    with control.process_pool(1, multiprocessing.get_context("spawn"), _init_marker, (str(marker),)) as executor:
+        pid = executor.submit(_pid, None).result()
+        control.attach_pool(executor)
+        control.detach_pool(executor)
+    assert marker.read_text() == str(pid)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import csv
+from pathlib import Path
+
+import pytest
+
+from MODULES.module_job_ledger import STATE_DONE, STATE_FAILED, JobLedger, ledger_path
+from MODULES.module_sharding import merge_shards, parse_shard_spec, shard_of, shard_result_dir
+
+JOB = "JOB1"
+HEADER = ["LIGAND", "SMILES", "LIGAND DATABANK", "TARGET", "BINDING ENERGY (Kcal/mol)", "RMSD (mean)"]
+
+
+def test_shard_of_is_stable_and_covers_every_shard():
+    keys = [("T1", "DB", f"lig{index}") for index in range(200)]
+    assert [shard_of(key, 4) for key in keys] == [shard_of(key, 4) for key in keys]
+    assert {shard_of(key, 4) for key in keys} == {0, 1, 2, 3}
+    assert {shard_of(key, 1) for key in keys} == {0}
+
+
+def test_parse_shard_spec():
+    assert parse_shard_spec("3/16") == (2, 16)
+    for spec in ("0/4", "5/4", "x/4", "3"):
+        with pytest.raises(ValueError):
+            parse_shard_spec(spec)
+
+
+def _make_shard(job_dir, index, count, done, failed=()):
+    shard = Path(shard_result_dir(str(job_dir), index, count))
+    shard.mkdir(parents=True)
+    rows = []
+    with JobLedger(ledger_path(str(shard))) as ledger:
+        for target, group, ligand, energy in done:
+            pose_dir = shard / target / group / ligand
+            pose_dir.mkdir(parents=True)
+            (pose_dir / f"{ligand}.pdbqt").write_text(f"REMARK VINA RESULT: {energy}\n")
+            rows.append([ligand, "C", group, target, energy, "0.5"])
+            ledger.mark_done((target, group, ligand), energy)
+        for key in failed:
+            ledger.mark_failed(key, "boom")
+    with open(shard / f"{JOB}.csv", "w", newline="") as handle:
+        csv.writer(handle).writerows([HEADER] + rows)
+    return shard
+
+
+def _merged_rows(job_dir):
+    with open(job_dir / "DOCKING" / f"{JOB}.csv", newline="") as handle:
+        return list(csv.reader(handle))
+
+
+def test_merge_moves_poses_rows_and_ledger(tmp_path):
+    job_dir = tmp_path / JOB
+    _make_shard(job_dir, 0, 2, [("T1", "DB", "a", "-7.0")], failed=[("T1", "DB", "c")])
+    _make_shard(job_dir, 1, 2, [("T1", "DB", "b", "-6.0"), ("T2", "DB", "a", "-5.0")])
+    summary = merge_shards(str(job_dir))
+    assert summary == {"shards": 2, "merged": 3, "already_present": 0, "failed": 1}
+    assert (job_dir / "DOCKING" / "T2" / "DB" / "a" / "a.pdbqt").is_file()
+    rows = _merged_rows(job_dir)
+    assert rows[0] == HEADER and len(rows) == 4
+    with JobLedger(ledger_path(str(job_dir / "DOCKING"))) as ledger:
+        assert ledger.pairs_in_state(STATE_DONE) == {("T1", "DB", "a"), ("T1", "DB", "b"), ("T2", "DB", "a")}
+        assert ledger.pairs_in_state(STATE_FAILED) == {("T1", "DB", "c")}
+
+
+def test_merge_twice_appends_nothing(tmp_path):
+    job_dir = tmp_path / JOB
+    _make_shard(job_dir, 0, 1, [("T1", "DB", "a", "-7.0")])
+    merge_shards(str(job_dir))
+    summary = merge_shards(str(job_dir))
+    assert summary["merged"] == 0
+    assert len(_merged_rows(job_dir)) == 2
+
+
+def test_merge_without_shards(tmp_path):
+    with pytest.raises(RuntimeError):
+        merge_shards(str(tmp_path))
+
+
+def test_rerun_records_pairs_moved_by_an_interrupted_merge(tmp_path):
+    job_dir = tmp_path / JOB
+    shard = _make_shard(job_dir, 0, 1, [("T1", "DB", "a", "-7.0"), ("T1", "DB", "b", "-6.0")])
+    # An earlier merge moved the folder of "a" and crashed before writing its row and ledger entry.
+    destination = job_dir / "DOCKING" / "T1" / "DB" / "a"
+    destination.parent.mkdir(parents=True)
+    (shard / "T1" / "DB" / "a").rename(destination)
+    summary = merge_shards(str(job_dir))
+    assert summary["merged"] == 2
+    assert sorted(row[0] for row in _merged_rows(job_dir)[1:]) == ["a", "b"]
+    with JobLedger(ledger_path(str(job_dir / "DOCKING"))) as ledger:
+        assert dict(ledger.done_energies()) == {("T1", "DB", "a"): -7.0, ("T1", "DB", "b"): -6.0}
+
+
+def test_rerun_moves_pairs_recorded_by_an_interrupted_merge(tmp_path):
+    job_dir = tmp_path / JOB
+    _make_shard(job_dir, 0, 1, [("T1", "DB", "a", "-7.0")])
+    (job_dir / "DOCKING").mkdir()
+    with open(job_dir / "DOCKING" / f"{JOB}.csv", "w", newline="") as handle:
+        csv.writer(handle).writerows([HEADER, ["a", "C", "DB", "T1", "-7.0", "0.5"]])
+    with JobLedger(ledger_path(str(job_dir / "DOCKING"))) as ledger:
+        ledger.mark_done(("T1", "DB", "a"), "-7.0")
+    summary = merge_shards(str(job_dir))
+    assert summary["merged"] == 1
+    assert (job_dir / "DOCKING" / "T1" / "DB" / "a" / "a.pdbqt").is_file()
+    assert len(_merged_rows(job_dir)) == 2